@@ -1,4 +1,10 @@
 # -*- mode: python ; coding: utf-8 -*-
+import sys
+
+# Task modules are imported by name when a task runs (tasks.registry),
+# so PyInstaller cannot find them on its own
+sys.path.insert(0, SPECPATH)
+from tasks.registry import task_modules
 
 
 a = Analysis(
@@ -6,7 +12,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    hiddenimports=task_modules(),
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,476 @@
+"""
+asyncio backend: one event loop on a background thread runs every child
+process (and the task scheduler, see runner.run_tasks_async).
+
+The loop sleeps until a pipe has data, a child exits, a cancel event is
+set or a timer (watchdog, kill escalation, progress report) is due, so
+waiting on long tasks costs no CPU. Blocking callers (task threads, the
+CLI, the Tk GUI) hand coroutines over with submit() / run(); the GUI
+keeps its own main loop and is called back through `after`.
+
+    res = aio.run(aio.run_command_async, cmd, logger=..., ...)
+    fut = aio.submit(runner.run_tasks_async, ctx, tasks, on_progress)
+"""
+from __future__ import annotations
+import asyncio
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import contextvars
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from config import CANCEL_DRAIN_S, PROCESS_CAPTURE, PROCESS_OUTPUT_ENCODING
+from process import (
+    CANCEL_POLL_S, POPEN_GROUP_KW, LineConsumer, ProcResult, check_watchdog,
+    current_limits, report_watchdog,
+)
+from procio import (
+    AutoDecoder, Capture, ChildUsage, LineSplitter, Stopper, captured,
+    parse_percent,
+)
+
+_EOF = None
+_CANCEL = object()
+_EXITED = object()
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_loop_lock = threading.Lock()
+
+# Background tasks (detached children) must stay referenced until done
+_background: set[asyncio.Task] = set()
+
+
+# --------------------------------------------------
+# Loop
+# --------------------------------------------------
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The shared loop, started on first use on a daemon thread."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            # Proactor on Windows (pipes and subprocesses supported)
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def serve() -> None:
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            _loop_thread = threading.Thread(target=serve, name="aio-loop",
+                                            daemon=True)
+            _loop_thread.start()
+            ready.wait()
+            _loop = loop
+        return _loop
+
+
+def in_loop_thread() -> bool:
+    return _loop_thread is not None and threading.current_thread() is _loop_thread
+
+
+def submit(coro_fn: Callable[..., Awaitable], *args, **kw) -> Future:
+    """
+    Starts coro_fn(*args, **kw) on the shared loop and returns a
+    concurrent Future. The coroutine sees the caller's context variables
+    (current span, task limits, current task).
+    """
+    loop = get_loop()
+    ctx = contextvars.copy_context()
+    fut: Future = Future()
+
+    def start() -> None:
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            # A task copies the current context: run its creation in ctx
+            task = ctx.run(loop.create_task, coro_fn(*args, **kw))
+        except BaseException as e:
+            fut.set_exception(e)
+            return
+
+        def done(t: asyncio.Task) -> None:
+            if t.cancelled():
+                fut.cancel()
+            elif t.exception() is not None:
+                fut.set_exception(t.exception())
+            else:
+                fut.set_result(t.result())
+
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return fut
+
+
+def run(coro_fn: Callable[..., Awaitable], *args, **kw) -> Any:
+    """Blocking submit(): the synchronous API on top of the loop."""
+    if in_loop_thread():
+        raise RuntimeError("blocking aio.run() called on the event loop; "
+                           "await the coroutine instead")
+    fut = submit(coro_fn, *args, **kw)
+    if threading.current_thread() is not threading.main_thread():
+        return fut.result()
+    # The main thread wakes up now and then so that Ctrl+C handlers run
+    # (a plain blocking wait is not interruptible on Windows)
+    while True:
+        try:
+            return fut.result(timeout=0.5)
+        except FutureTimeout:
+            continue
+
+
+def spawn_background(coro: Awaitable) -> asyncio.Task:
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+# --------------------------------------------------
+# Cancel events
+# --------------------------------------------------
+
+class CancelEvent(threading.Event):
+    """
+    threading.Event that also notifies watchers when set, so coroutines
+    waiting for a cancel wake up at once instead of polling.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._callbacks: list[Callable[[], None]] = []
+        self._cb_lock = threading.Lock()
+
+    def set(self) -> None:
+        super().set()
+        with self._cb_lock:
+            callbacks = list(self._callbacks)
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                pass
+
+    def add_callback(self, cb: Callable[[], None]) -> None:
+        with self._cb_lock:
+            self._callbacks.append(cb)
+
+    def remove_callback(self, cb: Callable[[], None]) -> None:
+        with self._cb_lock:
+            try:
+                self._callbacks.remove(cb)
+            except ValueError:
+                pass
+
+
+class _Poller:
+    """
+    Fallback for plain threading.Events: one task per loop checks every
+    watched event each CANCEL_POLL_S, and only while something is watched.
+    """
+
+    def __init__(self) -> None:
+        self._watched: dict[int, tuple[threading.Event, Callable[[], None]]] = {}
+        self._ids = iter(range(1, 1 << 62))
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, event: threading.Event, cb: Callable[[], None]) -> int:
+        key = next(self._ids)
+        self._watched[key] = (event, cb)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return key
+
+    def remove(self, key: int) -> None:
+        self._watched.pop(key, None)
+
+    async def _run(self) -> None:
+        while self._watched:
+            await asyncio.sleep(CANCEL_POLL_S)
+            for key, (event, cb) in list(self._watched.items()):
+                if event.is_set():
+                    self._watched.pop(key, None)
+                    cb()
+
+
+_poller = _Poller()
+
+
+def watch(event, cb: Callable[[], None]) -> Callable[[], None]:
+    """
+    Calls cb on the loop once `event` is set (right away if it already
+    is). Returns a function that stops watching. Must run on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    if event.is_set():
+        loop.call_soon(cb)
+        return lambda: None
+    if isinstance(event, CancelEvent):
+        fired = False
+
+        def on_set() -> None:
+            nonlocal fired
+            if not fired:
+                fired = True
+                loop.call_soon_threadsafe(cb)
+
+        event.add_callback(on_set)
+        return lambda: event.remove_callback(on_set)
+    key = _poller.add(event, cb)
+    return lambda: _poller.remove(key)
+
+
+# --------------------------------------------------
+# Child processes
+# --------------------------------------------------
+
+class _Pipes(asyncio.SubprocessProtocol):
+    """
+    Decodes and splits both output pipes as data arrives (see
+    procio.AutoDecoder / LineSplitter) and queues the lines of each
+    read as (monotonic ts, stream, [(line, in_place), ...]).
+    """
+
+    _STREAMS = {1: "stdout", 2: "stderr"}
+
+    def __init__(self, q: asyncio.Queue, encoding: Optional[str]) -> None:
+        self.q = q
+        self.decoders = {fd: AutoDecoder(encoding) for fd in self._STREAMS}
+        self.splitters = {fd: LineSplitter() for fd in self._STREAMS}
+        self.exited = asyncio.get_running_loop().create_future()
+
+    def pipe_data_received(self, fd: int, data: bytes) -> None:
+        lines = self.splitters[fd].feed(self.decoders[fd].decode(data))
+        if lines:
+            self.q.put_nowait((time.monotonic(), self._STREAMS[fd], lines))
+
+    def pipe_connection_lost(self, fd: int, exc) -> None:
+        if fd not in self._STREAMS:
+            return
+        split = self.splitters[fd]
+        lines = split.feed(self.decoders[fd].decode(b"", True)) + split.flush()
+        now = time.monotonic()
+        if lines:
+            self.q.put_nowait((now, self._STREAMS[fd], lines))
+        self.q.put_nowait((now, self._STREAMS[fd], _EOF))
+
+    def process_exited(self) -> None:
+        if not self.exited.done():
+            self.exited.set_result(None)
+            self.q.put_nowait((time.monotonic(), None, _EXITED))
+
+
+async def run_command_async(
+    cmd: list[str],
+    *,
+    logger,
+    cancel_event,
+    allow_terminate: bool,
+    shell: bool = False,
+    progress: Optional[Callable[[float], None]] = None,
+    encoding: Optional[str] = PROCESS_OUTPUT_ENCODING,
+    consumers: Iterable[LineConsumer] = (),
+    capture: str = PROCESS_CAPTURE,
+) -> ProcResult:
+    """Coroutine behind process.run_command; same arguments and behavior."""
+    captures = {"stdout": Capture(capture), "stderr": Capture(capture)}
+    logger.info("▶ " + " ".join(cmd))
+
+    with logger.span("subprocess", os.path.basename(cmd[0]) if cmd else "",
+                     cmd=" ".join(cmd), allow_terminate=allow_terminate) as span:
+        res = await _pump(cmd, logger, cancel_event, allow_terminate, shell,
+                          span, progress, encoding, tuple(consumers), captures)
+        span.set("exit_code", res.returncode)
+    return res
+
+
+async def _pump(cmd, logger, cancel_event, allow_terminate, shell, span,
+                progress, encoding, consumers, captures) -> ProcResult:
+    loop = asyncio.get_running_loop()
+    q: asyncio.Queue = asyncio.Queue()
+    kw = dict(stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+              stderr=subprocess.PIPE, **POPEN_GROUP_KW)
+    if shell:
+        line = subprocess.list2cmdline(cmd) if os.name == "nt" else shlex.join(cmd)
+        transport, proto = await loop.subprocess_shell(
+            lambda: _Pipes(q, encoding), line, **kw)
+    else:
+        transport, proto = await loop.subprocess_exec(
+            lambda: _Pipes(q, encoding), *cmd, **kw)
+
+    p: subprocess.Popen = transport.get_extra_info("subprocess")
+    span.set("pid", p.pid)
+    usage = ChildUsage(p, span)
+    stopper = Stopper(p, alive=lambda: transport.get_returncode() is None)
+    unwatch = watch(cancel_event,
+                    lambda: q.put_nowait((time.monotonic(), None, _CANCEL)))
+
+    out, err = captures["stdout"], captures["stderr"]
+    last_pct = None
+    # Latest in-place (\r) line per stream, logged once the series ends
+    frames: dict[str, str] = {}
+    frame_count = 0
+
+    def emit(stream: str, line: str) -> None:
+        if stream == "stdout":
+            logger.info(line)
+        else:
+            logger.warn(line)
+        captures[stream].append(line)
+        for consume in consumers:
+            consume(stream, line)
+
+    def commit(stream: str) -> None:
+        line = frames.pop(stream, None)
+        if line is not None and line.strip():
+            emit(stream, line)
+
+    limits = current_limits()
+    t0 = last_output = time.monotonic()
+    timed_out: Optional[str] = None
+    detached = False
+    open_streams = 2
+    exited_at: Optional[float] = None
+
+    try:
+        while open_streams:
+            if cancel_event.is_set() and allow_terminate and not stopper.active:
+                logger.warn("⏹ Cancel requested — terminating current process…")
+                span.set("cancelled", True)
+                stopper.start()
+            if stopper.tick(logger):
+                logger.warn("Output pipes still open after kill — detaching.")
+                break
+            if exited_at is not None \
+                    and time.monotonic() >= exited_at + CANCEL_DRAIN_S:
+                # Something the child started inherited the pipes; waiting
+                # for their EOF would wait for that process to exit
+                logger.warn("Process exited but its output pipes are still "
+                            "open (held by a child process) — not waiting.")
+                break
+
+            now = time.monotonic()
+            if not stopper.active:
+                hit = check_watchdog(limits, last_output, now)
+                if hit is not None:
+                    timed_out = hit[0]
+                    action = "killed" if allow_terminate else "detached"
+                    report_watchdog(logger, limits, hit[0], hit[1], action,
+                                    cmd=" ".join(cmd), pid=p.pid,
+                                    elapsed_s=round(now - t0, 3),
+                                    silent_s=round(now - last_output, 3))
+                    span.set("watchdog", hit[0])
+                    if not allow_terminate:
+                        detached = True
+                        break
+                    stopper.start()
+
+            usage.sample()
+            # Sleep until output, cancel, or the next timer that matters
+            due = [stopper.next_due(), usage.next_due(),
+                   None if exited_at is None
+                   else exited_at + CANCEL_DRAIN_S]
+            if not stopper.active and limits is not None:
+                due += [limits.deadline,
+                        None if limits.idle_s is None
+                        else last_output + limits.idle_s]
+            # 0.0 is a valid time: the first usage sample is due at once
+            due = [d for d in due if d is not None]
+            try:
+                if due:
+                    item = await asyncio.wait_for(
+                        q.get(), max(0.0, min(due) - time.monotonic()))
+                else:
+                    item = await q.get()
+            except asyncio.TimeoutError:
+                continue
+
+            _ts, stream, lines = item
+            if lines is _CANCEL:
+                continue
+            if lines is _EXITED:
+                exited_at = _ts
+                continue
+            last_output = _ts
+            if lines is _EOF:
+                open_streams -= 1
+                commit(stream)
+                continue
+            for line, in_place in lines:
+                if progress is not None and stream == "stdout" and "%" in line:
+                    pct = parse_percent(line)
+                    if pct is not None and pct != last_pct:
+                        last_pct = pct
+                        progress(pct)
+                if in_place:
+                    frame_count += 1
+                    frames[stream] = line
+                    continue
+                if stream in frames:
+                    if not line:
+                        # "...\r\r\n": the line break only ends the progress bar
+                        commit(stream)
+                        continue
+                    if parse_percent(line) is not None \
+                            and parse_percent(frames[stream]) is not None:
+                        # The bar's final frame, ended by a line break
+                        del frames[stream]
+                    else:
+                        # Other text after the bar: keep the bar's last state
+                        commit(stream)
+                emit(stream, line)
+    finally:
+        unwatch()
+
+    for stream in list(frames):
+        commit(stream)
+    if frame_count:
+        span.add("progress_frames", frame_count)
+    span.add("stdout_lines", out.count)
+    span.add("stderr_lines", err.count)
+
+    if detached:
+        spawn_background(_drain_detached(transport, proto, q, open_streams,
+                                         logger))
+        return captured(1, out, err, timed_out=timed_out, detached=True)
+
+    try:
+        await asyncio.wait_for(asyncio.shield(proto.exited),
+                               CANCEL_DRAIN_S if stopper.active else None)
+    except asyncio.TimeoutError:
+        pass
+    usage.finish()
+    rc = transport.get_returncode()
+    if rc is not None:
+        transport.close()
+    else:
+        # Could not be stopped: release it once it finally exits
+        spawn_background(_close_on_exit(transport, proto))
+    return captured(rc if rc is not None else 1, out, err,
+                     timed_out=timed_out)
+
+
+async def _close_on_exit(transport, proto: _Pipes) -> None:
+    await proto.exited
+    transport.close()
+
+
+async def _drain_detached(transport, proto: _Pipes, q: asyncio.Queue,
+                          open_streams: int, logger) -> None:
+    """
+    Keeps reading a detached child's output (so it cannot block on a full
+    pipe) and logs when it finally exits.
+    """
+    while open_streams:
+        if (await q.get())[2] is _EOF:
+            open_streams -= 1
+    await proto.exited
+    logger.info(f"Detached process {transport.get_pid()} exited with code "
+                f"{transport.get_returncode()}")
+    transport.close()
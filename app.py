@@ -2,8 +2,6 @@ import sys
 import ctypes
 import platform
 
-from ui.main_window import MainWindow
-
 
 def is_admin():
     try:
@@ -27,11 +25,18 @@ def relaunch_as_admin():
 if platform.system() != "Windows":
     raise SystemExit("Windows only")
 
+# Scheduled / unattended runs: no GUI imports, no UAC prompt
+if "--headless" in sys.argv[1:]:
+    from cli import main as headless_main
+    sys.exit(headless_main([a for a in sys.argv[1:] if a != "--headless"]))
+
 if not is_admin():
     relaunch_as_admin()
     sys.exit(0)
 
 
 if __name__ == "__main__":
+    from ui.main_window import MainWindow
+
     app = MainWindow()
     app.mainloop()
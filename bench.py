@@ -0,0 +1,625 @@
+"""
+Benchmark suite for the runner, process and logging hot paths.
+
+Runs on any platform: Windows commands are replaced by local Python child
+processes and TEMP cleanup works on a generated directory tree.
+
+    python bench.py                          # all cases, print a table
+    python bench.py --quick --out new.json   # smaller sizes, save results
+    python bench.py --compare old.json       # exit 1 on a regression
+    python bench.py --only proc_ --repeat 5
+
+Results are JSON: run metadata plus, per case, its metrics and the
+primary metric used for comparisons.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+ROOT = Path(__file__).resolve().parent
+
+# Project modules read LOCALAPPDATA at import; keep benchmark logs apart
+_SCRATCH = Path(tempfile.mkdtemp(prefix="mt_bench_"))
+os.environ["LOCALAPPDATA"] = str(_SCRATCH / "appdata")
+sys.path.insert(0, str(ROOT))
+
+# Child process that stands in for DISM / SFC / PowerShell output
+_CHILD = r"""
+import sys
+lines, width, mode = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+pad = "x" * width
+out, err = sys.stdout, sys.stderr
+for i in range(lines):
+    if mode == "mixed" and i % 2:
+        err.write(f"{i} {pad}\n")
+    elif mode == "progress":  # a bar redrawn in place, like DISM
+        out.write(f"\r[{pad}] {i * 100 // lines}.0%")
+    else:
+        out.write(f"{i} {pad}\n")
+if mode == "progress":
+    out.write("\r\n")
+"""
+
+
+@dataclass
+class Sizes:
+    proc_lines: int = 200_000
+    long_lines: int = 2_000
+    long_width: int = 64 * 1024
+    log_threads: int = 8
+    log_lines: int = 20_000      # per thread
+    tree_depth: int = 3
+    tree_fanout: int = 8
+    tree_files: int = 40         # per directory
+    ps_commands: int = 200
+    idle_tasks: int = 8          # long, silent children waited on at once
+    idle_seconds: float = 5.0
+
+
+QUICK = Sizes(proc_lines=20_000, long_lines=200, log_lines=2_000,
+              tree_depth=2, tree_fanout=6, tree_files=20, ps_commands=30,
+              idle_seconds=2.0)
+
+
+class _NullLogger:
+    """Counts lines; isolates process cost from logging cost."""
+
+    def __init__(self) -> None:
+        self.lines = 0
+
+    def info(self, message: str, **data) -> None:
+        self.lines += 1
+
+    warn = error = event = info
+
+    def span(self, kind: str, name: str, **attrs):
+        from logger import NULL_SPAN
+        return NULL_SPAN
+
+
+def _never() -> threading.Event:
+    return threading.Event()
+
+
+# --------------------------------------------------
+# Cases: each returns (metrics, primary metric name)
+# --------------------------------------------------
+
+def _proc(lines: int, width: int, mode: str, real_logger: bool) -> dict:
+    from process import run_command
+
+    logger = _NullLogger()
+    if real_logger:
+        from logger import Logger
+        logger = Logger()
+    cmd = [sys.executable, "-c", _CHILD, str(lines), str(width), mode]
+
+    t0 = time.perf_counter()
+    res = run_command(cmd, logger=logger, cancel_event=_never(),
+                      allow_terminate=True)
+    elapsed = time.perf_counter() - t0
+    if real_logger:
+        logger.close()
+
+    return {
+        "seconds": elapsed,
+        "lines_per_s": lines / elapsed,
+        "mb_per_s": lines * (width + 8) / elapsed / 1e6,
+        "returncode": res.returncode,
+        "stdout_lines": res.stdout_lines,
+        # Output kept in ProcResult (bounded by the tail capture)
+        "captured_chars": len(res.stdout) + len(res.stderr),
+    }
+
+
+def case_proc_lines(s: Sizes):
+    return _proc(s.proc_lines, 40, "stdout", False), "lines_per_s"
+
+
+def case_proc_mixed(s: Sizes):
+    return _proc(s.proc_lines, 40, "mixed", False), "lines_per_s"
+
+
+def case_proc_long_lines(s: Sizes):
+    return _proc(s.long_lines, s.long_width, "stdout", False), "mb_per_s"
+
+
+def case_proc_progress(s: Sizes):
+    """In-place (\\r) updates: collapsed, so stdout_lines stays 1."""
+    return _proc(s.proc_lines, 40, "progress", False), "lines_per_s"
+
+
+def case_proc_logged(s: Sizes):
+    return _proc(s.proc_lines, 40, "mixed", True), "lines_per_s"
+
+
+def case_proc_iter(s: Sizes):
+    """Output consumed through iter_command instead of ProcResult."""
+    from process import iter_command
+
+    cmd = [sys.executable, "-c", _CHILD, str(s.proc_lines), "40", "mixed"]
+    t0 = time.perf_counter()
+    out = iter_command(cmd, logger=_NullLogger(), cancel_event=_never(),
+                       allow_terminate=True)
+    seen = sum(1 for _ in out)
+    elapsed = time.perf_counter() - t0
+    return {
+        "seconds": elapsed,
+        "lines_per_s": seen / elapsed,
+        "lines": seen,
+        "returncode": out.result.returncode,
+    }, "lines_per_s"
+
+
+def case_logger_contention(s: Sizes):
+    from logger import Logger
+
+    # Writer throughput: these lines would otherwise be coalesced
+    logger = Logger(coalesce=False)
+    barrier = threading.Barrier(s.log_threads + 1)
+
+    def worker(n: int) -> None:
+        barrier.wait()
+        for i in range(s.log_lines):
+            logger.info(f"worker {n} line {i} some progress text")
+
+    threads = [threading.Thread(target=worker, args=(n,))
+               for n in range(s.log_threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    emit = time.perf_counter() - t0
+    logger.close()
+    total = time.perf_counter() - t0
+
+    lines = s.log_threads * s.log_lines
+    stats = logger.stats
+    return {
+        "emit_seconds": emit,
+        "total_seconds": total,
+        "lines_per_s": lines / total,
+        "delayed": stats.delayed,
+        "dropped": stats.dropped,
+    }, "lines_per_s"
+
+
+def _noisy_run(lines: int, coalesce: bool) -> dict:
+    """A Windows Update style stream: mostly repeated progress lines."""
+    from logger import Logger
+
+    logger = Logger(coalesce=coalesce)
+    shown = 0
+
+    def sink(line: str) -> None:
+        nonlocal shown
+        shown += 1
+
+    logger.attach_ui_sink(sink)
+    # Loggers created within the same second share their files
+    logger.flush()
+    paths = (logger.paths.text, logger.paths.jsonl)
+    before = sum(os.path.getsize(p) for p in paths)
+    t0 = time.perf_counter()
+    with logger.span("subprocess", "noisy"):
+        for i in range(lines):
+            if i % 500 == 0:
+                logger.info(f"Installing update {i // 500} of {lines // 500}")
+            logger.info(f"Downloading: {i % 100}% complete")
+    logger.close()
+    elapsed = time.perf_counter() - t0
+    size = sum(os.path.getsize(p) for p in paths) - before
+    return {"seconds": elapsed, "log_bytes": size, "ui_lines": shown}
+
+
+def case_logger_repetitive(s: Sizes):
+    n = s.log_lines * s.log_threads
+    on, off = _noisy_run(n, True), _noisy_run(n, False)
+    return {
+        "seconds": on["seconds"],
+        "log_bytes": on["log_bytes"],
+        "ui_lines": on["ui_lines"],
+        "uncoalesced_seconds": off["seconds"],
+        "uncoalesced_log_bytes": off["log_bytes"],
+        "bytes_ratio": on["log_bytes"] / off["log_bytes"],
+    }, "bytes_ratio"
+
+
+def _build_tree(root: Path, depth: int, fanout: int, files: int) -> tuple[int, int]:
+    nfiles = ndirs = 0
+    stack = [(root, depth)]
+    while stack:
+        d, level = stack.pop()
+        d.mkdir(parents=True, exist_ok=True)
+        ndirs += 1
+        for i in range(files):
+            with open(d / f"f{i}.tmp", "wb") as f:
+                f.write(b"x" * (i * 13 % 4096))
+            nfiles += 1
+        if level:
+            stack.extend((d / f"d{j}", level - 1) for j in range(fanout))
+    return nfiles, ndirs
+
+
+def _temp_cleanup(s: Sizes, dry_run: bool) -> dict:
+    from runner import Context
+    from tasks.temp_cleanup import clear_temp
+
+    root = _SCRATCH / "temp"
+    shutil.rmtree(root, ignore_errors=True)
+    build0 = time.perf_counter()
+    nfiles, ndirs = _build_tree(root / "cache", s.tree_depth,
+                                s.tree_fanout, s.tree_files)
+    build = time.perf_counter() - build0
+
+    try:
+        ctx = Context(logger=_NullLogger(), cancel_event=_never(),
+                      dry_run=dry_run)
+        t0 = time.perf_counter()
+        # Only the scratch root, never the configured system folders
+        clear_temp(ctx, [str(root)])
+        elapsed = time.perf_counter() - t0
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "files": nfiles,
+        "dirs": ndirs,
+        "build_seconds": build,
+        "seconds": elapsed,
+        "files_per_s": nfiles / elapsed,
+    }
+
+
+def case_temp_cleanup(s: Sizes):
+    return _temp_cleanup(s, dry_run=False), "files_per_s"
+
+
+def case_temp_dry_run(s: Sizes):
+    return _temp_cleanup(s, dry_run=True), "files_per_s"
+
+
+def case_temp_roots(s: Sizes):
+    """Four TEMP roots on two (simulated) volumes; cleaned in one call."""
+    from runner import Context
+    from tasks.temp_cleanup import clear_temp
+
+    base = _SCRATCH / "temp_roots"
+    shutil.rmtree(base, ignore_errors=True)
+    roots = [str(base / f"root{i}") for i in range(4)]
+    nfiles = ndirs = 0
+    for r in roots:
+        f, d = _build_tree(Path(r) / "cache", max(0, s.tree_depth - 1),
+                           s.tree_fanout, s.tree_files)
+        nfiles += f
+        ndirs += d
+
+    try:
+        ctx = Context(logger=_NullLogger(), cancel_event=_never(),
+                      dry_run=False)
+        t0 = time.perf_counter()
+        clear_temp(ctx, roots, volume_of=lambda r: int(r[-1]) % 2)
+        elapsed = time.perf_counter() - t0
+        left = sum(len(os.listdir(r)) for r in roots)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    return {
+        "roots": len(roots),
+        "files": nfiles,
+        "dirs": ndirs,
+        "entries_left": left,
+        "seconds": elapsed,
+        "files_per_s": nfiles / elapsed,
+    }, "files_per_s"
+
+
+def case_cold_import(s: Sizes):
+    """Fresh interpreter: what a front end imports to show its task list."""
+    code = ("import sys, time; t0 = time.perf_counter(); "
+            "import logger, runner; from tasks import registry; "
+            "registry.build_tasks(registry.TASKS); "
+            "print(time.perf_counter() - t0, "
+            "sum(m.startswith('tasks.') for m in sys.modules))")
+    best = None
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        seconds, modules = out.stdout.split()
+        if best is None or float(seconds) < best:
+            best = float(seconds)
+    return {"import_s": best, "task_modules": int(modules)}, "import_s"
+
+
+def case_pshost_roundtrip(s: Sizes):
+    from pshost import PowerShellPool, python_standin_argv
+
+    pool = PowerShellPool(size=1, argv_factory=python_standin_argv)
+    logger = _NullLogger()
+    t0 = time.perf_counter()
+    pool.run("pass", logger=logger, cancel_event=_never(),
+             allow_terminate=True)
+    cold = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(s.ps_commands):
+        pool.run(f"print({i})", logger=logger, cancel_event=_never(),
+                 allow_terminate=True)
+    warm = (time.perf_counter() - t0) / s.ps_commands
+    pool.close()
+    return {"cold_start_s": cold, "warm_command_s": warm}, "warm_command_s"
+
+
+# Exits on SIGTERM / taskkill (polite) or ignores it and keeps a grandchild
+# holding the output pipe (stubborn: needs the forced tree kill)
+_SLEEPER = r"""
+import signal, subprocess, sys, time
+if sys.argv[1] == "stubborn":
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+print("started", flush=True)
+time.sleep(60)
+"""
+
+
+def _cancel_run(task_fn, delay: float = 0.3) -> float:
+    """Seconds from cancel until run_tasks has returned (worker idle)."""
+    from runner import Context, Task, run_tasks
+
+    cancel = threading.Event()
+    ctx = Context(logger=_NullLogger(), cancel_event=cancel, dry_run=False)
+    done = threading.Event()
+    worker = threading.Thread(target=lambda: (
+        run_tasks(ctx, [Task("cancel-me", task_fn, allow_terminate=True)],
+                  lambda *a: None), done.set()))
+    worker.start()
+    time.sleep(delay)
+    t0 = time.perf_counter()
+    cancel.set()
+    done.wait()
+    latency = time.perf_counter() - t0
+    worker.join()
+    return latency
+
+
+def case_cancel_latency(s: Sizes):
+    from process import run_command
+    from tasks.tree_delete import delete_tree
+
+    def sleeper(mode):
+        def fn(ctx):
+            run_command([sys.executable, "-c", _SLEEPER, mode],
+                        logger=ctx.logger, cancel_event=ctx.cancel_event,
+                        allow_terminate=True)
+        return fn
+
+    root = _SCRATCH / "cancel_tree"
+    shutil.rmtree(root, ignore_errors=True)
+    _build_tree(root, s.tree_depth + 1, s.tree_fanout, s.tree_files)
+
+    def delete(ctx):
+        delete_tree(str(root), cancel_event=ctx.cancel_event, keep_root=True)
+
+    try:
+        metrics = {
+            "process_s": _cancel_run(sleeper("polite")),
+            "process_stubborn_s": _cancel_run(sleeper("stubborn")),
+            "tree_delete_s": _cancel_run(delete, delay=0.05),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return metrics, "process_s"
+
+
+def case_watchdog(s: Sizes):
+    """Overshoot past the limit until run_tasks has moved on."""
+    from process import run_command
+    from runner import Context, Task, run_tasks
+
+    def overshoot(limit: float, allow: bool, **opts) -> float:
+        def sleeper(ctx):
+            run_command([sys.executable, "-c", _SLEEPER, "polite"],
+                        logger=ctx.logger, cancel_event=ctx.cancel_event,
+                        allow_terminate=allow)
+
+        ctx = Context(logger=_NullLogger(), cancel_event=threading.Event(),
+                      dry_run=True)
+        t0 = time.perf_counter()
+        [r] = run_tasks(ctx, [Task("hang", sleeper, allow_terminate=allow,
+                                   **opts)], lambda *a: None)
+        elapsed = time.perf_counter() - t0
+        assert r.status == "timeout", r
+        return elapsed - limit
+
+    return {
+        "idle_kill_s": overshoot(0.5, True, idle_timeout_s=0.5),
+        "timeout_detach_s": overshoot(0.5, False, timeout_s=0.5),
+    }, "idle_kill_s"
+
+
+def _idle_run(n: int, seconds: float, coroutines: bool) -> dict:
+    """CPU time of this process while run_tasks waits on silent children."""
+    from runner import Context, Task, run_tasks
+
+    argv = [sys.executable, "-c", f"import time; time.sleep({seconds})"]
+    if coroutines:
+        from aio import run_command_async
+
+        async def fn(ctx):
+            await run_command_async(argv, logger=ctx.logger,
+                                    cancel_event=ctx.cancel_event,
+                                    allow_terminate=True)
+    else:
+        from process import run_command
+
+        def fn(ctx):
+            run_command(argv, logger=ctx.logger, cancel_event=ctx.cancel_event,
+                        allow_terminate=True)
+
+    from aio import CancelEvent
+
+    # As the GUI / CLI do: a cancel event the loop need not poll
+    ctx = Context(logger=_NullLogger(), cancel_event=CancelEvent(),
+                  dry_run=True)
+    tasks = [Task(f"idle{i}", fn, allow_terminate=True) for i in range(n)]
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    run_tasks(ctx, tasks, lambda *a: None, max_parallel=n)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    return {"wall_s": wall, "cpu_s": cpu, "cpu_pct": 100 * cpu / wall}
+
+
+def case_idle_cpu(s: Sizes):
+    """Cost of waiting: CPU used by the tool itself, not by the children."""
+    threads = _idle_run(s.idle_tasks, s.idle_seconds, False)
+    loop = _idle_run(s.idle_tasks, s.idle_seconds, True)
+    return {
+        "cpu_pct": loop["cpu_pct"],
+        "cpu_s": loop["cpu_s"],
+        "thread_tasks_cpu_pct": threads["cpu_pct"],
+        "thread_tasks_cpu_s": threads["cpu_s"],
+    }, "cpu_pct"
+
+
+CASES: dict[str, Callable[[Sizes], tuple[dict, str]]] = {
+    "proc_lines": case_proc_lines,
+    "proc_mixed": case_proc_mixed,
+    "proc_long_lines": case_proc_long_lines,
+    "proc_progress": case_proc_progress,
+    "proc_logged": case_proc_logged,
+    "proc_iter": case_proc_iter,
+    "logger_contention": case_logger_contention,
+    "logger_repetitive": case_logger_repetitive,
+    "temp_cleanup": case_temp_cleanup,
+    "temp_dry_run": case_temp_dry_run,
+    "temp_roots": case_temp_roots,
+    "cold_import": case_cold_import,
+    "pshost_roundtrip": case_pshost_roundtrip,
+    "cancel_latency": case_cancel_latency,
+    "watchdog": case_watchdog,
+    "idle_cpu": case_idle_cpu,
+}
+
+# Metrics where a smaller value is better
+LOWER_IS_BETTER = {"seconds", "total_seconds", "emit_seconds",
+                   "cold_start_s", "warm_command_s", "process_s",
+                   "process_stubborn_s", "tree_delete_s", "idle_kill_s",
+                   "timeout_detach_s", "log_bytes", "bytes_ratio", "cpu_pct",
+                   "cpu_s", "thread_tasks_cpu_pct", "thread_tasks_cpu_s",
+                   "captured_chars", "import_s"}
+
+
+# --------------------------------------------------
+# Runner
+# --------------------------------------------------
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(sizes: Sizes, only: list[str], repeat: int) -> dict:
+    results: dict[str, dict] = {}
+    for name, fn in CASES.items():
+        if only and not any(name.startswith(o) for o in only):
+            continue
+        runs = []
+        primary = ""
+        for _ in range(repeat):
+            metrics, primary = fn(sizes)
+            runs.append(metrics)
+        merged = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+        results[name] = {"primary": primary, "metrics": merged,
+                         "runs": len(runs)}
+        print(f"{name:<20} {primary:<16} {merged[primary]:>14.6g}",
+              flush=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": sizes.__dict__,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(new: dict, old: dict, threshold: float) -> list[str]:
+    """Returns one message per case whose primary metric regressed."""
+    regressions = []
+    for name, cur in new["results"].items():
+        base = old.get("results", {}).get(name)
+        if not base or base.get("primary") != cur["primary"]:
+            continue
+        metric = cur["primary"]
+        a, b = base["metrics"][metric], cur["metrics"][metric]
+        if not a:
+            continue
+        change = (b - a) / a
+        worse = change > threshold if metric in LOWER_IS_BETTER \
+            else change < -threshold
+        flag = "REGRESSION" if worse else "ok"
+        print(f"{name:<20} {metric:<16} {a:>12.6g} -> {b:>12.6g} "
+              f"({change:+.1%}) {flag}")
+        if worse:
+            regressions.append(f"{name}.{metric} {change:+.1%}")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("--quick", action="store_true", help="smaller sizes")
+    ap.add_argument("--only", action="append", default=[],
+                    help="run cases whose name starts with this (repeatable)")
+    ap.add_argument("--repeat", type=int, default=3,
+                    help="runs per case; the median is reported")
+    ap.add_argument("--out", type=Path, help="write results JSON here")
+    ap.add_argument("--compare", type=Path,
+                    help="earlier results JSON; exit 1 on regression")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="allowed relative slowdown for --compare")
+    args = ap.parse_args(argv)
+
+    try:
+        report = run_suite(QUICK if args.quick else Sizes(),
+                           args.only, max(1, args.repeat))
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    if args.compare:
+        old = json.loads(args.compare.read_text(encoding="utf-8"))
+        regressions = compare(report, old, args.threshold)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""
+Headless entry point for scheduled / unattended runs.
+
+    python cli.py run --tasks temp,recycle
+    python cli.py run --tasks temp,recycle --no-dry-run
+    python cli.py run --profile scheduled_profile.json
+    python cli.py list
+    python cli.py history tasks --days 90
+    python cli.py orchestrate --targets hosts.txt --tasks temp
+
+Runs are dry runs unless --no-dry-run is given (or the profile / run
+request says "dry_run": false). Never imports the UI (customtkinter).
+Exit codes are listed below.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from config import ORCHESTRATOR_MAX_PARALLEL
+from tasks.registry import TASKS, build_tasks, default_keys
+
+EXIT_OK = 0
+EXIT_TASK_FAILED = 1   # a task failed, crashed or logged errors
+EXIT_USAGE = 2
+EXIT_NOT_ADMIN = 3
+EXIT_CANCELLED = 130
+
+# Selected unless a profile or --tasks says otherwise (TaskSpec.default)
+DEFAULT_TASKS = default_keys()
+
+
+def load_profile(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        profile = json.load(f)
+    if not isinstance(profile, dict):
+        raise ValueError("profile must be a JSON object")
+    return profile
+
+
+def _parse_keys(raw) -> list[str]:
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    keys = [k.strip().lower() for k in raw if k and k.strip()]
+    unknown = [k for k in keys if k not in TASKS]
+    if unknown:
+        raise ValueError(f"unknown task(s): {', '.join(unknown)}")
+    # Keep the canonical order, drop duplicates
+    return [k for k in TASKS if k in keys]
+
+
+def _dry_run(value) -> bool:
+    """Only an explicit false (--no-dry-run, "dry_run": false) runs for real."""
+    return value is not False
+
+
+def _add_dry_run(parser: argparse.ArgumentParser) -> None:
+    dry = parser.add_mutually_exclusive_group()
+    dry.add_argument("--dry-run", dest="dry_run", action="store_true",
+                     default=None, help="only log what would be done (default)")
+    dry.add_argument("--no-dry-run", dest="dry_run", action="store_false",
+                     help="really run the tasks (needs administrator rights)")
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(
+        prog="MaintenanceTool --headless",
+        description="Run maintenance tasks without the GUI.")
+    sub = ap.add_subparsers(dest="command")
+
+    run = sub.add_parser("run", help="run maintenance tasks")
+    run.add_argument("--profile", type=Path,
+                     help="JSON file with tasks / dry_run / retry_locked / "
+                          "force / temp_roots")
+    run.add_argument("--tasks",
+                     help="comma-separated task keys (see 'list')")
+    run.add_argument("--all", action="store_true", help="run every task")
+    _add_dry_run(run)
+    run.add_argument("--retry-locked", action="store_true", default=None,
+                     help="retry files postponed by the locked-file cache")
+    run.add_argument("--force", action="store_true", default=None,
+                     help="ignore skip-if-recently-succeeded policies")
+    run.add_argument("--console", action="store_true",
+                     help="echo log lines to stdout")
+
+    sub.add_parser("list", help="list task keys")
+
+    hist = sub.add_parser("history", help="query past runs")
+    hist.add_argument("view", nargs="?", default="runs",
+                      choices=("runs", "tasks", "task"),
+                      help="runs: recent runs; tasks: per-task summary; "
+                           "task: every execution of --task")
+    hist.add_argument("--task", help="task key or display name")
+    hist.add_argument("--days", type=float, help="only the last N days")
+    hist.add_argument("--limit", type=int, default=20)
+    hist.add_argument("--json", action="store_true", help="print JSON")
+    hist.add_argument("--no-sync", dest="sync", action="store_false",
+                      help="skip ingesting new log files first")
+
+    agent = sub.add_parser(
+        "agent", help="serve orchestrator requests on stdin / stdout")
+    agent.add_argument("--name", help="host name reported to the orchestrator")
+
+    orch = sub.add_parser("orchestrate", help="run on many hosts via agents")
+    orch.add_argument("--hosts", help="comma-separated host names")
+    orch.add_argument("--targets", type=Path,
+                      help="file with one host per line (# comments)")
+    orch.add_argument("--tasks", help="comma-separated task keys")
+    _add_dry_run(orch)
+    orch.add_argument("--force", action="store_true")
+    orch.add_argument("--retry-locked", action="store_true")
+    orch.add_argument("--max-parallel", type=int,
+                      default=ORCHESTRATOR_MAX_PARALLEL)
+    orch.add_argument("--agent-cmd",
+                      help="command that starts an agent for {host}, e.g. "
+                           "'ssh {host} MaintenanceTool.exe --headless agent' "
+                           "(default: local stand-in agents)")
+    orch.add_argument("--report", type=Path, help="write the JSON report here")
+    orch.add_argument("--quiet", action="store_true",
+                      help="do not stream agent log lines")
+    return ap
+
+
+def _cmd_list() -> int:
+    for key, spec in TASKS.items():
+        flags = " (slow)" if spec.slow else ""
+        if spec.freshness is not None:
+            flags += f" [{spec.freshness.describe()}]"
+        default = "*" if spec.default else " "
+        print(f"{default} {key:<14}{spec.name}{flags}")
+    return EXIT_OK
+
+
+def _fmt_s(v) -> str:
+    return "-" if v is None else f"{v:.1f}s"
+
+
+def _cmd_history(args) -> int:
+    from history import HistoryStore, is_legacy
+    from tasks.tree_delete import format_bytes
+
+    name = args.task
+    if name is not None and name.lower() in TASKS:
+        name = TASKS[name.lower()].name
+    if args.view == "task" and not name:
+        print("error: 'history task' needs --task", file=sys.stderr)
+        return EXIT_USAGE
+
+    legacy = False
+    with HistoryStore() as store:
+        if args.sync:
+            store.sync()
+        if args.view == "runs":
+            rows = store.runs(limit=args.limit, days=args.days)
+        elif args.view == "tasks":
+            rows = store.task_stats(days=args.days, name=name)
+            legacy = store.legacy_runs(days=args.days) > 0
+        else:
+            rows = store.task_runs(name, days=args.days, limit=args.limit)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return EXIT_OK
+
+    for r in rows:
+        freed = format_bytes(r["bytes_freed"]) if r["bytes_freed"] else "-"
+        mark = ""
+        if "run_id" in r and is_legacy(r["run_id"]):
+            legacy = True
+            mark = "  (legacy log)"
+        if args.view == "runs":
+            print(f"{r['started'][:19]}  {r['status']:<10} "
+                  f"{_fmt_s(r['duration_s']):>9}  tasks {r['tasks_total']} "
+                  f"(failed {r['tasks_failed']})  warn {r['warnings']} "
+                  f"err {r['errors']}  freed {freed}{mark}")
+        elif args.view == "tasks":
+            print(f"{r['name']:<16} runs {r['runs']:>4}  failed {r['failed']:>3}  "
+                  f"avg {_fmt_s(r['avg_s']):>9}  max {_fmt_s(r['max_s']):>9}  "
+                  f"freed {freed}  last {(r['last_run'] or '-')[:19]}")
+        else:
+            rc = "-" if r["exit_code"] is None else r["exit_code"]
+            print(f"{(r['started'] or '-')[:19]}  {r['status']:<10} "
+                  f"{_fmt_s(r['duration_s']):>9}  exit {rc}  "
+                  f"warn {r['warnings']} err {r['errors']}  freed {freed}{mark}")
+    if not rows:
+        print("(no history)")
+    if legacy:
+        print("\nRuns from legacy logs (before structured logging) have "
+              "task durations from the\ntask headers only (including any "
+              "gap between tasks) and no exit codes, bytes\nfreed or "
+              "command details.")
+    return EXIT_OK
+
+
+def _cmd_run(args) -> int:
+    profile: dict = {}
+    try:
+        if args.profile:
+            profile = load_profile(args.profile)
+        if args.all:
+            keys = list(TASKS)
+        elif args.tasks:
+            keys = _parse_keys(args.tasks)
+        else:
+            keys = _parse_keys(profile.get("tasks", DEFAULT_TASKS))
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    dry_run = _dry_run(args.dry_run if args.dry_run is not None
+                       else profile.get("dry_run"))
+    retry_locked = args.retry_locked if args.retry_locked is not None else bool(
+        profile.get("retry_locked", False))
+    force = args.force if args.force is not None else bool(
+        profile.get("force", False))
+    temp_roots = profile.get("temp_roots")
+    if temp_roots is not None and (
+            not isinstance(temp_roots, list)
+            or not all(isinstance(r, str) for r in temp_roots)):
+        print("error: temp_roots must be a list of paths", file=sys.stderr)
+        return EXIT_USAGE
+
+    rc, _ = execute(keys, dry_run=dry_run, retry_locked=retry_locked,
+                    force=force, temp_roots=temp_roots,
+                    on_line=print if args.console else None)
+    return rc
+
+
+def execute(
+    keys: list[str],
+    *,
+    dry_run: bool,
+    retry_locked: bool = False,
+    force: bool = False,
+    temp_roots: Optional[list[str]] = None,
+    cancel_event: Optional[threading.Event] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+) -> tuple[int, list]:
+    """One headless run (also used by the agent); returns (exit code, results)."""
+    from admin import is_admin
+
+    if not dry_run and not is_admin():
+        msg = "error: administrator rights required for a real run"
+        print(msg, file=sys.stderr)
+        if on_line:
+            on_line(msg)
+        return EXIT_NOT_ADMIN, []
+
+    from aio import CancelEvent
+    from logger import Logger
+    from runner import Context, run_tasks
+
+    logger = Logger()
+    if on_line:
+        logger.attach_ui_sink(on_line)
+
+    cancel_event = cancel_event or CancelEvent()
+
+    def on_signal(signum, frame):
+        cancel_event.set()
+        logger.warn("⏹ Cancel requested — finishing current step safely, then stopping…")
+
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, getattr(signal, "SIGBREAK", None)):
+            if sig is not None:
+                signal.signal(sig, on_signal)
+
+    ctx = Context(logger=logger, cancel_event=cancel_event,
+                  dry_run=dry_run, retry_locked=retry_locked, force=force,
+                  temp_roots=temp_roots)
+    rc = EXIT_TASK_FAILED
+    results: list = []
+    try:
+        logger.info(f"Headless run: {', '.join(keys) or '(none)'}")
+        results = run_tasks(ctx, build_tasks(keys), lambda v, s, eta: None)
+
+        if cancel_event.is_set():
+            rc = EXIT_CANCELLED
+        elif logger.counts.get("ERROR") or any(not r.succeeded for r in results):
+            rc = EXIT_TASK_FAILED
+        else:
+            rc = EXIT_OK
+        logger.event("exit", code=rc)
+    finally:
+        logger.close()
+
+    from history import sync_quietly
+    sync_quietly()
+    return rc, results
+
+
+def _cmd_agent(args) -> int:
+    from orchestrator import serve_agent
+
+    def run(keys, opts, cancel_event, on_line):
+        return execute(_parse_keys(keys or DEFAULT_TASKS),
+                       dry_run=_dry_run(opts.get("dry_run")),
+                       retry_locked=bool(opts.get("retry_locked", False)),
+                       force=bool(opts.get("force", False)),
+                       cancel_event=cancel_event, on_line=on_line)
+
+    return serve_agent(run, name=args.name)
+
+
+def _read_targets(args) -> list[str]:
+    hosts: list[str] = []
+    if args.hosts:
+        hosts += [h.strip() for h in args.hosts.split(",")]
+    if args.targets:
+        with open(args.targets, "r", encoding="utf-8") as f:
+            hosts += [ln.split("#", 1)[0].strip() for ln in f]
+    # Keep order, drop blanks and duplicates
+    return list(dict.fromkeys(h for h in hosts if h))
+
+
+def _cmd_orchestrate(args) -> int:
+    import shlex
+    from orchestrator import SubprocessTransport, orchestrate
+
+    try:
+        hosts = _read_targets(args)
+        keys = _parse_keys(args.tasks) if args.tasks else DEFAULT_TASKS
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not hosts:
+        print("error: no targets (use --hosts or --targets)", file=sys.stderr)
+        return EXIT_USAGE
+
+    argv = shlex.split(args.agent_cmd, posix=(os.name != "nt")) \
+        if args.agent_cmd else None
+    cancel_event = threading.Event()
+
+    def on_signal(signum, frame):
+        cancel_event.set()
+        print("⏹ Cancel requested — stopping agents…", file=sys.stderr)
+
+    for sig in (signal.SIGINT, getattr(signal, "SIGBREAK", None)):
+        if sig is not None:
+            signal.signal(sig, on_signal)
+
+    print_lock = threading.Lock()
+
+    def on_line(host: str, line: str) -> None:
+        if not args.quiet:
+            with print_lock:
+                print(f"[{host}] {line}", flush=True)
+
+    def on_host_done(r) -> None:
+        with print_lock:
+            print(f"== {r.host}: {r.status}"
+                  + (f" (exit {r.exit_code})" if r.exit_code is not None else "")
+                  + (f" — {r.error}" if r.error else ""), flush=True)
+
+    report = orchestrate(
+        hosts,
+        {"tasks": keys, "dry_run": _dry_run(args.dry_run),
+         "force": args.force, "retry_locked": args.retry_locked},
+        transport=SubprocessTransport(argv),
+        max_parallel=args.max_parallel,
+        cancel_event=cancel_event,
+        on_line=on_line,
+        on_host_done=on_host_done,
+    )
+
+    summary = report.summary()
+    print(f"\n{summary['hosts']} host(s) in {summary['duration_s']:.1f}s: "
+          + ", ".join(f"{k} {v}" for k, v in sorted(summary["by_status"].items())))
+    for name, per in summary["tasks"].items():
+        print(f"  {name:<16}" + ", ".join(f"{k} {v}" for k, v in sorted(per.items())))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.as_dict(), f, indent=2)
+
+    if cancel_event.is_set():
+        return EXIT_CANCELLED
+    return EXIT_OK if report.ok else EXIT_TASK_FAILED
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = _build_parser().parse_args(argv)
+    if args.command == "list":
+        return _cmd_list()
+    if args.command == "run":
+        return _cmd_run(args)
+    if args.command == "history":
+        return _cmd_history(args)
+    if args.command == "agent":
+        return _cmd_agent(args)
+    if args.command == "orchestrate":
+        return _cmd_orchestrate(args)
+    _build_parser().print_help()
+    return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,3 +13,128 @@ POWERSHELL_51_X64 = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
 
 # cleanmgr profile id (you must run cleanmgr /sageset:100 once manually)
 CLEANMGR_PROFILE_ID = 100
+
+# Background log writer: bounded queue, flushed in batches
+LOG_QUEUE_MAX = 20000
+LOG_BATCH_SIZE = 500
+LOG_FLUSH_INTERVAL_S = 0.25
+LOG_ENQUEUE_TIMEOUT_S = 0.5
+
+# Noisy output (progress / status lines printed over and over) is
+# coalesced per source (the innermost span, else the thread): repeats of
+# the same line, digits ignored, become one "repeated N times" summary,
+# and each source may emit at most LOG_RATE_LINES_PER_S lines (bursts up
+# to LOG_RATE_BURST). ERROR lines always pass.
+LOG_COALESCE_ENABLED = True
+LOG_REPEAT_SUMMARY_S = 30.0   # summary of an ongoing repeat at least this often
+LOG_RATE_LINES_PER_S = 200
+LOG_RATE_BURST = 2000
+
+# GUI log view: lines are buffered and drained to the textbox once per tick
+UI_LOG_FLUSH_MS = 50
+UI_LOG_MAX_LINES = 5000
+
+# Task runner: how many independent tasks may run at the same time
+RUNNER_MAX_PARALLEL = 3
+
+# Worker threads for the TEMP cleanup deletion engine
+DELETE_WORKERS = 8
+
+# TEMP cleanup targets: environment variables are expanded and wildcards
+# matched; missing folders are skipped. "%TEMP%" is the current user's temp
+# directory. A run profile may replace the list ("temp_roots"), e.g. to add
+# cache folders on secondary drives.
+TEMP_CLEANUP_ROOTS = [
+    "%TEMP%",
+    r"%SystemRoot%\Temp",
+    r"%SystemDrive%\Users\*\AppData\Local\Temp",
+    r"%SystemDrive%\Users\*\AppData\Local\CrashDumps",
+    r"%SystemRoot%\Minidump",
+    r"%ProgramData%\Microsoft\Windows\WER\ReportArchive",
+    r"%ProgramData%\Microsoft\Windows\WER\ReportQueue",
+]
+# Roots on different volumes are cleaned in parallel (at most this many
+# volumes at once); roots on the same volume one after another
+TEMP_VOLUME_PARALLEL = 4
+
+# TEMP cleanup: files that were locked are postponed on later runs
+LOCK_CACHE_FILE = BASE_DIR / "locked_files.json"
+LOCK_CACHE_BACKOFF_S = 6 * 3600        # doubled after every failed retry
+LOCK_CACHE_MAX_BACKOFF_S = 7 * 86400
+LOCK_CACHE_MAX_ENTRIES = 50000
+
+# Task selection used by the daily scheduled (headless) run
+SCHEDULE_PROFILE = BASE_DIR / "scheduled_profile.json"
+
+# Long-lived PowerShell workers shared by the tasks of one run
+POWERSHELL_POOL_SIZE = 2
+
+# Timing spans (run / task / subprocess / phase) in the JSONL log
+SPANS_ENABLED = True
+SPAN_SAMPLE_INTERVAL_S = 0.5  # child CPU / memory sampling (needs psutil)
+
+# Log retention: applied in the background at startup
+LOG_RETENTION_ENABLED = True
+LOG_MAX_AGE_DAYS = 90
+LOG_MAX_TOTAL_BYTES = 200 * 1024 * 1024
+LOG_MAX_FILE_BYTES = 20 * 1024 * 1024  # per file; larger runs roll over
+LOG_COMPRESS_FINISHED = True           # gzip runs other than the current one
+LOG_ACTIVE_GRACE_S = 3600              # files written this recently are left alone
+
+# Run history (SQLite), built incrementally from the JSONL logs
+HISTORY_DB = BASE_DIR / "history.sqlite3"
+
+# Skip-if-recently-succeeded policies (ignored with --force)
+TASK_STATE_FILE = BASE_DIR / "task_state.json"
+DISM_MIN_INTERVAL_DAYS = 7        # DISM at most weekly
+SFC_MAX_INTERVAL_DAYS = 30        # SFC when the last scan found problems, else monthly
+UPDATES_MIN_INTERVAL_HOURS = 20   # Windows Update at most once a day
+
+# Multi-host orchestration (cli.py orchestrate)
+ORCHESTRATOR_MAX_PARALLEL = 8     # hosts running at the same time
+ORCHESTRATOR_HANDSHAKE_S = 30     # wait for the agent's hello
+ORCHESTRATOR_LOG_TAIL = 200       # last log lines kept per host in the report
+
+# Progress / ETA: tasks are weighted by their median duration in the run
+# history; these are used until a task has history
+TASK_DEFAULT_DURATION_S = 30
+SLOW_TASK_DEFAULT_DURATION_S = 15 * 60
+HISTORY_DURATION_SAMPLES = 10
+PROGRESS_REPORT_INTERVAL_S = 0.5
+
+# Free space is sampled before and after every task (not in dry-run) to
+# log what each task reclaimed. None: every fixed local volume
+SPACE_ACCOUNTING_ENABLED = True
+SPACE_VOLUMES = None   # e.g. ["C:\\", "D:\\"]
+
+# Cancel escalation for terminable subprocesses: polite stop of the process
+# tree, forced kill after CANCEL_KILL_AFTER_S, then stop waiting for output
+CANCEL_KILL_AFTER_S = 2.0
+CANCEL_DRAIN_S = 1.0
+
+# Watchdog: wall-clock limit per task and, for tasks that keep printing,
+# the longest silence allowed. Terminable tasks are stopped, the others
+# (SFC, DISM, updates) are detached and left to finish on their own.
+CLEANMGR_TIMEOUT_S = 45 * 60          # cleanmgr prints nothing: no idle limit
+STORAGE_SENSE_TIMEOUT_S = 15 * 60
+SFC_TIMEOUT_S = 2 * 3600
+DISM_TIMEOUT_S = 3 * 3600
+UPDATES_TIMEOUT_S = 3 * 3600
+UPDATES_IDLE_TIMEOUT_S = 3600
+
+# Child process output is read as bytes and decoded incrementally.
+# Output encoding is detected (BOM / UTF-16 / UTF-8, else the OEM code
+# page) unless set here, e.g. "utf-16-le" or "cp850". A line that grows
+# past PROCESS_MAX_LINE_CHARS without a line break is cut there.
+PROCESS_OUTPUT_ENCODING = None
+PROCESS_MAX_LINE_CHARS = 1024 * 1024
+
+# What run_command / run_ps keep of a command's output for ProcResult
+# (every line is logged and passed to line consumers either way):
+# "tail" the last PROCESS_TAIL_LINES lines, at most PROCESS_TAIL_CHARS
+# characters; "none" nothing; "all" also the complete output in a
+# temporary file, held in memory up to PROCESS_SPILL_BYTES.
+PROCESS_CAPTURE = "tail"
+PROCESS_TAIL_LINES = 200
+PROCESS_TAIL_CHARS = 64 * 1024
+PROCESS_SPILL_BYTES = 1024 * 1024
@@ -0,0 +1,114 @@
+"""
+Free-space accounting: the runner samples free space on the local volumes
+before and after every task, so each run logs what a task actually
+reclaimed (and how fast), not just what it says it deleted.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+import os
+import shutil
+import tempfile
+import time
+from typing import Iterable, Optional
+
+_DRIVE_FIXED = 3
+
+
+def local_volumes() -> list[str]:
+    """
+    Fixed local volumes: drive roots on Windows; elsewhere the mount
+    points holding /, the temp directory and the home directory.
+    """
+    if os.name == "nt":
+        import ctypes
+
+        k32 = ctypes.windll.kernel32
+        mask = k32.GetLogicalDrives()
+        roots = [f"{chr(ord('A') + i)}:\\" for i in range(26) if mask >> i & 1]
+        return [r for r in roots if k32.GetDriveTypeW(r) == _DRIVE_FIXED]
+
+    volumes: list[str] = []
+    seen: set[int] = set()
+    for path in ("/", tempfile.gettempdir(), os.path.expanduser("~")):
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            continue
+        if dev not in seen:
+            seen.add(dev)
+            volumes.append(_mount_point(path))
+    return volumes
+
+
+def _mount_point(path: str) -> str:
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def free_bytes(volumes: Iterable[str]) -> dict[str, int]:
+    """Free bytes per volume; volumes that cannot be queried are left out."""
+    free: dict[str, int] = {}
+    for v in volumes:
+        try:
+            free[v] = shutil.disk_usage(v).free
+        except OSError:
+            pass
+    return free
+
+
+@dataclass
+class SpaceMeter:
+    """
+    Free space of `volumes` around one task. `overlapped` is set by the
+    runner when other tasks ran at the same time: their changes are
+    counted too.
+    """
+    volumes: list[str]
+    before: dict[str, int] = field(default_factory=dict)
+    after: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+    overlapped: bool = False
+    _t0: float = field(default=0.0, repr=False)
+
+    def start(self) -> None:
+        self.before = free_bytes(self.volumes)
+        self._t0 = time.monotonic()
+
+    def stop(self) -> None:
+        self.seconds = time.monotonic() - self._t0
+        self.after = free_bytes(self.volumes)
+
+    @property
+    def done(self) -> bool:
+        return bool(self.after)
+
+    def per_volume(self) -> dict[str, int]:
+        """Bytes reclaimed per volume (negative: the task used space)."""
+        return {v: self.after[v] - b for v, b in self.before.items()
+                if v in self.after}
+
+    @property
+    def reclaimed(self) -> int:
+        return sum(self.per_volume().values())
+
+    @property
+    def rate(self) -> Optional[float]:
+        """Bytes reclaimed per second of task runtime."""
+        return self.reclaimed / self.seconds if self.seconds > 0 else None
+
+    def as_event(self) -> dict:
+        rate = self.rate
+        return {
+            "reclaimed_bytes": self.reclaimed,
+            "seconds": round(self.seconds, 3),
+            "bytes_per_s": None if rate is None else round(rate),
+            "overlapped": self.overlapped,
+            "volumes": {v: {"before": self.before[v], "after": self.after[v],
+                            "reclaimed": n}
+                        for v, n in self.per_volume().items()},
+        }
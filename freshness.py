@@ -0,0 +1,135 @@
+"""
+Freshness policies: skip expensive tasks that succeeded recently.
+
+run_tasks asks a task's policy before starting it, using the last result
+recorded for that task in TASK_STATE_FILE. Context.force (cli --force)
+bypasses every policy.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Protocol
+
+from config import TASK_STATE_FILE
+
+
+def _fmt_age(seconds: float) -> str:
+    if seconds < 2 * 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 2 * 86400:
+        return f"{seconds / 3600:.0f} h"
+    return f"{seconds / 86400:.1f} days"
+
+
+class FreshnessPolicy(Protocol):
+    def skip_reason(self, record: Optional[dict], now: float) -> Optional[str]:
+        """None to run the task, else why it is skipped."""
+
+    def describe(self) -> str:
+        ...
+
+
+@dataclass(frozen=True)
+class AtMostEvery:
+    """Skip while the last success is younger than the interval."""
+    seconds: float
+
+    def skip_reason(self, record: Optional[dict], now: float) -> Optional[str]:
+        last = (record or {}).get("last_success")
+        if last is None or now - last >= self.seconds:
+            return None
+        return (f"succeeded {_fmt_age(now - last)} ago "
+                f"(runs at most every {_fmt_age(self.seconds)})")
+
+    def describe(self) -> str:
+        return f"at most every {_fmt_age(self.seconds)}"
+
+
+@dataclass(frozen=True)
+class OnlyIfProblems:
+    """
+    Skip while the last run succeeded with exit code 0 (nothing found),
+    unless that was more than max_age seconds ago. A crash, a non-zero
+    exit code or no record at all means the task runs.
+    """
+    max_age: float
+
+    def skip_reason(self, record: Optional[dict], now: float) -> Optional[str]:
+        if not record or record.get("status") != "ok" \
+                or record.get("exit_code") != 0:
+            return None
+        last = record.get("last_success")
+        if last is None or now - last >= self.max_age:
+            return None
+        return (f"last run {_fmt_age(now - last)} ago found no problems "
+                f"(rechecks after {_fmt_age(self.max_age)})")
+
+    def describe(self) -> str:
+        return f"only after problems, else every {_fmt_age(self.max_age)}"
+
+
+class TaskState:
+    """
+    Last result per task name: {"status", "exit_code", "last_run",
+    "last_success"}. Tasks report an exit code by returning an int.
+    Persisted as JSON with an atomic replace.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path = TASK_STATE_FILE) -> None:
+        self.path = Path(path)
+        self._tasks: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path = TASK_STATE_FILE) -> "TaskState":
+        state = cls(path)
+        try:
+            with open(state.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if raw.get("version") == cls.VERSION:
+                state._tasks = dict(raw.get("tasks") or {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return state
+
+    def get(self, name: str) -> Optional[dict]:
+        return self._tasks.get(name)
+
+    def skip_reason(self, name: str, policy: Optional[FreshnessPolicy],
+                    now: Optional[float] = None) -> Optional[str]:
+        if policy is None:
+            return None
+        return policy.skip_reason(self.get(name),
+                                  time.time() if now is None else now)
+
+    def record(self, name: str, status: str,
+               exit_code: Optional[int] = None) -> None:
+        now = time.time()
+        # A non-zero exit code (e.g. SFC found corrupt files) is not a success
+        success = status == "ok" and exit_code in (None, 0)
+        with self._lock:
+            prev = self._tasks.get(name) or {}
+            self._tasks[name] = {
+                "status": status,
+                "exit_code": exit_code,
+                "last_run": now,
+                "last_success": now if success else prev.get("last_success"),
+            }
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"version": self.VERSION, "tasks": dict(self._tasks)}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
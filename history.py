@@ -0,0 +1,575 @@
+"""
+Run history: a small SQLite database (HISTORY_DB) built from the JSONL logs.
+
+Every run span becomes a row in `runs`, every task span a row in `tasks`
+and every subprocess span a row in `commands`, so questions such as "how
+long did DISM take over the last 90 days" are answered from indexes
+instead of by reading old logs.
+
+Ingestion is incremental and restart-safe: per log (maintenance_<stamp>_<pid>,
+all rotated / gzipped parts) the database stores how far it has read,
+always at a point where no run is open, in the same transaction as the
+rows it produced. Logs that are finished are marked complete and never
+opened again; log retention may delete them without losing history.
+
+Logs written before structured spans (text records only) are read by
+their "=== MAINTENANCE START ===" / "--- Task (i/n) ---" headers. Task
+durations are then the time between consecutive headers, and such runs
+have no exit codes, bytes freed or commands.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import gzip
+import json
+import os
+from pathlib import Path
+import re
+import sqlite3
+import statistics
+import time
+from typing import Any, Optional
+
+from config import HISTORY_DB, LOG_ACTIVE_GRACE_S, LOG_DIR
+from log_retention import LOG_NAME_RE
+from logger import LOG_CLOSED_EVENT
+from process import pid_alive
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    stem      TEXT PRIMARY KEY,
+    part      INTEGER NOT NULL,
+    offset    INTEGER NOT NULL,
+    complete  INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       TEXT PRIMARY KEY,
+    source       TEXT NOT NULL,
+    started      TEXT NOT NULL,
+    ended        TEXT,
+    duration_s   REAL,
+    dry_run      INTEGER,
+    status       TEXT NOT NULL,
+    exit_code    INTEGER,
+    tasks_total  INTEGER NOT NULL DEFAULT 0,
+    tasks_failed INTEGER NOT NULL DEFAULT 0,
+    warnings     INTEGER NOT NULL DEFAULT 0,
+    errors       INTEGER NOT NULL DEFAULT 0,
+    bytes_freed  INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs(started);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id      TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    name        TEXT NOT NULL,
+    started     TEXT,
+    duration_s  REAL,
+    status      TEXT NOT NULL,
+    error       TEXT,
+    exit_code   INTEGER,
+    warnings    INTEGER NOT NULL DEFAULT 0,
+    errors      INTEGER NOT NULL DEFAULT 0,
+    bytes_freed INTEGER,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS tasks_name_started ON tasks(name, started);
+CREATE TABLE IF NOT EXISTS commands (
+    run_id      TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    task        TEXT,
+    name        TEXT NOT NULL,
+    cmd         TEXT,
+    started     TEXT,
+    duration_s  REAL,
+    exit_code   INTEGER
+);
+CREATE INDEX IF NOT EXISTS commands_run ON commands(run_id);
+"""
+# PRAGMA user_version; 1: legacy text-only logs are parsed
+SCHEMA_VERSION = 1
+
+
+# --------------------------------------------------
+# JSONL -> rows
+# --------------------------------------------------
+
+# Text headers of the runner, the only run structure in legacy logs
+_LEGACY_START = "=== MAINTENANCE START ==="
+_LEGACY_END = {"=== MAINTENANCE COMPLETE ===": False,
+               "=== MAINTENANCE CANCELLED ===": True}
+_LEGACY_TASK_RE = re.compile(r"^--- (?P<name>.+) \((?P<i>\d+)/(?P<n>\d+)\) ---$")
+_LEGACY_CRASH = "Task crashed: "
+# Key of the legacy run in _RunParser.open (never a span id)
+_LEGACY = "legacy"
+
+
+def is_legacy(run_id: str) -> bool:
+    """Whether a run was read from a legacy (text-only) log."""
+    return run_id.split(":")[1:2] == [_LEGACY]
+
+
+def _seconds(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    try:
+        return (datetime.fromisoformat(end)
+                - datetime.fromisoformat(start)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class _Task:
+    name: str
+    started: Optional[str] = None
+    duration_s: Optional[float] = None
+    status: str = "ok"
+    error: Optional[str] = None
+    exit_code: Optional[int] = None
+    warnings: int = 0
+    errors: int = 0
+    bytes_freed: Optional[int] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.status not in ("ok", "fresh")
+
+
+@dataclass
+class _Run:
+    run_id: str
+    dry_run: Optional[bool] = None
+    started: str = ""
+    ended: Optional[str] = None
+    duration_s: Optional[float] = None
+    cancelled: bool = False
+    incomplete: bool = False  # no span_end: the process died mid-run
+    exit_code: Optional[int] = None
+    warnings: int = 0
+    errors: int = 0
+    tasks: dict[str, _Task] = field(default_factory=dict)
+    commands: list[tuple] = field(default_factory=list)
+
+    def task(self, name: str) -> _Task:
+        t = self.tasks.get(name)
+        if t is None:
+            t = self.tasks[name] = _Task(name)
+        return t
+
+    @property
+    def status(self) -> str:
+        if self.incomplete:
+            return "incomplete"
+        if self.cancelled:
+            return "cancelled"
+        if self.errors or any(t.failed for t in self.tasks.values()):
+            return "failed"
+        return "ok"
+
+
+class _RunParser:
+    """
+    Folds the records of one log into finished runs. Spans are mapped to
+    their run and task through the parent ids, so warnings / errors logged
+    from subprocesses and phases count towards the task that ran them.
+    Records without a span id may come from a legacy log: see _legacy.
+    """
+
+    def __init__(self, stem: str) -> None:
+        self.stem = stem
+        self.open: dict[str, _Run] = {}                 # run span id -> run
+        self.owner: dict[str, tuple[str, Optional[str]]] = {}  # span -> (run span, task)
+        self.finished: list[_Run] = []
+        self.last: Optional[_Run] = None
+        self.closed = False     # saw the writer's LOG_CLOSED_EVENT
+
+    @property
+    def idle(self) -> bool:
+        return not self.open
+
+    def feed(self, rec: dict[str, Any]) -> None:
+        level = rec.get("level")
+        data = rec.get("data") or {}
+        if "span" not in rec and level in ("INFO", "WARN", "ERROR"):
+            self._legacy(rec, level)
+            return
+        if level == "EVENT":
+            msg = rec.get("message")
+            if msg == "span_start":
+                self._span_start(rec, data)
+            elif msg == "span_end":
+                self._span_end(data)
+            elif msg == "task_result":
+                run = self.open.get(data.get("run"))
+                if run is not None:
+                    t = run.task(data.get("name", "?"))
+                    t.status = data.get("status", t.status)
+                    t.error = data.get("error") or t.error
+                    if t.duration_s is None:
+                        t.duration_s = data.get("duration_s")
+                    if data.get("exit_code") is not None:
+                        t.exit_code = data["exit_code"]
+            elif msg == LOG_CLOSED_EVENT:
+                self.closed = True
+            elif msg == "exit" and self.last is not None:
+                self.last.exit_code = data.get("code")
+        elif level in ("WARN", "ERROR"):
+            owner = self.owner.get(rec.get("span"))
+            run = self.open.get(owner[0]) if owner else None
+            if run is None:
+                return
+            task = run.task(owner[1]) if owner[1] else None
+            if level == "WARN":
+                run.warnings += 1
+                if task:
+                    task.warnings += 1
+            else:
+                run.errors += 1
+                if task:
+                    task.errors += 1
+
+    def _span_start(self, rec: dict, data: dict) -> None:
+        sid, kind = data.get("id"), data.get("kind")
+        if kind == "run":
+            # Span ids are unique per writer process (pid prefix). Older
+            # logs restart them per process and several processes started
+            # in the same second shared one file: the start time keeps
+            # those run ids apart
+            run = _Run(f"{self.stem}:{sid}:{rec.get('ts', '')}",
+                       dry_run=(data.get("attrs") or {}).get("dry_run"),
+                       started=rec.get("ts", ""))
+            self.open[sid] = run
+            self.owner[sid] = (sid, None)
+            return
+        parent = self.owner.get(data.get("parent"))
+        if parent is None:
+            return  # span outside any run (e.g. a standalone command)
+        if kind == "task":
+            self.owner[sid] = (parent[0], data.get("name"))
+            run = self.open.get(parent[0])
+            if run is not None:
+                run.task(data.get("name")).started = rec.get("ts")
+        else:
+            self.owner[sid] = parent
+
+    def _span_end(self, data: dict) -> None:
+        sid, kind = data.get("id"), data.get("kind")
+        owner = self.owner.pop(sid, None)
+        if owner is None:
+            return
+        run = self.open.get(owner[0])
+        if run is None:
+            return
+        attrs = data.get("attrs") or {}
+        counters = data.get("counters") or {}
+
+        if kind == "run":
+            run.started = data.get("start") or run.started
+            run.ended = data.get("end")
+            run.duration_s = data.get("duration_s")
+            run.cancelled = bool(attrs.get("cancelled"))
+            del self.open[sid]
+            self.finished.append(run)
+            self.last = run
+        elif kind == "task":
+            t = run.task(data.get("name"))
+            t.started = data.get("start") or t.started
+            t.duration_s = data.get("duration_s")
+            if data.get("status") == "error":
+                t.status = "crashed"
+            if "bytes_freed" in counters:
+                t.bytes_freed = int(counters["bytes_freed"])
+        elif kind == "subprocess":
+            rc = attrs.get("exit_code")
+            run.commands.append((owner[1], data.get("name"), attrs.get("cmd"),
+                                 data.get("start"), data.get("duration_s"), rc))
+            if owner[1] and rc is not None:
+                t = run.task(owner[1])
+                # Keep the first failing exit code, else the last one
+                if t.exit_code in (None, 0):
+                    t.exit_code = rc
+
+    def _legacy(self, rec: dict, level: str) -> None:
+        """
+        Text records outside any span. Structured logs only have a few of
+        these (the header, standalone commands); in legacy logs they are
+        everything, and the runner's headers delimit runs and tasks.
+        """
+        msg = (rec.get("message") or "").strip()
+        ts = rec.get("ts") or ""
+        run = self.open.get(_LEGACY)
+        if msg == _LEGACY_START:
+            if run is not None:
+                self.abandon_open()  # started again: the last one died
+            self.open[_LEGACY] = _Run(f"{self.stem}:{_LEGACY}:{ts}", started=ts)
+            return
+        if run is None:
+            return
+        current = list(run.tasks.values())[-1] if run.tasks else None
+        m = _LEGACY_TASK_RE.match(msg)
+        if m:
+            self._legacy_task_done(current, ts)
+            run.task(m["name"]).started = ts
+        elif msg in _LEGACY_END:
+            self._legacy_task_done(current, ts)
+            run.ended = ts
+            run.duration_s = _seconds(run.started, ts)
+            run.cancelled = _LEGACY_END[msg]
+            del self.open[_LEGACY]
+            self.finished.append(run)
+            self.last = run
+        elif msg.startswith("Dry-run: "):
+            run.dry_run = msg == "Dry-run: True"
+        elif level == "WARN":
+            run.warnings += 1
+            if current is not None:
+                current.warnings += 1
+        elif level == "ERROR":
+            run.errors += 1
+            if current is not None:
+                current.errors += 1
+                if msg == _LEGACY_CRASH + current.name:
+                    current.status = "crashed"
+
+    @staticmethod
+    def _legacy_task_done(task: Optional[_Task], ts: str) -> None:
+        # Tasks ran one after another: the next header ends this one
+        if task is not None and task.duration_s is None:
+            task.duration_s = _seconds(task.started, ts)
+
+    def abandon_open(self) -> None:
+        """Runs that never ended (the app died): kept as 'incomplete'."""
+        for run in self.open.values():
+            run.incomplete = True
+            self.finished.append(run)
+        self.open.clear()
+
+
+def _log_parts(log_dir: Path) -> dict[str, list[tuple[int, Path, bool]]]:
+    """stem -> [(part, path, gz)] of its JSONL files, by part number."""
+    streams: dict[str, dict[int, tuple[Path, bool]]] = {}
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return {}
+    for name in names:
+        m = LOG_NAME_RE.match(name)
+        if not m or m["ext"] != "jsonl":
+            continue
+        part = int(m["part"] or 1)
+        parts = streams.setdefault(m["run"], {})
+        gz = bool(m["gz"])
+        # Mid-compression both exist; the plain file is authoritative
+        if part not in parts or parts[part][1]:
+            parts[part] = (log_dir / name, gz)
+    return {stem: [(n, p, gz) for n, (p, gz) in sorted(parts.items())]
+            for stem, parts in streams.items()}
+
+
+# --------------------------------------------------
+# Store
+# --------------------------------------------------
+
+class HistoryStore:
+    def __init__(self, path: Path = HISTORY_DB) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A scheduled run and the GUI may write at the same time
+        self.db = sqlite3.connect(str(path), timeout=10)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self) -> None:
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with self.db:
+            if version < 1:
+                # Legacy logs were read as empty and marked complete
+                self.db.execute(
+                    "DELETE FROM sources WHERE complete AND stem NOT IN "
+                    "(SELECT source FROM runs)")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "HistoryStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------- ingestion ----------------
+
+    def sync(self, log_dir: Path = LOG_DIR) -> int:
+        """Ingests new records from every log; returns the number of new runs."""
+        done = {r["stem"]: r for r in self.db.execute("SELECT * FROM sources")}
+        added = 0
+        for stem, parts in _log_parts(Path(log_dir)).items():
+            state = done.get(stem)
+            if state is not None and state["complete"]:
+                continue
+            added += self._ingest(stem, parts, state)
+        return added
+
+    def _ingest(self, stem: str, parts, state) -> int:
+        start_part = state["part"] if state else 1
+        start_offset = state["offset"] if state else 0
+        parser = _RunParser(stem)
+        ck_part, ck_offset = start_part, start_offset
+        part, offset = start_part, start_offset
+        now = time.time()
+        m = LOG_NAME_RE.match(parts[0][1].name)
+        pid = m["pid"] if m else None
+        # Checked before reading: a writer that is gone has written its
+        # last line, whatever is read below
+        writer_gone = pid is not None and not pid_alive(int(pid))
+        read_all = True     # every part opened, no line still being written
+        quiet = True        # nothing written within LOG_ACTIVE_GRACE_S
+
+        for part, path, gz in parts:
+            if part < start_part:
+                continue
+            try:
+                st = path.stat()
+                if not gz and now - st.st_mtime < LOG_ACTIVE_GRACE_S:
+                    quiet = False
+                f = gzip.open(path, "rb") if gz else open(path, "rb")
+            except OSError:
+                read_all = writer_gone = False
+                break
+            with f:
+                offset = start_offset if part == start_part else 0
+                if offset:
+                    f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        read_all = False
+                        break  # line still being written
+                    offset += len(raw)
+                    try:
+                        parser.feed(json.loads(raw))
+                    except ValueError:
+                        pass
+                    if parser.idle:
+                        ck_part, ck_offset = part, offset
+
+        # Finished when the writer closed the log or is no longer running;
+        # an idle log of a live process (e.g. an open GUI) is not. Only
+        # logs named before the pid was part of the name fall back to
+        # their age, since their writer cannot be identified
+        if parser.closed:
+            finished = read_all
+        elif pid is not None:
+            finished = writer_gone
+        else:
+            finished = read_all and quiet
+
+        if finished and not parser.idle:
+            parser.abandon_open()
+            ck_part, ck_offset = part, offset
+
+        with self.db:
+            for run in parser.finished:
+                self._store_run(stem, run)
+            self.db.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)",
+                (stem, ck_part, ck_offset, int(finished)))
+        return len(parser.finished)
+
+    def _store_run(self, stem: str, run: _Run) -> None:
+        tasks = list(run.tasks.values())
+        freed = [t.bytes_freed for t in tasks if t.bytes_freed is not None]
+        self.db.execute("DELETE FROM runs WHERE run_id = ?", (run.run_id,))
+        self.db.execute(
+            "INSERT INTO runs VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (run.run_id, stem, run.started, run.ended, run.duration_s,
+             None if run.dry_run is None else int(run.dry_run), run.status,
+             run.exit_code, len(tasks),
+             sum(t.failed for t in tasks), run.warnings, run.errors,
+             sum(freed) if freed else None))
+        self.db.executemany(
+            "INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?,?,?)",
+            [(run.run_id, t.name, t.started, t.duration_s, t.status, t.error,
+              t.exit_code, t.warnings, t.errors, t.bytes_freed)
+             for t in tasks])
+        self.db.executemany(
+            "INSERT INTO commands VALUES (?,?,?,?,?,?,?)",
+            [(run.run_id, *c) for c in run.commands])
+
+    # ---------------- queries ----------------
+
+    @staticmethod
+    def _since(days: Optional[float]) -> str:
+        if days is None:
+            return ""
+        return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    def runs(self, *, limit: int = 20, days: Optional[float] = None) -> list[dict]:
+        """Most recent runs first."""
+        rows = self.db.execute(
+            "SELECT * FROM runs WHERE started >= ? "
+            "ORDER BY started DESC LIMIT ?", (self._since(days), limit))
+        return [dict(r) for r in rows]
+
+    def task_runs(self, name: str, *, days: Optional[float] = None,
+                  limit: int = 1000) -> list[dict]:
+        """Every execution of one task, most recent first."""
+        rows = self.db.execute(
+            "SELECT t.*, r.dry_run FROM tasks t JOIN runs r USING (run_id) "
+            "WHERE t.name = ? AND t.started >= ? "
+            "ORDER BY t.started DESC LIMIT ?",
+            (name, self._since(days), limit))
+        return [dict(r) for r in rows]
+
+    def task_stats(self, *, days: Optional[float] = None,
+                   name: Optional[str] = None) -> list[dict]:
+        """Per task: runs, failures, min / avg / max duration, bytes freed."""
+        sql = ("SELECT name, COUNT(*) AS runs, "
+               "SUM(status NOT IN ('ok', 'fresh')) AS failed, "
+               "MIN(duration_s) AS min_s, AVG(duration_s) AS avg_s, "
+               "MAX(duration_s) AS max_s, "
+               "SUM(warnings) AS warnings, SUM(errors) AS errors, "
+               "SUM(bytes_freed) AS bytes_freed, MAX(started) AS last_run "
+               "FROM tasks WHERE started >= ?")
+        args: list[Any] = [self._since(days)]
+        if name is not None:
+            sql += " AND name = ?"
+            args.append(name)
+        sql += " GROUP BY name ORDER BY name"
+        return [dict(r) for r in self.db.execute(sql, args)]
+
+    def median_durations(self, names: list[str], *, dry_run: bool = False,
+                         samples: int = 10) -> dict[str, float]:
+        """Median of the last `samples` successful runs per task name."""
+        medians: dict[str, float] = {}
+        for name in names:
+            rows = self.db.execute(
+                "SELECT t.duration_s FROM tasks t JOIN runs r USING (run_id) "
+                "WHERE t.name = ? AND t.status = 'ok' AND r.dry_run = ? "
+                "AND t.duration_s IS NOT NULL "
+                "ORDER BY t.started DESC LIMIT ?",
+                (name, int(dry_run), samples)).fetchall()
+            if rows:
+                medians[name] = statistics.median(r[0] for r in rows)
+        return medians
+
+    def legacy_runs(self, *, days: Optional[float] = None) -> int:
+        """Number of runs read from legacy (text-only) logs."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM runs WHERE started >= ? AND run_id LIKE ?",
+            (self._since(days), f"%:{_LEGACY}:%")).fetchone()[0]
+
+    def commands(self, run_id: str) -> list[dict]:
+        rows = self.db.execute(
+            "SELECT * FROM commands WHERE run_id = ? ORDER BY started",
+            (run_id,))
+        return [dict(r) for r in rows]
+
+
+def sync_quietly(log_dir: Path = LOG_DIR) -> None:
+    """Post-run ingestion; history must never fail a maintenance run."""
+    try:
+        with HistoryStore() as store:
+            store.sync(log_dir)
+    except Exception:
+        pass
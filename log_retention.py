@@ -0,0 +1,195 @@
+"""
+Retention for LOG_DIR: age limit, total-size limit and gzip compression of
+finished runs. Files are grouped by run (maintenance_<stamp>_<pid>, including
+rotated .pN parts); the protected run and anything written in the last
+LOG_ACTIVE_GRACE_S are never touched.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+import gzip
+import os
+from pathlib import Path
+import re
+import shutil
+import threading
+import time
+from typing import Callable, Optional
+
+from config import (
+    LOG_MAX_AGE_DAYS, LOG_MAX_TOTAL_BYTES, LOG_COMPRESS_FINISHED,
+    LOG_ACTIVE_GRACE_S,
+)
+
+# maintenance_20250101_030000_<pid>[.p2].log|.jsonl[.gz]; logs from before
+# the writer's pid was part of the name have none
+LOG_NAME_RE = re.compile(
+    r"^(?P<run>maintenance_\d{8}_\d{6}(?:_(?P<pid>\d+))?)"
+    r"(?:\.p(?P<part>\d+))?\.(?P<ext>log|jsonl)(?P<gz>\.gz)?$")
+
+
+@dataclass
+class RetentionReport:
+    removed: list[str] = field(default_factory=list)
+    compressed: list[str] = field(default_factory=list)
+    bytes_removed: int = 0
+    bytes_saved: int = 0
+    errors: list[str] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "removed": len(self.removed),
+            "compressed": len(self.compressed),
+            "bytes_removed": self.bytes_removed,
+            "bytes_saved": self.bytes_saved,
+            "errors": self.errors[:20],
+        }
+
+
+@dataclass
+class _LogFile:
+    path: Path
+    run: str
+    size: int
+    mtime: float
+    gz: bool
+
+
+def _list_logs(log_dir: Path) -> list[_LogFile]:
+    files = []
+    try:
+        it = os.scandir(log_dir)
+    except OSError:
+        return files
+    with it:
+        for entry in it:
+            m = LOG_NAME_RE.match(entry.name)
+            if not m or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            files.append(_LogFile(Path(entry.path), m["run"], st.st_size,
+                                  st.st_mtime, bool(m["gz"])))
+    return files
+
+
+def _remove(f: _LogFile, report: RetentionReport) -> None:
+    try:
+        os.remove(f.path)
+        report.removed.append(f.path.name)
+        report.bytes_removed += f.size
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        report.errors.append(f"{f.path.name}: {e}")
+
+
+def _compress(f: _LogFile, report: RetentionReport) -> Optional[_LogFile]:
+    dst = f.path.with_name(f.path.name + ".gz")
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        with open(f.path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as out:
+            shutil.copyfileobj(src, out, 1024 * 1024)
+        os.utime(tmp, (f.mtime, f.mtime))
+        os.replace(tmp, dst)
+        # Fails on Windows if a writer still holds the file; keep both then
+        os.remove(f.path)
+    except OSError as e:
+        for p in (tmp, dst):
+            try:
+                if p.exists() and f.path.exists():
+                    os.remove(p)
+            except OSError:
+                pass
+        report.errors.append(f"{f.path.name}: {e}")
+        return None
+
+    size = dst.stat().st_size
+    report.compressed.append(f.path.name)
+    report.bytes_saved += f.size - size
+    return _LogFile(dst, f.run, size, f.mtime, True)
+
+
+def apply_retention(
+    log_dir: Path,
+    *,
+    protect_run: Optional[str] = None,
+    max_age_days: Optional[float] = LOG_MAX_AGE_DAYS,
+    max_total_bytes: Optional[int] = LOG_MAX_TOTAL_BYTES,
+    compress: bool = LOG_COMPRESS_FINISHED,
+    grace_s: float = LOG_ACTIVE_GRACE_S,
+    now: Optional[float] = None,
+) -> RetentionReport:
+    """
+    1. deletes runs older than max_age_days,
+    2. gzips the remaining uncompressed files of finished runs,
+    3. deletes the oldest runs until the directory fits max_total_bytes.
+    Protected files still count towards the size limit.
+    """
+    report = RetentionReport()
+    now = time.time() if now is None else now
+
+    files = _list_logs(Path(log_dir))
+
+    def protected(f: _LogFile) -> bool:
+        return f.run == protect_run or now - f.mtime < grace_s
+
+    runs: dict[str, list[_LogFile]] = {}
+    for f in files:
+        runs.setdefault(f.run, []).append(f)
+
+    kept: dict[str, list[_LogFile]] = {}
+    for run, group in runs.items():
+        if any(protected(f) for f in group):
+            kept[run] = group
+            continue
+        newest = max(f.mtime for f in group)
+        if max_age_days is not None and now - newest > max_age_days * 86400:
+            for f in group:
+                _remove(f, report)
+            continue
+        if compress:
+            group = [(_compress(f, report) or f) if not f.gz else f
+                     for f in group]
+        kept[run] = group
+
+    if max_total_bytes is not None:
+        total = sum(f.size for group in kept.values() for f in group)
+        # Oldest run first (run ids sort chronologically)
+        for run in sorted(kept):
+            if total <= max_total_bytes:
+                break
+            group = kept[run]
+            if any(protected(f) for f in group):
+                continue
+            for f in group:
+                _remove(f, report)
+                total -= f.size
+
+    return report
+
+
+def start_background(
+    log_dir: Path,
+    *,
+    protect_run: Optional[str],
+    on_done: Optional[Callable[[RetentionReport], None]] = None,
+    **kw,
+) -> threading.Thread:
+    """Runs apply_retention on a daemon thread so startup never waits on it."""
+
+    def work() -> None:
+        try:
+            report = apply_retention(log_dir, protect_run=protect_run, **kw)
+        except Exception as e:
+            report = RetentionReport(errors=[str(e)])
+        if on_done:
+            try:
+                on_done(report)
+            except Exception:
+                pass
+
+    t = threading.Thread(target=work, name="log-retention", daemon=True)
+    t.start()
+    return t
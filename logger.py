@@ -2,14 +2,37 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
+import atexit
+import contextvars
+import itertools
 import json
+import os
+import queue
+import re
+import sys
 import threading
-from typing import Any, Callable, Optional
+import time
+from typing import Any, Callable, Optional, Union
 
-from config import LOG_DIR, APP_NAME, APP_VERSION
+from config import (
+    LOG_DIR, APP_NAME, APP_VERSION,
+    LOG_QUEUE_MAX, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_S, LOG_ENQUEUE_TIMEOUT_S,
+    LOG_MAX_FILE_BYTES, LOG_RETENTION_ENABLED, SPANS_ENABLED,
+    LOG_COALESCE_ENABLED, LOG_REPEAT_SUMMARY_S, LOG_RATE_LINES_PER_S,
+    LOG_RATE_BURST,
+)
 
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+_TEXT = 0
+_JSON = 1
+_FLUSH = 2
+_STOP = 3
+
+# Last JSONL record of a log that was closed normally (history uses it to
+# tell a finished log from one that is still being written)
+LOG_CLOSED_EVENT = "log_closed"
+
 
 @dataclass(frozen=True)
 class LogPaths:
@@ -17,19 +40,488 @@ class LogPaths:
     jsonl: Path
 
 
+@dataclass
+class WriterStats:
+    written: int = 0
+    batches: int = 0
+    delayed: int = 0   # enqueue had to wait for room in the queue
+    dropped: int = 0   # queue stayed full past LOG_ENQUEUE_TIMEOUT_S
+                       # (at once on the event loop thread, which never waits)
+
+
 def _utc_ts() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+# --------------------------------------------------
+# Spans
+# --------------------------------------------------
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = \
+    contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed section of work (run, task, subprocess, phase) written to the
+    JSONL log as span_start / span_end events. Spans nest through a
+    context variable; worker threads inherit it via contextvars.copy_context.
+    Counters may be updated from any thread.
+    """
+
+    __slots__ = ("_logger", "id", "parent", "kind", "name", "attrs",
+                 "counters", "_lock", "_start", "_t0", "_token")
+
+    def __init__(self, logger: "Logger", kind: str, name: str,
+                 attrs: dict[str, Any]) -> None:
+        self._logger = logger
+        self.id = logger._next_span_id()
+        parent = _current_span.get()
+        self.parent = parent.id if parent is not None else None
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+        self.counters: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._start = ""
+        self._t0 = 0.0
+        self._token = None
+
+    def add(self, key: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def peak(self, key: str, value: float) -> None:
+        with self._lock:
+            if value > self.counters.get(key, value - 1):
+                self.counters[key] = value
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        self._start = _utc_ts()
+        self._t0 = time.perf_counter()
+        self._token = _current_span.set(self)
+        self._logger.event("span_start", id=self.id, parent=self.parent,
+                           kind=self.kind, name=self.name, attrs=self.attrs)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self._t0
+        self._logger.end_source(self.id)
+        _current_span.reset(self._token)
+        with self._lock:
+            counters = dict(self.counters)
+        self._logger.event(
+            "span_end", id=self.id, parent=self.parent, kind=self.kind,
+            name=self.name, start=self._start, end=_utc_ts(),
+            duration_s=round(duration, 6),
+            status="error" if exc_type else "ok",
+            counters=counters, attrs=self.attrs)
+
+
+class _NullSpan:
+    """Stand-in when spans are disabled; every call is a no-op."""
+
+    __slots__ = ()
+    id = None
+
+    def add(self, key: str, n: float = 1) -> None:
+        pass
+
+    def peak(self, key: str, value: float) -> None:
+        pass
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+AnySpan = Union[Span, _NullSpan]
+
+
+def current_span() -> AnySpan:
+    """The innermost open span of this thread / context (or NULL_SPAN)."""
+    return _current_span.get() or NULL_SPAN
+
+
+# --------------------------------------------------
+# Coalescing
+# --------------------------------------------------
+
+_DIGITS_RE = re.compile(r"\d+")
+
+# (level, message, data); data None means the caller's own data
+_Record = tuple[str, str, Optional[dict]]
+
+
+class _Source:
+    """Coalescing state of one source (span or thread)."""
+
+    __slots__ = ("key", "level", "repeats", "last", "first_ts", "last_ts",
+                 "summary_ts", "tokens", "refill_ts", "dropped", "drop_ts")
+
+    def __init__(self, now: float, burst: float) -> None:
+        self.key: Optional[str] = None
+        self.level = ""
+        self.repeats = 0
+        self.last = ""
+        self.first_ts = self.last_ts = self.summary_ts = now
+        self.tokens = burst
+        self.refill_ts = now
+        self.dropped = 0
+        self.drop_ts = now
+
+
+class _Coalescer:
+    """
+    Decides, per source, which lines are written:
+      - a line equal to the previous one of its source (digits ignored,
+        so "45%" and "46%" match) is counted, not written; a summary
+        "… repeated N times over T s" follows when the series ends, when
+        the source ends, and every LOG_REPEAT_SUMMARY_S while it lasts;
+      - other lines draw on a token bucket (rate, burst); lines beyond it
+        are counted and summarized every LOG_REPEAT_SUMMARY_S and when
+        the source ends;
+      - ERROR lines always pass (after any pending summary).
+    """
+
+    def __init__(self, *, rate: float = LOG_RATE_LINES_PER_S,
+                 burst: float = LOG_RATE_BURST,
+                 summary_s: float = LOG_REPEAT_SUMMARY_S) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.summary_s = summary_s
+        self.suppressed = 0
+        self._sources: dict[Any, _Source] = {}
+        self._lock = threading.Lock()
+
+    def admit(self, level: str, message: str, source: Any) -> list[_Record]:
+        now = time.monotonic()
+        key = _DIGITS_RE.sub("#", message)
+        out: list[_Record] = []
+        with self._lock:
+            st = self._sources.get(source)
+            if st is None:
+                st = self._sources[source] = _Source(now, self.burst)
+
+            if level != "ERROR" and key == st.key and level == st.level:
+                if not st.repeats:
+                    st.first_ts = st.summary_ts = now
+                st.repeats += 1
+                st.last = message
+                st.last_ts = now
+                self.suppressed += 1
+                if now - st.summary_ts >= self.summary_s:
+                    out.append(self._repeat_summary(st, now))
+                return out
+
+            if st.repeats:
+                out.append(self._repeat_summary(st, now))
+            st.key, st.level = key, level
+
+            if level != "ERROR" and self.rate:
+                st.tokens = min(self.burst,
+                                st.tokens + (now - st.refill_ts) * self.rate)
+                st.refill_ts = now
+                if st.tokens < 1:
+                    st.key = None  # never written: not a repeat base
+                    if not st.dropped:
+                        st.drop_ts = now
+                    st.dropped += 1
+                    self.suppressed += 1
+                    if now - st.drop_ts >= self.summary_s:
+                        out.append(self._drop_summary(st, now))
+                    return out
+                st.tokens -= 1
+            if st.dropped and now - st.drop_ts >= self.summary_s:
+                out.append(self._drop_summary(st, now))
+        out.append((level, message, None))
+        return out
+
+    def end(self, source: Any) -> list[_Record]:
+        """Pending summaries of a finished source."""
+        now = time.monotonic()
+        with self._lock:
+            st = self._sources.pop(source, None)
+            if st is None:
+                return []
+            out = []
+            if st.repeats:
+                out.append(self._repeat_summary(st, now))
+            if st.dropped:
+                out.append(self._drop_summary(st, now))
+            return out
+
+    def end_all(self) -> list[_Record]:
+        with self._lock:
+            sources = list(self._sources)
+        return [r for src in sources for r in self.end(src)]
+
+    @staticmethod
+    def _repeat_summary(st: _Source, now: float) -> _Record:
+        n = st.repeats
+        span = st.last_ts - st.first_ts
+        msg = f"  … repeated {n} time{'s' if n != 1 else ''} over {span:.1f} s"
+        if st.last:
+            msg += f" (last: {st.last.strip()})"
+        st.repeats = 0
+        st.summary_ts = now
+        return st.level, msg, {"coalesced": "repeat", "count": n,
+                               "duration_s": round(span, 3)}
+
+    def _drop_summary(self, st: _Source, now: float) -> _Record:
+        n = st.dropped
+        span = now - st.drop_ts
+        st.dropped = 0
+        st.drop_ts = now
+        return "WARN", (f"  … {n} line{'s' if n != 1 else ''} not logged "
+                        f"over {span:.1f} s (over {self.rate:g} lines/s)"), \
+            {"coalesced": "rate", "count": n, "duration_s": round(span, 3)}
+
+
+def part_path(path: Path, n: int) -> Path:
+    """maintenance_X.jsonl -> maintenance_X.p2.jsonl for rotated parts."""
+    return path if n <= 1 else path.with_name(f"{path.stem}.p{n}{path.suffix}")
+
+
+class _RotatingFile:
+    """Append-only text file that rolls over to a new part past max_bytes."""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.base = path
+        self.max_bytes = max_bytes
+        self.part = 1
+        self.path = path
+        self.f = open(path, "a", encoding="utf-8")
+        self.size = self.f.tell()
+
+    def write(self, line: str) -> None:
+        try:
+            self.f.write(line + "\n")
+            # Character count; close enough to bytes for a size cap
+            self.size += len(line) + 1
+            if self.max_bytes and self.size >= self.max_bytes:
+                self._roll()
+        except Exception:
+            pass
+
+    def _roll(self) -> None:
+        self.f.close()
+        self.part += 1
+        self.path = part_path(self.base, self.part)
+        self.f = open(self.path, "a", encoding="utf-8")
+        self.size = 0
+
+    def flush(self) -> None:
+        try:
+            self.f.flush()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        try:
+            self.f.close()
+        except Exception:
+            pass
+
+
+def _in_loop_thread() -> bool:
+    # aio is not imported here: until something has loaded it, no loop runs
+    aio = sys.modules.get("aio")
+    return aio is not None and aio.in_loop_thread()
+
+
+class _LogWriter:
+    """
+    Owns both log file handles on a single background thread.
+    Records are queued by any thread and written in batches; the files
+    are flushed every `batch_size` records or `flush_interval` seconds,
+    whichever comes first, and once more on close. Each file rolls over
+    to a new part (maintenance_X.p2.log, ...) past LOG_MAX_FILE_BYTES.
+    """
+
+    def __init__(
+        self,
+        paths: LogPaths,
+        *,
+        max_queue: int = LOG_QUEUE_MAX,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL_S,
+        max_file_bytes: int = LOG_MAX_FILE_BYTES,
+    ) -> None:
+        self.paths = paths
+        self.max_file_bytes = max_file_bytes
+        self.stats = WriterStats()
+        self._q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._loop, name="log-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------- producer side ----------------
+
+    def put(self, kind: int, payload: Any) -> None:
+        if self._closed:
+            return
+        try:
+            self._q.put_nowait((kind, payload))
+            return
+        except queue.Full:
+            pass
+        if _in_loop_thread():
+            # Waiting here would stall every command the loop is pumping
+            with self._stats_lock:
+                self.stats.dropped += 1
+            return
+        try:
+            self._q.put((kind, payload), timeout=LOG_ENQUEUE_TIMEOUT_S)
+            with self._stats_lock:
+                self.stats.delayed += 1
+        except queue.Full:
+            with self._stats_lock:
+                self.stats.dropped += 1
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until everything queued so far is on disk."""
+        if self._closed or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        self._q.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put((_STOP, None))
+        self._thread.join(timeout)
+
+    # ---------------- writer thread ----------------
+
+    def _loop(self) -> None:
+        text_f = json_f = None
+        try:
+            self.paths.text.parent.mkdir(parents=True, exist_ok=True)
+            text_f = _RotatingFile(self.paths.text, self.max_file_bytes)
+            json_f = _RotatingFile(self.paths.jsonl, self.max_file_bytes)
+        except Exception:
+            pass
+
+        pending = 0
+        first_pending = 0.0
+        stop = False
+
+        while not stop:
+            wait = None
+            if pending:
+                wait = max(0.0, first_pending +
+                           self._flush_interval - time.monotonic())
+            try:
+                batch = [self._q.get(timeout=wait)]
+            except queue.Empty:
+                batch = []
+
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._q.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters: list[threading.Event] = []
+            for kind, payload in batch:
+                if kind == _TEXT:
+                    if text_f:
+                        text_f.write(payload)
+                elif kind == _JSON:
+                    if json_f:
+                        json_f.write(json.dumps(
+                            payload, ensure_ascii=False, default=str))
+                elif kind == _FLUSH:
+                    waiters.append(payload)
+                    continue
+                else:
+                    stop = True
+                    continue
+                if not pending:
+                    first_pending = time.monotonic()
+                pending += 1
+                self.stats.written += 1
+
+            if pending and (
+                waiters or stop or pending >= self._batch_size
+                or time.monotonic() - first_pending >= self._flush_interval
+            ):
+                for f in (text_f, json_f):
+                    if f:
+                        f.flush()
+                self.stats.batches += 1
+                pending = 0
+
+            for ev in waiters:
+                ev.set()
+
+        if self.stats.dropped or self.stats.delayed:
+            note = (f"Log writer: {self.stats.dropped} record(s) dropped, "
+                    f"{self.stats.delayed} delayed (queue full)")
+            if text_f:
+                text_f.write(note)
+            if json_f:
+                json_f.write(json.dumps({
+                    "ts": _utc_ts(), "level": "WARN", "message": note,
+                    "data": {"dropped": self.stats.dropped,
+                             "delayed": self.stats.delayed},
+                }, ensure_ascii=False))
+        if json_f:
+            json_f.write(json.dumps({
+                "ts": _utc_ts(), "level": "EVENT",
+                "message": LOG_CLOSED_EVENT, "data": {},
+            }))
+
+        for f in (text_f, json_f):
+            if f:
+                f.close()
+
+
 class Logger:
-    def __init__(self) -> None:
+    def __init__(self, *, spans: bool = SPANS_ENABLED,
+                 coalesce: bool = LOG_COALESCE_ENABLED) -> None:
         stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # One file per process: agents, scheduled runs and the GUI may
+        # start in the same second (retention and history rely on it)
+        self.run_id = f"maintenance_{stamp}_{os.getpid()}"
         self.paths = LogPaths(
-            text=LOG_DIR / f"maintenance_{stamp}.log",
-            jsonl=LOG_DIR / f"maintenance_{stamp}.jsonl",
+            text=LOG_DIR / f"{self.run_id}.log",
+            jsonl=LOG_DIR / f"{self.run_id}.jsonl",
         )
-        self._lock = threading.Lock()
         self._ui_sink: Optional[Callable[[str], None]] = None
+        self.counts: dict[str, int] = {"INFO": 0, "WARN": 0, "ERROR": 0}
+        self._counts_lock = threading.Lock()
+        self.spans_enabled = spans
+        # Ids carry the writer's pid, so records of different processes
+        # never share a span id even if they end up in one log
+        self._span_prefix = format(os.getpid(), "x")
+        self._span_ids = itertools.count(1)
+        self._coalescer = _Coalescer() if coalesce else None
+        self._writer = _LogWriter(self.paths)
+        # Final flush on interpreter shutdown (normal exit or uncaught crash)
+        atexit.register(self.close)
+
+        if LOG_RETENTION_ENABLED:
+            # Never touches this run's files (or any part of them)
+            from log_retention import start_background
+            start_background(LOG_DIR, protect_run=self.run_id,
+                             on_done=self._retention_done)
 
         # Header
         self.info(f"{APP_NAME} v{APP_VERSION} started")
@@ -39,24 +531,68 @@ class Logger:
     def attach_ui_sink(self, sink: Callable[[str], None]) -> None:
         self._ui_sink = sink
 
+    def _retention_done(self, report) -> None:
+        if report.removed or report.compressed:
+            self.event("log_retention", **report.as_dict())
+
+    def _next_span_id(self) -> str:
+        return f"{self._span_prefix}.{next(self._span_ids):x}"
+
+    def span(self, kind: str, name: str, **attrs: Any) -> AnySpan:
+        """
+        Context manager timing a run / task / subprocess / phase.
+        Returns NULL_SPAN (free) when spans are disabled.
+        """
+        if not self.spans_enabled:
+            return NULL_SPAN
+        return Span(self, kind, name, attrs)
+
+    @property
+    def stats(self) -> WriterStats:
+        return self._writer.stats
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return self._writer.flush(timeout)
+
+    @property
+    def suppressed(self) -> int:
+        """Lines not written by coalescing / rate limiting."""
+        return self._coalescer.suppressed if self._coalescer else 0
+
+    def end_source(self, source: Any) -> None:
+        """Writes the pending coalescing summaries of a finished source."""
+        if self._coalescer is not None:
+            for level, message, data in self._coalescer.end(source):
+                self._output(level, message, data)
+
+    def close(self) -> None:
+        if self._coalescer is not None:
+            for level, message, data in self._coalescer.end_all():
+                self._output(level, message, data)
+            if self._coalescer.suppressed:
+                self.event("log_coalesced",
+                           suppressed=self._coalescer.suppressed)
+        self._writer.close()
+        atexit.unregister(self.close)
+
     def _write(self, line: str) -> None:
-        with self._lock:
-            try:
-                self.paths.text.parent.mkdir(parents=True, exist_ok=True)
-                with open(self.paths.text, "a", encoding="utf-8") as f:
-                    f.write(line + "\n")
-            except Exception:
-                pass
+        self._writer.put(_TEXT, line)
 
     def _write_json(self, obj: dict[str, Any]) -> None:
-        with self._lock:
-            try:
-                with open(self.paths.jsonl, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-            except Exception:
-                pass
+        self._writer.put(_JSON, obj)
 
     def _emit(self, level: str, message: str, **data: Any) -> None:
+        with self._counts_lock:
+            self.counts[level] = self.counts.get(level, 0) + 1
+        if self._coalescer is None:
+            self._output(level, message, data)
+            return
+        span = _current_span.get()
+        source = span.id if span is not None else threading.current_thread().name
+        for lvl, msg, extra in self._coalescer.admit(level, message, source):
+            self._output(lvl, msg, data if extra is None else extra)
+
+    def _output(self, level: str, message: str, data: dict) -> None:
         line = message
         if self._ui_sink:
             try:
@@ -65,11 +601,25 @@ class Logger:
                 pass
 
         self._write(line)
-        self._write_json({
+        record = {
             "ts": _utc_ts(),
             "level": level,
             "message": message,
             "data": data or {},
+        }
+        if self.spans_enabled:
+            span = _current_span.get()
+            if span is not None:
+                record["span"] = span.id
+        self._write_json(record)
+
+    def event(self, name: str, /, **data: Any) -> None:
+        """Structured record for the JSONL log only (not shown in the UI)."""
+        self._write_json({
+            "ts": _utc_ts(),
+            "level": "EVENT",
+            "message": name,
+            "data": data,
         })
 
     def info(self, message: str, **data: Any) -> None:
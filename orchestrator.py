@@ -0,0 +1,371 @@
+"""
+Multi-host orchestration: one orchestrator dispatches headless runs to
+per-host agents and aggregates their results.
+
+Agents speak JSON lines over any byte pipe (stdin / stdout of `cli.py
+agent`), so a transport only has to start that pipe for a host:
+
+    agent -> {"type": "hello", "host": ..., "version": ..., "protocol": 1}
+    orch  -> {"type": "run", "tasks": [...], "dry_run": ..., "force": ...}
+    agent -> {"type": "log", "line": ...}          (streamed while running)
+    agent -> {"type": "result", "exit_code": ..., "tasks": [...]}
+    orch  -> {"type": "cancel"}                    (any time)
+
+SubprocessTransport runs a command per host: by default a local agent
+(stand-in, for testing on one machine), or e.g. `ssh {host} ...` for real
+workstations, which keeps authentication with the remote shell.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import platform
+import queue
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Optional, Protocol, TextIO
+
+from config import (
+    APP_VERSION, ORCHESTRATOR_HANDSHAKE_S, ORCHESTRATOR_LOG_TAIL,
+    ORCHESTRATOR_MAX_PARALLEL,
+)
+from aio import CancelEvent
+from process import CANCEL_POLL_S
+from procio import EOF, read_lines
+
+PROTOCOL = 1
+
+# How often a waiting orchestrate() looks at cancel_event
+CANCEL_WAIT_SLICE_S = 0.5
+
+
+# --------------------------------------------------
+# Transport
+# --------------------------------------------------
+
+class Channel(Protocol):
+    def send(self, msg: dict) -> None: ...
+
+    def recv(self, timeout: float) -> Optional[dict]:
+        """Next message; None on timeout. Raises EOFError when closed."""
+
+    def close(self) -> None: ...
+
+
+class Transport(Protocol):
+    def open(self, host: str) -> Channel: ...
+
+
+def local_agent_argv() -> list[str]:
+    """Command for a stand-in agent on this machine."""
+    if getattr(sys, "frozen", False):
+        return [sys.executable, "--headless", "agent", "--name", "{host}"]
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+    return [sys.executable, cli, "agent", "--name", "{host}"]
+
+
+class _PipeChannel:
+    """An agent on the other end of a child process' stdin / stdout."""
+
+    def __init__(self, argv: list[str]) -> None:
+        self._p = subprocess.Popen(
+            argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self._q: queue.Queue = queue.Queue()
+        self._open = 2
+        for pipe, stream in ((self._p.stdout, "stdout"), (self._p.stderr, "stderr")):
+            threading.Thread(target=read_lines, args=(pipe, stream, self._q),
+                             name=f"agent-{stream}", daemon=True).start()
+
+    def send(self, msg: dict) -> None:
+        try:
+            self._p.stdin.write(json.dumps(msg) + "\n")
+            self._p.stdin.flush()
+        except (OSError, ValueError):
+            pass  # agent gone; recv reports EOF
+
+    def recv(self, timeout: float) -> Optional[dict]:
+        while True:
+            if not self._open:
+                raise EOFError
+            try:
+                _ts, stream, line = self._q.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if line is EOF:
+                self._open -= 1
+                continue
+            if stream == "stdout":
+                try:
+                    msg = json.loads(line)
+                    if isinstance(msg, dict):
+                        return msg
+                except ValueError:
+                    pass
+            # Anything else (ssh banners, tracebacks) is shown as log output
+            return {"type": "log", "line": line, "stream": stream}
+
+    def close(self) -> None:
+        try:
+            self._p.stdin.close()
+        except Exception:
+            pass
+        try:
+            self._p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self._p.kill()
+            self._p.wait()
+
+
+class SubprocessTransport:
+    """Starts `argv` per host; "{host}" in any argument is replaced."""
+
+    def __init__(self, argv: Optional[list[str]] = None) -> None:
+        self.argv = argv or local_agent_argv()
+
+    def open(self, host: str) -> Channel:
+        return _PipeChannel([a.replace("{host}", host) for a in self.argv])
+
+
+# --------------------------------------------------
+# Orchestrator
+# --------------------------------------------------
+
+@dataclass
+class HostResult:
+    host: str
+    status: str  # "ok" | "failed" | "cancelled" | "unreachable" | "lost"
+    exit_code: Optional[int] = None
+    duration_s: float = 0.0
+    agent: dict = field(default_factory=dict)   # hello message
+    tasks: list[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    log_tail: list[str] = field(default_factory=list)
+
+
+@dataclass
+class Report:
+    hosts: list[HostResult]
+    duration_s: float
+
+    @property
+    def ok(self) -> bool:
+        return all(h.status == "ok" for h in self.hosts)
+
+    def summary(self) -> dict[str, Any]:
+        by_status: dict[str, int] = {}
+        for h in self.hosts:
+            by_status[h.status] = by_status.get(h.status, 0) + 1
+        tasks: dict[str, dict[str, int]] = {}
+        for h in self.hosts:
+            for t in h.tasks:
+                per = tasks.setdefault(t.get("name", "?"), {})
+                per[t.get("status", "?")] = per.get(t.get("status", "?"), 0) + 1
+        return {"hosts": len(self.hosts), "by_status": by_status,
+                "tasks": tasks, "duration_s": round(self.duration_s, 3)}
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"summary": self.summary(),
+                "hosts": [asdict(h) for h in self.hosts]}
+
+
+LineSink = Callable[[str, str], None]  # (host, line)
+
+
+def _run_host(host: str, request: dict, transport: Transport,
+              cancel_event: threading.Event, on_line: Optional[LineSink]) -> HostResult:
+    t0 = time.monotonic()
+    res = HostResult(host, "lost")
+    tail: list[str] = []
+
+    def done(status: str, error: Optional[str] = None) -> HostResult:
+        res.status = status
+        res.error = error
+        res.duration_s = time.monotonic() - t0
+        res.log_tail = tail[-ORCHESTRATOR_LOG_TAIL:]
+        return res
+
+    if cancel_event.is_set():
+        return done("cancelled", "not started")
+    try:
+        ch = transport.open(host)
+    except Exception as e:
+        return done("unreachable", str(e))
+
+    try:
+        # Handshake; log lines before the hello are allowed
+        deadline = time.monotonic() + ORCHESTRATOR_HANDSHAKE_S
+        while True:
+            msg = ch.recv(max(0.0, deadline - time.monotonic()))
+            if msg is None:
+                return done("unreachable", "no hello from agent")
+            if msg.get("type") == "hello":
+                res.agent = msg
+                break
+            if msg.get("type") == "log":
+                tail.append(msg.get("line", ""))
+                if on_line:
+                    on_line(host, msg.get("line", ""))
+        if msg.get("protocol") != PROTOCOL:
+            return done("unreachable",
+                        f"agent protocol {msg.get('protocol')} != {PROTOCOL}")
+
+        ch.send(request)
+        cancel_sent = False
+        while True:
+            if cancel_event.is_set() and not cancel_sent:
+                cancel_sent = True
+                ch.send({"type": "cancel"})
+            msg = ch.recv(CANCEL_POLL_S)
+            if msg is None:
+                continue
+            kind = msg.get("type")
+            if kind == "log":
+                line = msg.get("line", "")
+                tail.append(line)
+                if len(tail) > 4 * ORCHESTRATOR_LOG_TAIL:
+                    del tail[:-ORCHESTRATOR_LOG_TAIL]
+                if on_line:
+                    on_line(host, line)
+            elif kind == "result":
+                res.exit_code = msg.get("exit_code")
+                res.tasks = list(msg.get("tasks") or [])
+                if msg.get("cancelled"):
+                    return done("cancelled")
+                return done("ok" if res.exit_code == 0 else "failed",
+                            msg.get("error"))
+    except EOFError:
+        return done("lost", "agent exited without a result")
+    finally:
+        ch.close()
+
+
+def orchestrate(
+    hosts: list[str],
+    request: dict,
+    *,
+    transport: Optional[Transport] = None,
+    max_parallel: int = ORCHESTRATOR_MAX_PARALLEL,
+    cancel_event: Optional[threading.Event] = None,
+    on_line: Optional[LineSink] = None,
+    on_host_done: Optional[Callable[[HostResult], None]] = None,
+) -> Report:
+    """
+    Runs `request` (a "run" message) on every host, at most max_parallel
+    at a time. Cancel stops hosts that have not started and forwards a
+    cancel to the running agents.
+    """
+    transport = transport or SubprocessTransport()
+    cancel_event = cancel_event or threading.Event()
+    request = dict(request, type="run")
+    t0 = time.monotonic()
+
+    def one(host: str) -> HostResult:
+        r = _run_host(host, request, transport, cancel_event, on_line)
+        if on_host_done:
+            on_host_done(r)
+        return r
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_parallel),
+                              thread_name_prefix="host")
+    futures = [pool.submit(one, host) for host in hosts]
+    try:
+        pending = set(futures)
+        while pending:
+            # Short slices: an untimed wait would keep Ctrl+C handlers
+            # from running on Windows until every host is done
+            _, pending = wait(pending, timeout=CANCEL_WAIT_SLICE_S)
+            if cancel_event.is_set():
+                for f in pending:
+                    f.cancel()  # hosts still queued never start
+                pending = {f for f in pending if not f.cancelled()}
+    finally:
+        pool.shutdown(wait=False)
+
+    results = []
+    for host, f in zip(hosts, futures):
+        if f.cancelled():
+            r = HostResult(host, "cancelled", error="not started")
+            if on_host_done:
+                on_host_done(r)
+        else:
+            r = f.result()
+        results.append(r)
+    return Report(results, time.monotonic() - t0)
+
+
+# --------------------------------------------------
+# Agent
+# --------------------------------------------------
+
+# (task keys, options, cancel event, line sink) -> (exit code, task results)
+Executor = Callable[[list[str], dict, threading.Event, Callable[[str], None]],
+                    tuple[int, list]]
+
+
+def serve_agent(execute: Executor, *, name: Optional[str] = None,
+                stdin: TextIO = None, stdout: TextIO = None) -> int:
+    """
+    Serves requests from stdin until it closes. One run at a time; a
+    "cancel" received while running sets that run's cancel event.
+    """
+    stdin = stdin or sys.stdin
+    out = stdout or sys.stdout
+    if stdout is None:
+        # Keep stray prints off the protocol stream
+        sys.stdout = sys.stderr
+    out_lock = threading.Lock()
+
+    def send(msg: dict) -> None:
+        with out_lock:
+            out.write(json.dumps(msg) + "\n")
+            out.flush()
+
+    requests: queue.Queue = queue.Queue()
+    cancel_event = CancelEvent()
+
+    def read() -> None:
+        for line in stdin:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if msg.get("type") == "cancel":
+                cancel_event.set()
+            else:
+                requests.put(msg)
+        # Orchestrator went away: stop what is running
+        cancel_event.set()
+        requests.put(None)
+
+    threading.Thread(target=read, name="agent-stdin", daemon=True).start()
+    send({"type": "hello", "host": name or platform.node(),
+          "version": APP_VERSION, "protocol": PROTOCOL, "pid": os.getpid()})
+
+    while True:
+        msg = requests.get()
+        if msg is None:
+            return 0
+        if msg.get("type") != "run":
+            send({"type": "error", "error": f"unknown request {msg.get('type')!r}"})
+            continue
+        try:
+            rc, results = execute(list(msg.get("tasks") or []), msg,
+                                  cancel_event,
+                                  lambda line: send({"type": "log", "line": line}))
+            send({"type": "result", "exit_code": rc,
+                  "cancelled": cancel_event.is_set(),
+                  "tasks": [asdict(r) for r in results]})
+        except Exception as e:
+            send({"type": "result", "exit_code": 1, "cancelled": False,
+                  "tasks": [], "error": str(e)})
+        cancel_event.clear()
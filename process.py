@@ -1,15 +1,162 @@
 from __future__ import annotations
+import contextvars
+import os
+import queue
+import signal
 import subprocess
-import time
-from dataclasses import dataclass
-from typing import Optional
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import IO, Callable, Iterable, Iterator, Optional
+
+from config import PROCESS_OUTPUT_ENCODING, PROCESS_CAPTURE
+
+# How often the pump wakes up to look at cancel_event when output is idle
+CANCEL_POLL_S = 0.1
+
+# Children get their own process group / session: a console Ctrl+C reaches
+# only this tool (which cancels gracefully), never SFC / DISM directly,
+# and the whole tree can be stopped at once
+if os.name == "nt":
+    POPEN_GROUP_KW: dict = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+else:
+    POPEN_GROUP_KW = {"start_new_session": True}
+
+_EOF = None
+
+# pid_alive() on Windows
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_ERROR_ACCESS_DENIED = 5
+_STILL_ACTIVE = 259
+
+
+# Output kept for ProcResult (run_command / run_ps `capture`)
+CAPTURE_NONE = "none"
+CAPTURE_TAIL = "tail"
+CAPTURE_ALL = "all"
+
+# consumer(stream, line): stream is "stdout" or "stderr"
+LineConsumer = Callable[[str, str], None]
 
 
 @dataclass
 class ProcResult:
     returncode: int
-    stdout: str
+    stdout: str                      # captured tail ("" with capture="none")
     stderr: str
+    timed_out: Optional[str] = None  # watchdog that fired: "timeout" | "idle"
+    detached: bool = False           # left running (allow_terminate=False)
+    # capture="all": the complete output, rewound; deleted when closed
+    stdout_file: Optional[IO[str]] = field(default=None, repr=False)
+    stderr_file: Optional[IO[str]] = field(default=None, repr=False)
+    stdout_lines: int = 0            # lines seen, captured or not
+    stderr_lines: int = 0
+
+
+@dataclass
+class TaskLimits:
+    """
+    Watchdog limits of the task running in this context, set by the
+    runner: a wall-clock deadline for the whole task and a maximum time
+    without output per command. `fired` records the first watchdog hit.
+    """
+    task: str
+    deadline: Optional[float] = None   # time.monotonic()
+    timeout_s: Optional[float] = None
+    idle_s: Optional[float] = None
+    fired: Optional[str] = None
+
+
+_task_limits: contextvars.ContextVar[Optional[TaskLimits]] = \
+    contextvars.ContextVar("task_limits", default=None)
+
+
+def set_task_limits(limits: Optional[TaskLimits]) -> None:
+    _task_limits.set(limits)
+
+
+def current_limits() -> Optional[TaskLimits]:
+    return _task_limits.get()
+
+
+def check_watchdog(limits: Optional[TaskLimits], last_output: float,
+                   now: float) -> Optional[tuple[str, str]]:
+    """(kind, message) if a limit of the current task is exceeded."""
+    if limits is None:
+        return None
+    if limits.deadline is not None and now >= limits.deadline:
+        return "timeout", (f"task '{limits.task}' exceeded its time limit "
+                           f"of {limits.timeout_s:.0f}s")
+    if limits.idle_s is not None and now - last_output >= limits.idle_s:
+        return "idle", (f"no output for {now - last_output:.0f}s "
+                        f"(limit {limits.idle_s:.0f}s)")
+    return None
+
+
+def report_watchdog(logger, limits: TaskLimits, kind: str, message: str,
+                    action: str, **data) -> None:
+    """Text log line plus a structured 'watchdog' event."""
+    if limits.fired is None:
+        limits.fired = kind
+    verb = "stopping it" if action == "killed" else \
+        "detaching it (not safe to terminate), continuing"
+    logger.error(f"⏱ Watchdog: {message} — {verb}")
+    logger.event("watchdog", task=limits.task, kind=kind, action=action,
+                 timeout_s=limits.timeout_s, idle_timeout_s=limits.idle_s,
+                 **data)
+
+
+def stop_tree(p: subprocess.Popen, *, force: bool) -> None:
+    """
+    Stops a child and everything it started. Polite first (taskkill /T,
+    SIGTERM to the group), forced with force=True (taskkill /T /F, SIGKILL).
+    The child must have been started with POPEN_GROUP_KW.
+    """
+    try:
+        if os.name == "nt":
+            args = ["taskkill", "/PID", str(p.pid), "/T"] + (["/F"] if force else [])
+            subprocess.run(args, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=10,
+                           creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+            if force and p.poll() is None:
+                p.kill()
+        else:
+            os.killpg(p.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    except Exception:
+        try:
+            p.kill() if force else p.terminate()
+        except Exception:
+            pass
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    Whether a process with this pid is running. Errs on "alive" when it
+    cannot tell (e.g. access denied), so callers never treat a running
+    writer's files as finished.
+    """
+    if os.name == "nt":
+        import ctypes
+
+        k32 = ctypes.windll.kernel32
+        handle = k32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return k32.GetLastError() == _ERROR_ACCESS_DENIED
+        try:
+            code = ctypes.c_ulong()
+            if not k32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == _STILL_ACTIVE
+        finally:
+            k32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True   # exists, owned by someone else
+    return True
 
 
 def run_command(
@@ -19,70 +166,106 @@ def run_command(
     cancel_event,
     allow_terminate: bool,
     shell: bool = False,
+    progress: Optional[Callable[[float], None]] = None,
+    encoding: Optional[str] = PROCESS_OUTPUT_ENCODING,
+    consumers: Iterable[LineConsumer] = (),
+    capture: str = PROCESS_CAPTURE,
 ) -> ProcResult:
     """
     Runs a command and streams output line-by-line to the logger.
+    Blocking wrapper around aio.run_command_async: the command runs on the
+    shared event loop while the calling thread waits (do not call it from
+    a coroutine; await aio.run_command_async there).
+    If `progress` is given, percentages found in the output are passed to
+    it as fractions (0..1), e.g. ctx.task_progress.
+    Output is read as bytes and decoded with `encoding`, detected when
+    None (see procio.AutoDecoder). Lines redrawn in place with a bare \\r
+    (progress bars) are collapsed: only the last one of a series is
+    logged and kept in stdout / stderr.
+    stdout and stderr are read by the loop as data arrives, so lines are
+    logged in arrival order as soon as they are produced, and neither
+    pipe can fill up while the other is idle.
+    Every logged line is also passed to each of `consumers` as
+    consumer(stream, line), on the event loop thread: keep them quick.
+    ProcResult keeps only what `capture` asks for (see procio.Capture): by
+    default the last lines of each stream; use a consumer or
+    iter_command() to look at all of them without keeping them.
     Cancel behavior:
-      - If allow_terminate=True: we try to terminate/kill on cancel.
+      - If allow_terminate=True: the process tree is asked to stop, then
+        killed after CANCEL_KILL_AFTER_S; the pump never blocks on it,
+        so cancel is noticed within CANCEL_POLL_S.
       - If False: we log cancel request but let the command finish safely.
+    Watchdog (limits of the current task, see TaskLimits): a command that
+    passes the task deadline or stays silent too long is stopped like a
+    cancel if allow_terminate, else detached and left running.
     """
-    logger.info("▶ " + " ".join(cmd))
-
-    p = subprocess.Popen(
-        cmd,
-        shell=shell,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-
-    out_lines: list[str] = []
-    err_lines: list[str] = []
-
-    # Non-blocking-ish read loop
-    while True:
-        if cancel_event.is_set() and allow_terminate:
-            logger.warn("⏹ Cancel requested — terminating current process…")
-            try:
-                p.terminate()
-                time.sleep(0.8)
-                if p.poll() is None:
-                    p.kill()
-            except Exception:
-                pass
-
-        # Read available output without blocking too hard
-        if p.stdout:
-            line = p.stdout.readline()
-            if line:
-                line = line.rstrip("\n")
-                out_lines.append(line)
-                logger.info(line)
-        if p.stderr:
-            eline = p.stderr.readline()
-            if eline:
-                eline = eline.rstrip("\n")
-                err_lines.append(eline)
-                logger.warn(eline)
-
-        rc = p.poll()
-        if rc is not None:
-            # Drain remainder
+    import aio
+    return aio.run(aio.run_command_async, cmd, logger=logger,
+                   cancel_event=cancel_event, allow_terminate=allow_terminate,
+                   shell=shell, progress=progress, encoding=encoding,
+                   consumers=consumers, capture=capture)
+
+
+def iter_command(cmd: list[str], **kw) -> CommandOutput:
+    """
+    run_command as an iterator over its output lines:
+
+        out = iter_command(cmd, logger=..., cancel_event=..., ...)
+        for stream, line in out:
+            ...
+        res = out.result  # ProcResult, once the iteration has ended
+
+    Takes run_command's arguments; capture defaults to "none".
+    """
+    return CommandOutput(cmd, **kw)
+
+
+class CommandOutput:
+    """
+    Output lines of a running command, see iter_command. The command
+    starts right away; lines it produces while the caller is busy are
+    queued. Stopping early does not stop the command: it runs to the end
+    (wait() returns its result) and its remaining lines are dropped.
+    """
+
+    def __init__(self, cmd: list[str], *, consumers: Iterable[LineConsumer] = (),
+                 capture: str = CAPTURE_NONE, **kw) -> None:
+        import aio
+        self.result: Optional[ProcResult] = None
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._open = True
+
+        def put(stream: str, line: str) -> None:
+            if self._open:
+                self._q.put((stream, line))
+
+        self._future = aio.submit(aio.run_command_async, cmd,
+                                  consumers=(*consumers, put),
+                                  capture=capture, **kw)
+        self._future.add_done_callback(lambda f: self._q.put(_EOF))
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        try:
+            while True:
+                try:
+                    # Wakes up now and then so that Ctrl+C handlers run
+                    item = self._q.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _EOF:
+                    break
+                yield item
+        finally:
+            self._open = False
+        self.wait()
+
+    def wait(self) -> ProcResult:
+        """Blocks until the command has finished; returns its result."""
+        self._open = False
+        while self.result is None:
             try:
-                rest_out, rest_err = p.communicate(timeout=5)
-                if rest_out:
-                    for ln in rest_out.splitlines():
-                        out_lines.append(ln)
-                if rest_err:
-                    for ln in rest_err.splitlines():
-                        err_lines.append(ln)
-            except Exception:
-                pass
-            break
-
-        time.sleep(0.05)
-
-    rc = p.returncode if p.returncode is not None else 1
-    return ProcResult(rc, "\n".join(out_lines), "\n".join(err_lines))
+                self.result = self._future.result(timeout=0.5)
+            except FutureTimeout:
+                continue
+        return self.result
+
@@ -0,0 +1,343 @@
+"""
+Child-process I/O shared by the command pumps (aio.run_command_async and
+the PowerShell hosts in pshost) and the orchestrator's agent pipes:
+decoding and line splitting of raw output, what is kept of it for
+ProcResult, cancel escalation and resource sampling of a running child.
+"""
+from __future__ import annotations
+import asyncio
+import codecs
+import locale
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import time
+from collections import deque
+from typing import IO, Callable, Optional
+
+from config import (
+    SPAN_SAMPLE_INTERVAL_S, CANCEL_KILL_AFTER_S, CANCEL_DRAIN_S,
+    PROCESS_MAX_LINE_CHARS, PROCESS_CAPTURE, PROCESS_TAIL_LINES,
+    PROCESS_TAIL_CHARS, PROCESS_SPILL_BYTES,
+)
+from process import CAPTURE_ALL, CAPTURE_NONE, CAPTURE_TAIL, ProcResult, stop_tree
+
+try:  # optional: live CPU / memory sampling of child processes
+    import psutil
+except ImportError:
+    psutil = None
+
+# End of a stream in read_lines queues
+EOF = None
+
+
+# "Verification 45% complete." (SFC), "[====  20.0%  ====]" (DISM)
+_PERCENT_RE = re.compile(r"(\d{1,3}(?:[.,]\d+)?)\s*%")
+
+
+class Capture:
+    """
+    What is kept of one output stream: nothing, the last lines (bounded
+    by PROCESS_TAIL_LINES / PROCESS_TAIL_CHARS), or with "all" also every
+    line in a spooled temporary file that moves to disk past
+    PROCESS_SPILL_BYTES.
+    """
+
+    def __init__(self, mode: str = PROCESS_CAPTURE) -> None:
+        if mode not in (CAPTURE_NONE, CAPTURE_TAIL, CAPTURE_ALL):
+            raise ValueError(f"unknown capture mode: {mode!r}")
+        self.count = 0
+        self._tail: Optional[deque[str]] = (
+            None if mode == CAPTURE_NONE else deque())
+        self._chars = 0
+        self._file: Optional[IO[str]] = None
+        if mode == CAPTURE_ALL:
+            self._file = tempfile.SpooledTemporaryFile(
+                max_size=PROCESS_SPILL_BYTES, mode="w+", encoding="utf-8",
+                newline="\n", prefix="mt_output_")
+
+    def append(self, line: str) -> None:
+        self.count += 1
+        tail = self._tail
+        if tail is None:
+            return
+        tail.append(line)
+        self._chars += len(line) + 1
+        while len(tail) > 1 and (len(tail) > PROCESS_TAIL_LINES
+                                 or self._chars > PROCESS_TAIL_CHARS):
+            self._chars -= len(tail.popleft()) + 1
+        if self._file is not None:
+            self._file.write(line + "\n")
+
+    def text(self) -> str:
+        return "\n".join(self._tail) if self._tail else ""
+
+    def file(self) -> Optional[IO[str]]:
+        if self._file is not None:
+            self._file.seek(0)
+        return self._file
+
+
+def captured(rc: int, out: Capture, err: Capture, **kw) -> ProcResult:
+    """ProcResult from the captures of a finished (or left) command."""
+    return ProcResult(rc, out.text(), err.text(), stdout_file=out.file(),
+                      stderr_file=err.file(), stdout_lines=out.count,
+                      stderr_lines=err.count, **kw)
+
+
+def read_lines(pipe: IO[str], stream: str, q: queue.Queue) -> None:
+    """Reader thread: forwards each line as (monotonic ts, stream, line)."""
+    try:
+        for line in iter(pipe.readline, ""):
+            q.put((time.monotonic(), stream, line.rstrip("\r\n")))
+    except Exception:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except Exception:
+            pass
+        q.put((time.monotonic(), stream, EOF))
+
+
+def _fallback_encoding() -> str:
+    """Console programs that do not write UTF-8 use the OEM code page."""
+    if os.name == "nt":
+        return "oem"
+    enc = locale.getpreferredencoding(False)
+    return "latin-1" if codecs.lookup(enc).name == "utf-8" else enc
+
+
+class AutoDecoder:
+    """
+    Incremental decoder for child output. A configured encoding is used
+    as is. Otherwise: a BOM wins, then UTF-16-LE when the first bytes
+    look like it (SFC, and other tools writing "Unicode" to a pipe), else
+    UTF-8, switching to the OEM code page at the first invalid byte.
+    """
+
+    def __init__(self, encoding: Optional[str] = None) -> None:
+        self.encoding = encoding
+        self._dec = None
+        self._head = b""
+        if encoding is not None:
+            self._dec = codecs.getincrementaldecoder(encoding)(errors="replace")
+
+    def _detect(self, data: bytes) -> None:
+        if data.startswith(codecs.BOM_UTF8):
+            enc = "utf-8-sig"
+        elif data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            enc = "utf-16"
+        else:
+            pairs = len(data) // 2
+            odd_nul = data[1:2 * pairs:2].count(0)
+            even_nul = data[0:2 * pairs:2].count(0)
+            if pairs and odd_nul >= 0.4 * pairs and even_nul < 0.1 * pairs:
+                enc = "utf-16-le"
+            else:
+                enc = "utf-8"
+        self.encoding = enc
+        errors = "strict" if enc == "utf-8" else "replace"
+        self._dec = codecs.getincrementaldecoder(enc)(errors=errors)
+
+    def decode(self, data, final: bool = False) -> str:
+        if self._dec is None:
+            # Wait for a few bytes so the guess is not made on one byte
+            self._head += bytes(data)
+            if len(self._head) < 4 and not final:
+                return ""
+            data, self._head = self._head, b""
+            self._detect(data)
+        try:
+            return self._dec.decode(data, final)
+        except UnicodeDecodeError:
+            pending = self._dec.getstate()[0]
+            self.encoding = _fallback_encoding()
+            self._dec = codecs.getincrementaldecoder(self.encoding)(
+                errors="replace")
+            return self._dec.decode(pending + bytes(data), final)
+
+
+# A line break, or a bare carriage return (in-place progress redraw)
+_BREAK_RE = re.compile(r"\r\n|\r|\n")
+
+
+class LineSplitter:
+    """
+    Splits decoded text into (line, in_place) on \\n, \\r\\n and bare \\r.
+    in_place marks a line ended by a bare \\r, i.e. one the program will
+    draw over (DISM / SFC progress bars).
+    """
+
+    def __init__(self, max_chars: int = PROCESS_MAX_LINE_CHARS) -> None:
+        self.max_chars = max_chars
+        self._pending = ""
+
+    def feed(self, text: str) -> list[tuple[str, bool]]:
+        text = self._pending + text
+        if "\r" not in text:
+            out = [(line, False) for line in text.split("\n")]
+            rest = out.pop()[0]
+        else:
+            out, rest = self._split_cr(text)
+        while len(rest) > self.max_chars:
+            out.append((rest[:self.max_chars], False))
+            rest = rest[self.max_chars:]
+        self._pending = rest
+        return out
+
+    @staticmethod
+    def _split_cr(text: str) -> tuple[list[tuple[str, bool]], str]:
+        out = []
+        pos = 0
+        for m in _BREAK_RE.finditer(text):
+            if m.group() == "\r" and m.end() == len(text):
+                break  # may be the first half of a \r\n
+            out.append((text[pos:m.start()], m.group() == "\r"))
+            pos = m.end()
+        return out, text[pos:]
+
+    def flush(self) -> list[tuple[str, bool]]:
+        rest, self._pending = self._pending, ""
+        if rest.endswith("\r"):
+            return [(rest[:-1], True)]
+        return [(rest, False)] if rest else []
+
+
+class Stopper:
+    """
+    Non-blocking cancel escalation, advanced by the pump loop:
+    polite tree stop -> forced tree kill after CANCEL_KILL_AFTER_S ->
+    stop reading after another CANCEL_DRAIN_S (pipes inherited by
+    something that could not be killed).
+    """
+
+    def __init__(self, p: subprocess.Popen,
+                 alive: Optional[Callable[[], bool]] = None) -> None:
+        self.p = p
+        self.alive = alive or (lambda: p.poll() is None)
+        self.started: Optional[float] = None
+        self.killed = False
+
+    @property
+    def active(self) -> bool:
+        return self.started is not None
+
+    def start(self) -> None:
+        if self.started is None:
+            self.started = time.monotonic()
+            self._stop_tree(force=False)
+
+    def _stop_tree(self, *, force: bool) -> None:
+        # taskkill runs to completion (up to seconds); on the event loop
+        # it would stall every other command being pumped
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            stop_tree(self.p, force=force)
+            return
+        loop.run_in_executor(None, lambda: stop_tree(self.p, force=force))
+
+    def next_due(self) -> Optional[float]:
+        """When tick() has something to do next (time.monotonic)."""
+        if self.started is None:
+            return None
+        if not self.killed:
+            return self.started + CANCEL_KILL_AFTER_S
+        return self.started + CANCEL_KILL_AFTER_S + CANCEL_DRAIN_S
+
+    def tick(self, logger) -> bool:
+        """Advances the escalation; True when the pump should give up."""
+        if self.started is None:
+            return False
+        waited = time.monotonic() - self.started
+        if not self.killed and waited >= CANCEL_KILL_AFTER_S:
+            self.killed = True
+            if self.alive():
+                logger.warn("⏹ Process did not stop — killing process tree…")
+            self._stop_tree(force=True)
+        return self.killed and waited >= CANCEL_KILL_AFTER_S + CANCEL_DRAIN_S
+
+
+class ChildUsage:
+    """
+    Peak memory and CPU time of a child, recorded on its span.
+    Windows: read from the process handle after exit (no sampling needed).
+    Elsewhere: sampled with psutil while running, if installed.
+    """
+
+    def __init__(self, p: subprocess.Popen, span) -> None:
+        self.p = p
+        self.span = span
+        self.next_sample = 0.0
+        self.proc = None
+        if psutil is not None and os.name != "nt":
+            try:
+                self.proc = psutil.Process(p.pid)
+            except Exception:
+                self.proc = None
+
+    def next_due(self) -> Optional[float]:
+        return self.next_sample if self.proc is not None else None
+
+    def sample(self) -> None:
+        if self.proc is None:
+            return
+        now = time.monotonic()
+        if now < self.next_sample:
+            return
+        self.next_sample = now + SPAN_SAMPLE_INTERVAL_S
+        try:
+            with self.proc.oneshot():
+                cpu = self.proc.cpu_times()
+                self.span.peak("peak_rss_bytes", self.proc.memory_info().rss)
+                self.span.peak("cpu_s", round(cpu.user + cpu.system, 3))
+        except Exception:
+            self.proc = None
+
+    def finish(self) -> None:
+        if os.name != "nt":
+            return
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+
+            handle = wintypes.HANDLE(int(self.p._handle))
+            k32 = ctypes.windll.kernel32
+            times = [wintypes.FILETIME() for _ in range(4)]
+            if k32.GetProcessTimes(handle, *[ctypes.byref(t) for t in times]):
+                def secs(ft):
+                    return ((ft.dwHighDateTime << 32) | ft.dwLowDateTime) / 1e7
+                self.span.set("cpu_s", round(secs(times[2]) + secs(times[3]), 3))
+            pmc = PROCESS_MEMORY_COUNTERS()
+            pmc.cb = ctypes.sizeof(pmc)
+            if k32.K32GetProcessMemoryInfo(handle, ctypes.byref(pmc), pmc.cb):
+                self.span.set("peak_rss_bytes", pmc.PeakWorkingSetSize)
+        except Exception:
+            pass
+
+
+def parse_percent(line: str) -> Optional[float]:
+    m = None
+    for m in _PERCENT_RE.finditer(line):
+        pass
+    if m is None:
+        return None
+    value = float(m.group(1).replace(",", "."))
+    return value / 100 if 0 <= value <= 100 else None
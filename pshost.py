@@ -0,0 +1,374 @@
+"""
+Long-lived PowerShell worker processes.
+
+One powershell.exe is started and then fed one command per line on stdin;
+every output line comes back framed with the command id, so stdout, stderr
+and the exit status of each command can be told apart:
+
+    request  (stdin):  {"id": 7, "script": "Get-Date"}
+    response (stdout): <token> OUT 7 <text>
+                       <token> ERR 7 <text>
+                       <token> END 7 <exit code>
+
+Unframed stdout lines (native programs, Write-Host) count as OUT and host
+stderr lines as ERR of the command in flight. The token is random per
+process so command output cannot forge frames.
+
+`python_standin_argv` speaks the same protocol with Python as the script
+language, so the host and pool can be exercised on any platform.
+"""
+from __future__ import annotations
+import base64
+import contextlib
+import itertools
+import json
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator, Optional
+
+from aio import CancelEvent
+from config import POWERSHELL_51_X64, POWERSHELL_POOL_SIZE, PROCESS_CAPTURE
+from process import (
+    CANCEL_POLL_S, POPEN_GROUP_KW, LineConsumer, ProcResult, check_watchdog,
+    current_limits, report_watchdog, stop_tree,
+)
+from procio import EOF, Capture, captured, read_lines
+
+# Queued when a CancelEvent is set, to wake the reader of a command
+_CANCEL = object()
+
+PS_BOOTSTRAP = r"""
+$ErrorActionPreference = 'Continue'
+$ProgressPreference = 'SilentlyContinue'
+try { [Console]::OutputEncoding = [Text.Encoding]::UTF8 } catch {}
+$p = '__TOKEN__'
+while ($true) {
+    $line = [Console]::In.ReadLine()
+    if ($null -eq $line) { break }
+    if (-not $line.Trim()) { continue }
+    $req = $line | ConvertFrom-Json
+    $id = $req.id
+    $global:LASTEXITCODE = 0
+    $failed = $false
+    try {
+        & ([scriptblock]::Create($req.script)) 2>&1 | ForEach-Object {
+            if ($_ -is [System.Management.Automation.ErrorRecord]) {
+                $failed = $true
+                [Console]::Out.WriteLine("$p ERR $id " + ("$_" -replace "`r?`n", " "))
+            } else { $_ }
+        } | Out-String -Stream -Width 250 | ForEach-Object {
+            [Console]::Out.WriteLine("$p OUT $id $_")
+        }
+    } catch {
+        $failed = $true
+        [Console]::Out.WriteLine("$p ERR $id " + ($_.Exception.Message -replace "`r?`n", " "))
+    }
+    $rc = 0
+    if ($LASTEXITCODE) { $rc = $LASTEXITCODE } elseif ($failed) { $rc = 1 }
+    [Console]::Out.WriteLine("$p END $id $rc")
+    [Console]::Out.Flush()
+}
+"""
+
+PY_STANDIN = r"""
+import contextlib, io, json, sys, traceback
+T = sys.argv[1]
+real = sys.stdout
+
+class Framed(io.TextIOBase):
+    def __init__(self, kind, rid):
+        self.kind, self.rid, self.buf = kind, rid, ""
+    def writable(self):
+        return True
+    def write(self, s):
+        self.buf += s
+        *lines, self.buf = self.buf.split("\n")
+        for ln in lines:
+            real.write(f"{T} {self.kind} {self.rid} {ln}\n")
+        real.flush()
+        return len(s)
+    def close(self):
+        if self.buf:
+            self.write("\n")
+
+for line in sys.stdin:
+    if not line.strip():
+        continue
+    req = json.loads(line)
+    rid = req["id"]
+    out, err = Framed("OUT", rid), Framed("ERR", rid)
+    rc = 0
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            exec(req["script"], {"__name__": "__pshost__"})
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        err.write(traceback.format_exc())
+        rc = 1
+    out.close()
+    err.close()
+    real.write(f"{T} END {rid} {rc}\n")
+    real.flush()
+"""
+
+
+def powershell_argv(token: str) -> list[str]:
+    script = PS_BOOTSTRAP.replace("__TOKEN__", token)
+    encoded = base64.b64encode(script.encode("utf-16-le")).decode("ascii")
+    return [
+        POWERSHELL_51_X64, "-NoProfile", "-NoLogo", "-NonInteractive",
+        "-ExecutionPolicy", "Bypass", "-EncodedCommand", encoded,
+    ]
+
+
+def python_standin_argv(token: str) -> list[str]:
+    return [sys.executable, "-u", "-c", PY_STANDIN, token]
+
+
+class PowerShellHost:
+    """A single worker process; runs one command at a time."""
+
+    def __init__(self, argv_factory: Callable[[str], list[str]] = powershell_argv) -> None:
+        self._argv_factory = argv_factory
+        self._token = "@@" + secrets.token_hex(8)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._q: queue.Queue = queue.Queue()
+        self._p: Optional[subprocess.Popen] = None
+
+    @property
+    def alive(self) -> bool:
+        return self._p is not None and self._p.poll() is None
+
+    def start(self) -> None:
+        if self.alive:
+            return
+        self._q = queue.Queue()
+        self._p = subprocess.Popen(
+            self._argv_factory(self._token),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            **POPEN_GROUP_KW,
+        )
+        for pipe, stream in ((self._p.stdout, "stdout"), (self._p.stderr, "stderr")):
+            threading.Thread(target=read_lines, args=(pipe, stream, self._q),
+                             name=f"pshost-{stream}", daemon=True).start()
+
+    def close(self) -> None:
+        p, self._p = self._p, None
+        if p is None:
+            return
+        try:
+            p.stdin.close()
+            p.wait(timeout=3)
+        except Exception:
+            self._kill(p)
+
+    @staticmethod
+    def _kill(p: subprocess.Popen) -> None:
+        # The whole tree: programs started by the script die with the host
+        stop_tree(p, force=True)
+        try:
+            p.wait(timeout=3)
+        except Exception:
+            pass
+
+    def run(
+        self,
+        script: str,
+        *,
+        logger,
+        cancel_event,
+        allow_terminate: bool,
+        consumers: Iterable[LineConsumer] = (),
+        capture: str = PROCESS_CAPTURE,
+    ) -> ProcResult:
+        """
+        Runs one script in the worker and streams its output to the logger.
+        Cancel follows run_command: with allow_terminate=True the worker is
+        killed (and restarted on next use), otherwise the command finishes.
+        Output lines go to `consumers` and are kept as `capture` says, as
+        in run_command.
+        """
+        out, err = Capture(capture), Capture(capture)
+        with self._lock, logger.span("subprocess", "powershell",
+                                     cmd=script, pooled=True,
+                                     allow_terminate=allow_terminate) as span:
+            unwatch = self._wake_on_cancel(cancel_event, allow_terminate)
+            try:
+                res = self._run(script, logger, cancel_event, allow_terminate,
+                                tuple(consumers), out, err)
+            finally:
+                unwatch()
+            span.set("exit_code", res.returncode)
+            span.add("stdout_lines", out.count)
+            span.add("stderr_lines", err.count)
+            return res
+
+    def _wake_on_cancel(self, cancel_event,
+                        allow_terminate: bool) -> Callable[[], None]:
+        """Wakes _run's wait once a CancelEvent is set; returns an unwatch."""
+        if not allow_terminate or not isinstance(cancel_event, CancelEvent):
+            return lambda: None
+
+        def wake() -> None:
+            # The current queue: start() replaces it with a new host
+            self._q.put((time.monotonic(), None, _CANCEL))
+
+        cancel_event.add_callback(wake)
+        return lambda: cancel_event.remove_callback(wake)
+
+    def _run(self, script: str, logger, cancel_event, allow_terminate: bool,
+             consumers, out: Capture, err: Capture) -> ProcResult:
+        logger.info("▶ PS> " + script)
+        try:
+            self.start()
+            rid = next(self._ids)
+            self._p.stdin.write(json.dumps(
+                {"id": rid, "script": script}) + "\n")
+            self._p.stdin.flush()
+        except Exception as e:
+            logger.error("PowerShell host failed to start", error=str(e))
+            self.close()
+            return ProcResult(1, "", str(e))
+
+        prefix = self._token + " "
+        limits = current_limits()
+        t0 = last_output = time.monotonic()
+        # Sleeps until output arrives or a watchdog limit is due; a
+        # CancelEvent wakes it (see run), a plain Event is looked at
+        # every CANCEL_POLL_S
+        poll_s = CANCEL_POLL_S if allow_terminate and \
+            not isinstance(cancel_event, CancelEvent) else None
+
+        while True:
+            if cancel_event.is_set() and allow_terminate:
+                logger.warn("⏹ Cancel requested — stopping PowerShell command…")
+                p, self._p = self._p, None
+                self._kill(p)
+                return captured(1, out, err)
+
+            now = time.monotonic()
+            hit = check_watchdog(limits, last_output, now)
+            if hit is not None:
+                action = "killed" if allow_terminate else "detached"
+                report_watchdog(logger, limits, hit[0], hit[1], action,
+                                cmd=script, pid=self._p.pid, pooled=True,
+                                elapsed_s=round(now - t0, 3),
+                                silent_s=round(now - last_output, 3))
+                # Either way this host is gone from the pool: a detached
+                # one finishes the command and exits when its stdin closes
+                p, self._p = self._p, None
+                if allow_terminate:
+                    self._kill(p)
+                else:
+                    try:
+                        p.stdin.close()
+                    except Exception:
+                        pass
+                return captured(1, out, err, timed_out=hit[0],
+                                 detached=not allow_terminate)
+
+            due = [] if limits is None else [
+                limits.deadline,
+                None if limits.idle_s is None else last_output + limits.idle_s]
+            due = [d for d in due if d is not None]
+            timeout = poll_s
+            if due:
+                left = max(0.0, min(due) - time.monotonic())
+                timeout = left if timeout is None else min(timeout, left)
+            try:
+                _ts, stream, line = self._q.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if line is _CANCEL:
+                continue  # woken by cancel_event: handled at the top
+            last_output = time.monotonic()
+
+            if line is EOF:
+                if stream == "stdout":
+                    logger.error("PowerShell host exited unexpectedly")
+                    self.close()
+                    return captured(1, out, err)
+                continue
+
+            kind = "ERR" if stream == "stderr" else "OUT"
+            if line.startswith(prefix):
+                parts = line[len(prefix):].split(" ", 2)
+                if len(parts) < 2 or parts[1] != str(rid):
+                    continue  # stale frame from an earlier command
+                kind, text = parts[0], (parts[2] if len(parts) > 2 else "")
+                if kind == "END":
+                    try:
+                        rc = int(text)
+                    except ValueError:
+                        rc = 1
+                    return captured(rc, out, err)
+            else:
+                text = line
+
+            if kind == "ERR":
+                stream = "stderr"
+                err.append(text)
+                logger.warn(text)
+            else:
+                stream = "stdout"
+                out.append(text)
+                logger.info(text)
+            for consume in consumers:
+                consume(stream, text)
+
+
+class PowerShellPool:
+    """
+    Up to `size` long-lived hosts, started on first use and shared by the
+    tasks of a run. Concurrent callers each get their own host.
+    """
+
+    def __init__(
+        self,
+        size: int = POWERSHELL_POOL_SIZE,
+        argv_factory: Callable[[str], list[str]] = powershell_argv,
+    ) -> None:
+        self._argv_factory = argv_factory
+        self._idle: list[PowerShellHost] = []
+        self._all: list[PowerShellHost] = []
+        self._sem = threading.Semaphore(max(1, size))
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[PowerShellHost]:
+        self._sem.acquire()
+        try:
+            with self._lock:
+                if self._idle:
+                    host = self._idle.pop()
+                else:
+                    host = PowerShellHost(self._argv_factory)
+                    self._all.append(host)
+            try:
+                yield host
+            finally:
+                with self._lock:
+                    self._idle.append(host)
+        finally:
+            self._sem.release()
+
+    def run(self, script: str, **kw) -> ProcResult:
+        with self.acquire() as host:
+            return host.run(script, **kw)
+
+    def close(self) -> None:
+        with self._lock:
+            hosts, self._all, self._idle = self._all, [], []
+        for host in hosts:
+            host.close()
@@ -1,6 +1,45 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Callable, List
+import asyncio
+from concurrent.futures import Future
+import contextvars
+from dataclasses import dataclass, field
+import importlib
+import threading
+import time
+from typing import Callable, List, Optional, Union
+
+from config import (
+    RUNNER_MAX_PARALLEL, TASK_DEFAULT_DURATION_S, SLOW_TASK_DEFAULT_DURATION_S,
+    HISTORY_DURATION_SAMPLES, PROGRESS_REPORT_INTERVAL_S, CANCEL_KILL_AFTER_S,
+    CANCEL_DRAIN_S, SPACE_ACCOUNTING_ENABLED, SPACE_VOLUMES,
+)
+import aio
+from diskspace import SpaceMeter, local_volumes
+from freshness import FreshnessPolicy, TaskState
+from process import ProcResult, TaskLimits, set_task_limits
+from pshost import PowerShellPool
+
+# Resource classes. Tasks that share a class never run at the same time;
+# tasks with disjoint classes may overlap.
+COMPONENT_STORE = "component-store"    # SFC, DISM, servicing / updates
+FILESYSTEM_LIGHT = "filesystem-light"  # TEMP, Recycle Bin, Storage Sense
+
+# Past its timeout a task gets this long (on top of the kill escalation)
+# to return before the runner gives up on it and moves on
+_ABANDON_SLACK_S = 5.0
+
+# Name of the task running in this thread / context (for sub-task progress)
+_current_task: contextvars.ContextVar[Optional[str]] = \
+    contextvars.ContextVar("current_task", default=None)
+
+
+def current_task() -> Optional[str]:
+    """Name of the task run_tasks is running in this context, else None."""
+    return _current_task.get()
+
+
+# on_progress(fraction 0..1, status text, ETA in seconds or None)
+ProgressFn = Callable[[float, str, Optional[float]], None]
 
 
 @dataclass
@@ -8,43 +47,557 @@ class Context:
     logger: any
     cancel_event: any
     dry_run: bool
+    retry_locked: bool = False  # TEMP cleanup: ignore the locked-file cache
+    force: bool = False         # ignore freshness policies (full run)
+    # TEMP cleanup targets (patterns); None = config.TEMP_CLEANUP_ROOTS
+    temp_roots: Optional[list[str]] = None
+    powershell: PowerShellPool = field(default_factory=PowerShellPool)
+    # Set by run_tasks: receives (task name, fraction) from task_progress
+    progress_sink: Optional[Callable[[str, float], None]] = field(
+        default=None, repr=False)
+
+    def task_progress(self, fraction: float) -> None:
+        """
+        Sub-task progress (0..1) of the calling task, e.g. parsed from
+        DISM / SFC output by run_command(progress=ctx.task_progress).
+        """
+        name = _current_task.get()
+        if name is not None and self.progress_sink is not None:
+            self.progress_sink(name, min(max(fraction, 0.0), 1.0))
+
+    def run_ps(self, script: str, *, allow_terminate: bool,
+               **kw) -> ProcResult:
+        """
+        Runs a PowerShell command on a pooled, long-lived host (`kw`:
+        consumers / capture, see PowerShellHost.run).
+        """
+        return self.powershell.run(
+            script, logger=self.logger, cancel_event=self.cancel_event,
+            allow_terminate=allow_terminate, **kw)
 
 
-TaskFn = Callable[[Context], None]
+# A task may return an exit code (int); None counts as 0. A coroutine
+# function runs on the shared event loop (aio), anything else on a thread
+TaskFn = Callable[[Context], Optional[int]]
+
+
+def load_target(target: str) -> TaskFn:
+    """Imports a "package.module:function" task target."""
+    module, _, func = target.partition(":")
+    return getattr(importlib.import_module(module), func)
 
 
 @dataclass
 class Task:
     name: str
-    fn: TaskFn
+    # or "module:function", imported when the task starts (tasks.registry)
+    fn: Union[TaskFn, str]
     allow_terminate: bool  # for subprocess tasks (policy)
     slow: bool = False
+    resources: tuple[str, ...] = ()   # resource classes held while running
+    depends_on: tuple[str, ...] = ()  # names of tasks that must finish first
+    freshness: Optional[FreshnessPolicy] = None  # skip if recently succeeded
+    timeout_s: Optional[float] = None       # wall-clock limit for the task
+    idle_timeout_s: Optional[float] = None  # max. time a command may stay silent
+
+
+@dataclass
+class TaskResult:
+    name: str
+    # "ok" | "fresh" | "failed" (non-zero exit code) | "crashed" |
+    # "timeout" | "skipped" | "cancelled"
+    status: str
+    duration_s: float = 0.0
+    error: Optional[str] = None
+    exit_code: Optional[int] = None
+    reason: Optional[str] = None  # why a task was skipped / fresh
+    # Free space gained on the local volumes while the task ran (see
+    # diskspace); None when not measured (dry-run, did not run)
+    reclaimed_bytes: Optional[int] = None
+    reclaim_rate: Optional[float] = None  # bytes per second of runtime
+    overlapped: bool = False  # other tasks ran meanwhile (counted too)
+
+    @property
+    def succeeded(self) -> bool:
+        """Ran fine, or did not need to run (fresh)."""
+        return self.status in ("ok", "fresh")
+
+
+def _conflicts(a: Task, b: Task) -> bool:
+    return bool(set(a.resources) & set(b.resources))
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return ""
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60} min {seconds % 60:02d}s"
+    return f"{seconds // 3600} h {seconds % 3600 // 60:02d} min"
+
+
+def _history_weights(tasks: List[Task], dry_run: bool) -> dict[str, float]:
+    try:
+        from history import HistoryStore
+        with HistoryStore() as store:
+            return store.median_durations(
+                [t.name for t in tasks], dry_run=dry_run,
+                samples=HISTORY_DURATION_SAMPLES)
+    except Exception:
+        return {}
+
+
+class _Estimator:
+    """
+    Duration-weighted progress and ETA. Every task weighs its median
+    duration from the run history (or a default). A running task counts
+    its reported sub-progress, else its elapsed time, capped below its
+    weight. The ETA is bounded by the busiest resource class, since tasks
+    sharing a class run one after another.
+    """
+
+    def __init__(self, tasks: List[Task], history: dict[str, float],
+                 max_parallel: int) -> None:
+        self.weights = {
+            t.name: history.get(t.name) or (
+                SLOW_TASK_DEFAULT_DURATION_S if t.slow else TASK_DEFAULT_DURATION_S)
+            for t in tasks
+        }
+        self.total = sum(self.weights.values()) or 1.0
+        self.max_parallel = max(1, max_parallel)
+        self.sub: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def set_sub(self, name: str, fraction: float) -> None:
+        with self._lock:
+            self.sub[name] = fraction
+
+    def remaining(self, task: Task, elapsed: Optional[float]) -> tuple[float, float]:
+        """(done weight, remaining seconds) of one task."""
+        w = self.weights[task.name]
+        if elapsed is None:
+            return 0.0, w
+        with self._lock:
+            p = self.sub.get(task.name)
+        if p is not None and p >= 0.02:
+            return w * p, elapsed * (1 - p) / p
+        return w * min(elapsed / w, 0.95), max(w - elapsed, 0.05 * w)
+
+    def estimate(self, finished: list[str], running: list[tuple[Task, float]],
+                 pending: List[Task]) -> tuple[float, float]:
+        now = time.monotonic()
+        done_w = sum(self.weights.get(n, 0.0) for n in finished)
+        lanes: dict[str, float] = {}
+        total_left = longest = 0.0
+        for task, elapsed in [(t, now - t0) for t, t0 in running] + \
+                [(t, None) for t in pending]:
+            part, left = self.remaining(task, elapsed)
+            done_w += part
+            total_left += left
+            longest = max(longest, left)
+            for res in task.resources or (task.name,):
+                lanes[res] = lanes.get(res, 0.0) + left
+        eta = max(longest, total_left / self.max_parallel,
+                  max(lanes.values(), default=0.0))
+        return min(done_w / self.total, 1.0), eta
+
+
+def _spawn(name: str, fn, *args) -> Future:
+    """
+    Runs fn on a daemon thread. Unlike a ThreadPoolExecutor worker, a task
+    the runner had to abandon does not keep the process alive at exit.
+    """
+    fut: Future = Future()
+
+    def target() -> None:
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=target, name=f"task-{name}", daemon=True).start()
+    return fut
+
+
+def _task_span(ctx: Context, task: Task, limits: TaskLimits):
+    _current_task.set(task.name)
+    set_task_limits(limits)
+    return ctx.logger.span("task", task.name,
+                           allow_terminate=task.allow_terminate, slow=task.slow,
+                           resources=list(task.resources),
+                           timeout_s=task.timeout_s,
+                           idle_timeout_s=task.idle_timeout_s)
+
 
+def _task_done(span, limits: TaskLimits, rc) -> Optional[int]:
+    if limits.fired:
+        span.set("watchdog", limits.fired)
+    if isinstance(rc, int):
+        span.set("exit_code", rc)
+        return rc
+    return None
 
-def run_tasks(ctx: Context, tasks: List[Task], on_progress: Callable[[float, str], None]) -> None:
+
+def _space_done(ctx: Context, span, task: Task,
+                meter: Optional[SpaceMeter]) -> None:
+    """Logs what a task reclaimed; the meter has been stopped."""
+    if meter is None:
+        return
+    span.set("bytes_reclaimed", meter.reclaimed)
+    ctx.logger.event("task_space", task=task.name, **meter.as_event())
+
+
+def _run_task(ctx: Context, task: Task, fn: TaskFn, limits: TaskLimits,
+              meter: Optional[SpaceMeter]) -> Optional[int]:
+    with _task_span(ctx, task, limits) as span:
+        if meter is not None:
+            meter.start()
+        try:
+            return _task_done(span, limits, fn(ctx))
+        finally:
+            if meter is not None:
+                meter.stop()
+            _space_done(ctx, span, task, meter)
+
+
+async def _run_task_async(ctx: Context, task: Task, fn: TaskFn,
+                          limits: TaskLimits,
+                          meter: Optional[SpaceMeter]) -> Optional[int]:
+    # Free-space queries can stall on a slow or sleeping volume: keep them
+    # off the loop thread, which pumps every running command
+    loop = asyncio.get_running_loop()
+    with _task_span(ctx, task, limits) as span:
+        if meter is not None:
+            await loop.run_in_executor(None, meter.start)
+        try:
+            return _task_done(span, limits, await fn(ctx))
+        finally:
+            if meter is not None:
+                await loop.run_in_executor(None, meter.stop)
+            _space_done(ctx, span, task, meter)
+
+
+def _start(ctx: Context, task: Task, limits: TaskLimits,
+           meter: Optional[SpaceMeter] = None) -> asyncio.Future:
+    """Coroutine tasks become loop tasks; other tasks get a thread."""
+    try:
+        fn = load_target(task.fn) if isinstance(task.fn, str) else task.fn
+    except Exception as e:
+        # A task that cannot be loaded crashes like one that failed
+        fut = asyncio.get_running_loop().create_future()
+        fut.set_exception(e)
+        return fut
+    if asyncio.iscoroutinefunction(fn):
+        return asyncio.ensure_future(
+            _run_task_async(ctx, task, fn, limits, meter))
+    # Copy the context so the task span nests under the run span
+    return asyncio.wrap_future(_spawn(task.name, contextvars.copy_context().run,
+                                      _run_task, ctx, task, fn, limits, meter))
+
+
+def _log_summary(ctx: Context, results: List[TaskResult]) -> None:
+    """One line per task: status, runtime and the free space it reclaimed."""
+    from tasks.tree_delete import format_bytes
+
+    ctx.logger.info("\nSummary:")
+    for r in results:
+        line = f"  {r.name:<16} {r.status:<9} {format_eta(r.duration_s):>12}"
+        if r.reclaimed_bytes is not None:
+            line += f"  reclaimed {format_bytes(r.reclaimed_bytes):>10}"
+            if r.reclaim_rate is not None:
+                line += f" ({format_bytes(r.reclaim_rate)}/s)"
+            if r.overlapped:
+                line += " *"
+        ctx.logger.info(line)
+    if any(r.overlapped for r in results):
+        ctx.logger.info("  * ran alongside other tasks; their changes "
+                        "are counted too")
+
+
+def _limits(task: Task) -> TaskLimits:
+    deadline = None
+    if task.timeout_s is not None:
+        deadline = time.monotonic() + task.timeout_s
+    return TaskLimits(task.name, deadline, task.timeout_s, task.idle_timeout_s)
+
+
+def run_tasks(
+    ctx: Context,
+    tasks: List[Task],
+    on_progress: ProgressFn,
+    *,
+    max_parallel: int = RUNNER_MAX_PARALLEL,
+) -> List[TaskResult]:
+    """
+    Runs the selected tasks, overlapping those that neither depend on each
+    other nor share a resource class. Among conflicting tasks the list
+    order is kept. Cancel stops new tasks from starting; tasks already
+    running finish according to their own allow_terminate policy.
+    Task.timeout_s / idle_timeout_s arm a watchdog on the task's commands
+    (status "timeout"); a task that still does not return is abandoned so
+    the remaining tasks can run.
+    Tasks whose freshness policy says they succeeded recently are not
+    started (status "fresh") unless ctx.force is set. Progress is weighted
+    by each task's historical duration and comes with an ETA.
+    Blocking wrapper around run_tasks_async.
+    """
+    return aio.run(run_tasks_async, ctx, tasks, on_progress,
+                   max_parallel=max_parallel)
+
+
+async def run_tasks_async(
+    ctx: Context,
+    tasks: List[Task],
+    on_progress: ProgressFn,
+    *,
+    max_parallel: int = RUNNER_MAX_PARALLEL,
+) -> List[TaskResult]:
+    """
+    Coroutine behind run_tasks, for the shared loop (aio.submit). The
+    scheduler sleeps until a task finishes, cancel is requested or a
+    progress report is due; on_progress is called from the loop thread.
+    """
+    with ctx.logger.span("run", "maintenance", dry_run=ctx.dry_run,
+                         tasks=[t.name for t in tasks]) as span:
+        results = await _run_tasks(ctx, tasks, on_progress, max_parallel)
+        for r in results:
+            span.add(f"tasks_{r.status}")
+            ctx.logger.event("task_result", run=span.id, name=r.name,
+                             status=r.status, duration_s=round(r.duration_s, 3),
+                             error=r.error, exit_code=r.exit_code,
+                             reason=r.reason,
+                             reclaimed_bytes=r.reclaimed_bytes,
+                             bytes_per_s=None if r.reclaim_rate is None
+                             else round(r.reclaim_rate),
+                             overlapped=r.overlapped)
+        span.set("cancelled", ctx.cancel_event.is_set())
+    return results
+
+
+async def _run_tasks(ctx: Context, tasks: List[Task], on_progress,
+                     max_parallel: int) -> List[TaskResult]:
     total = len(tasks)
     if total == 0:
         ctx.logger.warn("No tasks selected.")
-        return
+        return []
 
     ctx.logger.info("\n=== MAINTENANCE START ===")
     ctx.logger.info(f"Dry-run: {ctx.dry_run}")
+    if ctx.force:
+        ctx.logger.info("Force: freshness policies ignored (full run)")
+
+    selected = {t.name for t in tasks}
+    pending: list[Task] = list(tasks)
+    running: dict[asyncio.Future, tuple[Task, float]] = {}
+    limits: dict[str, TaskLimits] = {}
+    meters: dict[str, SpaceMeter] = {}
+    results: dict[str, TaskResult] = {}
+    started = 0
+
+    # State file, history and free-space I/O (loads, saves) run off the
+    # loop thread, which pumps every running command
+    loop = asyncio.get_running_loop()
+    state = await loop.run_in_executor(None, TaskState.load)
+    history = await loop.run_in_executor(None, _history_weights, tasks,
+                                         ctx.dry_run)
+    volumes: list[str] = []
+    if SPACE_ACCOUNTING_ENABLED and not ctx.dry_run:
+        volumes = list(SPACE_VOLUMES or await loop.run_in_executor(
+            None, local_volumes))
+    est = _Estimator(tasks, history, max_parallel)
+    ctx.progress_sink = est.set_sub
+    _, eta = est.estimate([], [], tasks)
+    ctx.logger.info(f"Estimated time: ~{format_eta(eta)}")
+    last_report = 0.0
+
+    def report() -> None:
+        nonlocal last_report
+        last_report = time.monotonic()
+        names = []
+        for t, _ in running.values():
+            p = est.sub.get(t.name)
+            names.append(f"{t.name} {p:.0%}" if p is not None else t.name)
+        label = f"Running: {', '.join(names)}" if names else "Waiting…"
+        fraction, eta = est.estimate(list(results), list(running.values()),
+                                     pending)
+        on_progress(fraction, f"{label} ({len(results)}/{total})", eta)
+
+    def deps_done(task: Task) -> bool:
+        return all(dep not in selected or dep in results
+                   for dep in task.depends_on)
+
+    def ready(task: Task, index: int) -> bool:
+        if not deps_done(task):
+            return False
+        for other, _ in running.values():
+            if _conflicts(task, other):
+                return False
+        # An earlier conflicting task keeps its turn unless it is itself
+        # still waiting for a dependency
+        return not any(_conflicts(task, earlier) and deps_done(earlier)
+                       for earlier in pending[:index])
 
-    for i, task in enumerate(tasks, start=1):
+    def failed_dep(task: Task) -> Optional[str]:
+        for dep in task.depends_on:
+            r = results.get(dep)
+            if r is not None and not r.succeeded:
+                return dep
+        return None
+
+    cancel_logged = False
+    changed = False
+    wake = asyncio.Event()
+    unwatch = aio.watch(ctx.cancel_event, wake.set)
+
+    def abandon_at(task: Task, t0: float) -> float:
+        return t0 + task.timeout_s + CANCEL_KILL_AFTER_S + CANCEL_DRAIN_S + \
+            _ABANDON_SLACK_S
+
+    while pending or running:
+        wake.clear()
         if ctx.cancel_event.is_set():
-            ctx.logger.warn("⏹ Cancel requested — stopping before next task.")
+            if pending and not cancel_logged:
+                cancel_logged = True
+                ctx.logger.warn(
+                    "⏹ Cancel requested — stopping before next task.")
+            for task in pending:
+                results[task.name] = TaskResult(task.name, "cancelled")
+            pending.clear()
+
+        i = 0
+        while i < len(pending) and len(running) < max_parallel:
+            task = pending[i]
+            dep = failed_dep(task)
+            if dep is not None:
+                pending.pop(i)
+                ctx.logger.warn(
+                    f"Skipped {task.name}: dependency '{dep}' did not complete.")
+                results[task.name] = TaskResult(
+                    task.name, "skipped", reason=f"dependency '{dep}' failed")
+                continue
+            reason = None if ctx.force else state.skip_reason(
+                task.name, task.freshness)
+            if reason is not None:
+                pending.pop(i)
+                changed = True
+                ctx.logger.info(f"⏭ Skipped {task.name}: {reason}")
+                results[task.name] = TaskResult(
+                    task.name, "fresh", reason=reason)
+                continue
+            if not ready(task, i):
+                i += 1
+                continue
+
+            pending.pop(i)
+            changed = True
+            started += 1
+            ctx.logger.info(f"\n--- {task.name} ({started}/{total}) ---")
+            limits[task.name] = _limits(task)
+            meter = None
+            if volumes:
+                meter = meters[task.name] = SpaceMeter(volumes)
+                # Overlapping tasks share the free-space changes
+                for other, _ in running.values():
+                    meter.overlapped = meters[other.name].overlapped = True
+            fut = _start(ctx, task, limits[task.name], meter)
+            running[fut] = (task, time.monotonic())
+
+        if not running:
+            # Nothing can start: unsatisfiable or circular dependencies
+            for task in pending:
+                ctx.logger.error(
+                    f"Skipped {task.name}: dependencies cannot be satisfied",
+                    depends_on=list(task.depends_on))
+                results[task.name] = TaskResult(
+                    task.name, "skipped", reason="unsatisfiable dependencies")
+            pending.clear()
             break
 
-        on_progress((i - 1) / total, f"Running: {task.name} ({i}/{total})")
-        ctx.logger.info(f"\n--- {task.name} ({i}/{total}) ---")
+        if changed or \
+                time.monotonic() - last_report >= PROGRESS_REPORT_INTERVAL_S:
+            report()
+            changed = False
+        due = [last_report + PROGRESS_REPORT_INTERVAL_S]
+        due += [abandon_at(t, t0) for t, t0 in running.values()
+                if t.timeout_s is not None]
+        waiter = asyncio.ensure_future(wake.wait())
+        done, _ = await asyncio.wait(
+            [*running, waiter], timeout=max(0.0, min(due) - time.monotonic()),
+            return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        for fut in done:
+            if fut is waiter:
+                continue
+            changed = True
+            task, t0 = running.pop(fut)
+            elapsed = time.monotonic() - t0
+            err = fut.exception()
+            if err is not None:
+                ctx.logger.error(
+                    f"Task crashed: {task.name}", error=str(err))
+                results[task.name] = TaskResult(
+                    task.name, "crashed", elapsed, str(err))
+            elif limits[task.name].fired:
+                results[task.name] = TaskResult(
+                    task.name, "timeout", elapsed, exit_code=fut.result(),
+                    reason=f"watchdog: {limits[task.name].fired}")
+            else:
+                rc = fut.result()
+                status = "failed" if isinstance(rc, int) and rc != 0 else "ok"
+                results[task.name] = TaskResult(
+                    task.name, status, elapsed, exit_code=rc)
+            meter = meters.get(task.name)
+            if meter is not None and meter.done:
+                r = results[task.name]
+                r.reclaimed_bytes = meter.reclaimed
+                r.reclaim_rate = meter.rate
+                r.overlapped = meter.overlapped
+            # Only real, uninterrupted runs count for freshness
+            if not ctx.dry_run and not ctx.cancel_event.is_set():
+                r = results[task.name]
+                state.record(task.name, r.status, r.exit_code)
+                await loop.run_in_executor(None, state.save)
 
-        try:
-            task.fn(ctx)
-        except Exception as e:
-            ctx.logger.error(f"Task crashed: {task.name}", error=str(e))
+        for fut, (task, t0) in list(running.items()):
+            if task.timeout_s is None:
+                continue
+            if time.monotonic() < abandon_at(task, t0):
+                continue
+            elapsed = time.monotonic() - t0
+            # Stuck outside run_command (or in a command that cannot be
+            # stopped): leave a thread behind, cancel a coroutine
+            changed = True
+            del running[fut]
+            fut.cancel()
+            lim = limits[task.name]
+            lim.fired = lim.fired or "timeout"
+            ctx.logger.error(
+                f"⏱ Watchdog: {task.name} did not return {elapsed:.0f}s "
+                f"after start (limit {task.timeout_s:.0f}s) — abandoning it")
+            ctx.logger.event("watchdog", task=task.name, kind="timeout",
+                             action="abandoned", timeout_s=task.timeout_s,
+                             elapsed_s=round(elapsed, 3))
+            results[task.name] = TaskResult(
+                task.name, "timeout", elapsed, "did not return",
+                reason="watchdog: abandoned")
+            if not ctx.dry_run and not ctx.cancel_event.is_set():
+                state.record(task.name, "timeout")
+                await loop.run_in_executor(None, state.save)
 
-    on_progress(1.0, "Ready")
+    unwatch()
+    # Pooled PowerShell hosts live for one run
+    await loop.run_in_executor(None, ctx.powershell.close)
+    ctx.progress_sink = None
+
+    _log_summary(ctx, [results[t.name] for t in tasks if t.name in results])
+    on_progress(1.0, "Ready", 0.0)
     if ctx.cancel_event.is_set():
         ctx.logger.warn("\n=== MAINTENANCE CANCELLED ===\n")
     else:
         ctx.logger.info("\n=== MAINTENANCE COMPLETE ===\n")
+
+    return [results[t.name] for t in tasks if t.name in results]
@@ -1,6 +1,10 @@
 from __future__ import annotations
+import json
 import os
 import sys
+from typing import Optional
+
+from config import SCHEDULE_PROFILE
 from process import run_command
 
 TASK_NAME = "MaintenanceTool"
@@ -12,9 +16,20 @@ def _target():
     return sys.executable, f'"{os.path.abspath(sys.argv[0])}"'
 
 
-def install_daily(ctx, hhmm: str) -> None:
+def _write_profile(task_keys: list[str]) -> None:
+    SCHEDULE_PROFILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(SCHEDULE_PROFILE, "w", encoding="utf-8") as f:
+        json.dump({"tasks": task_keys, "dry_run": False}, f, indent=2)
+
+
+def install_daily(ctx, hhmm: str, task_keys: Optional[list[str]] = None) -> None:
+    """
+    Registers a daily task that runs the headless CLI (no GUI) with the
+    task selection stored in SCHEDULE_PROFILE.
+    """
     exe, args = _target()
-    tr = f'"{exe}" {args}'.strip()
+    headless = f'--headless run --profile "{SCHEDULE_PROFILE}"'
+    tr = f'"{exe}" {args} {headless}'.replace("  ", " ")
     cmd = [
         "schtasks", "/Create", "/F",
         "/TN", TASK_NAME,
@@ -26,9 +41,19 @@ def install_daily(ctx, hhmm: str) -> None:
     if ctx.dry_run:
         ctx.logger.info(
             f"(dry-run) Would create scheduled task: {TASK_NAME} at {hhmm}")
+        ctx.logger.info(
+            f"(dry-run) Would write profile {SCHEDULE_PROFILE}: "
+            f"{', '.join(task_keys or []) or '(defaults)'}")
         ctx.logger.info("▶ " + " ".join(cmd))
         return
 
+    if task_keys is not None:
+        try:
+            _write_profile(task_keys)
+        except OSError as e:
+            ctx.logger.error("Could not write schedule profile", error=str(e))
+            return
+
     res = run_command(cmd, logger=ctx.logger,
                       cancel_event=ctx.cancel_event, allow_terminate=False)
     ctx.logger.info(f"Task Scheduler exit code: {res.returncode}")
@@ -1,9 +1,9 @@
 from __future__ import annotations
 from config import CLEANMGR_PROFILE_ID
-from process import run_command
+from aio import run_command_async
 
 
-def run_disk_cleanup(ctx) -> None:
+async def run_disk_cleanup(ctx) -> None:
     ctx.logger.info("\n🗑 DISK CLEANUP (cleanmgr)")
     cmd = ["cleanmgr", f"/sagerun:{CLEANMGR_PROFILE_ID}"]
 
@@ -12,6 +12,7 @@ def run_disk_cleanup(ctx) -> None:
         ctx.logger.info("▶ " + " ".join(cmd))
         return
 
-    res = run_command(cmd, logger=ctx.logger,
-                      cancel_event=ctx.cancel_event, allow_terminate=True)
+    res = await run_command_async(cmd, logger=ctx.logger,
+                                  cancel_event=ctx.cancel_event,
+                                  allow_terminate=True, capture="none")
     ctx.logger.info(f"Disk Cleanup exit code: {res.returncode}")
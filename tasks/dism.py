@@ -1,8 +1,10 @@
 from __future__ import annotations
-from process import run_command
+from typing import Optional
 
+from aio import run_command_async
 
-def run_dism(ctx) -> None:
+
+async def run_dism(ctx) -> Optional[int]:
     ctx.logger.info("\n🧠 DISM RestoreHealth")
     ctx.logger.info("Note: Cancel will stop AFTER DISM completes (safe).")
 
@@ -14,6 +16,9 @@ def run_dism(ctx) -> None:
         return
 
     # Do NOT terminate DISM mid-run
-    res = run_command(cmd, logger=ctx.logger,
-                      cancel_event=ctx.cancel_event, allow_terminate=False)
+    res = await run_command_async(cmd, logger=ctx.logger,
+                                  cancel_event=ctx.cancel_event,
+                                  allow_terminate=False,
+                                  progress=ctx.task_progress, capture="none")
     ctx.logger.info(f"DISM exit code: {res.returncode}")
+    return res.returncode
@@ -0,0 +1,127 @@
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from config import (
+    LOCK_CACHE_FILE, LOCK_CACHE_BACKOFF_S, LOCK_CACHE_MAX_BACKOFF_S,
+    LOCK_CACHE_MAX_ENTRIES,
+)
+
+
+class LockedFileCache:
+    """
+    Remembers files that could not be deleted because they were in use.
+    An entry is skipped until its backoff expires (doubling per failure)
+    or the file changes (different mtime or size). Thread-safe; persisted
+    as JSON with an atomic replace.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        path: Path = LOCK_CACHE_FILE,
+        *,
+        backoff_s: float = LOCK_CACHE_BACKOFF_S,
+        max_backoff_s: float = LOCK_CACHE_MAX_BACKOFF_S,
+        max_entries: int = LOCK_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.path = Path(path)
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.max_entries = max_entries
+        self._entries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path: Path = LOCK_CACHE_FILE, **kw) -> "LockedFileCache":
+        cache = cls(path, **kw)
+        try:
+            with open(cache.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            if raw.get("version") == cls.VERSION:
+                cache._entries = dict(raw.get("entries") or {})
+        except (OSError, ValueError, AttributeError):
+            pass
+        return cache
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._entries:
+                self._entries.clear()
+                self._dirty = True
+
+    def should_skip(self, entry: os.DirEntry) -> bool:
+        rec = self._entries.get(entry.path)
+        if rec is None:
+            return False
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return False
+        if st.st_mtime != rec["mtime"] or st.st_size != rec["size"]:
+            self.forget(entry.path)
+            return False
+        return time.time() < rec["retry_at"]
+
+    def record_locked(self, entry: os.DirEntry) -> None:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return
+        now = time.time()
+        with self._lock:
+            rec = self._entries.get(entry.path)
+            failures = 1
+            if rec and rec["mtime"] == st.st_mtime and rec["size"] == st.st_size:
+                failures = rec["failures"] + 1
+            delay = min(self.backoff_s * 2 ** (failures - 1),
+                        self.max_backoff_s)
+            self._entries[entry.path] = {
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "failures": failures,
+                "last_failed": now,
+                "retry_at": now + delay,
+            }
+            self._dirty = True
+
+    def forget(self, path: str) -> None:
+        if path not in self._entries:
+            return
+        with self._lock:
+            if self._entries.pop(path, None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            # Entries untouched for longer than the longest backoff are stale
+            horizon = time.time() - 2 * self.max_backoff_s
+            entries = {p: r for p, r in self._entries.items()
+                       if r["last_failed"] >= horizon}
+            if len(entries) > self.max_entries:
+                newest = sorted(entries.items(),
+                                key=lambda kv: kv[1]["last_failed"],
+                                reverse=True)[:self.max_entries]
+                entries = dict(newest)
+            self._entries = entries
+            self._dirty = False
+            data = {"version": self.VERSION, "entries": entries}
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
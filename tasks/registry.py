@@ -0,0 +1,104 @@
+"""
+Every maintenance task, declared once. Front ends (GUI, headless CLI,
+agent) build their task lists and controls from TASKS; a task's module is
+imported only when the task starts (runner.Task accepts "module:function"
+targets), so startup does not pay for tasks that are never run.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from config import (
+    DISM_MIN_INTERVAL_DAYS, SFC_MAX_INTERVAL_DAYS, UPDATES_MIN_INTERVAL_HOURS,
+    CLEANMGR_TIMEOUT_S, STORAGE_SENSE_TIMEOUT_S, SFC_TIMEOUT_S, DISM_TIMEOUT_S,
+    UPDATES_TIMEOUT_S, UPDATES_IDLE_TIMEOUT_S,
+)
+from freshness import AtMostEvery, FreshnessPolicy, OnlyIfProblems
+from runner import COMPONENT_STORE, FILESYSTEM_LIGHT, Task
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    key: str                 # CLI / profile key
+    name: str                # display name (logs, history)
+    target: str              # "module:function", imported when the task runs
+    label: str               # GUI checkbox text
+    allow_terminate: bool    # safety policy for its subprocesses
+    default: bool = False    # selected unless the user chooses otherwise
+    slow: bool = False
+    resources: tuple[str, ...] = ()
+    freshness: Optional[FreshnessPolicy] = None
+    timeout_s: Optional[float] = None
+    idle_timeout_s: Optional[float] = None
+
+    @property
+    def module(self) -> str:
+        return self.target.split(":", 1)[0]
+
+    def task(self) -> Task:
+        return Task(self.name, self.target,
+                    allow_terminate=self.allow_terminate, slow=self.slow,
+                    resources=self.resources, freshness=self.freshness,
+                    timeout_s=self.timeout_s,
+                    idle_timeout_s=self.idle_timeout_s)
+
+
+# In display order, which is also the order tasks are started in
+TASKS: dict[str, TaskSpec] = {spec.key: spec for spec in (
+    TaskSpec("temp", "TEMP cleanup", "tasks.temp_cleanup:clear_temp",
+             "Clear TEMP folders (safe, skips locked files)",
+             allow_terminate=False, default=True,
+             resources=(FILESYSTEM_LIGHT,)),
+    TaskSpec("recycle", "Recycle Bin", "tasks.recycle_bin:empty_recycle_bin",
+             "Recycle Bin (current user)",
+             allow_terminate=False, default=True,
+             resources=(FILESYSTEM_LIGHT,)),
+    TaskSpec("cleanmgr", "Disk Cleanup", "tasks.disk_cleanup:run_disk_cleanup",
+             "Disk Cleanup (cleanmgr /sagerun:100)",
+             allow_terminate=True, default=True,
+             # Cleans TEMP / Recycle Bin too, and servicing leftovers
+             resources=(COMPONENT_STORE, FILESYSTEM_LIGHT),
+             timeout_s=CLEANMGR_TIMEOUT_S),
+    TaskSpec("storagesense", "Storage Sense",
+             "tasks.storage_sense:run_storage_sense",
+             "Storage Sense (Windows-managed)",
+             allow_terminate=True, default=True,
+             resources=(FILESYSTEM_LIGHT,), timeout_s=STORAGE_SENSE_TIMEOUT_S),
+    TaskSpec("sfc", "SFC scan", "tasks.sfc:run_sfc", "SFC /scannow (slow)",
+             allow_terminate=False, slow=True,
+             resources=(COMPONENT_STORE,),
+             freshness=OnlyIfProblems(SFC_MAX_INTERVAL_DAYS * 86400),
+             timeout_s=SFC_TIMEOUT_S),
+    TaskSpec("dism", "DISM repair", "tasks.dism:run_dism",
+             "DISM RestoreHealth (slow)",
+             allow_terminate=False, slow=True,
+             resources=(COMPONENT_STORE,),
+             freshness=AtMostEvery(DISM_MIN_INTERVAL_DAYS * 86400),
+             timeout_s=DISM_TIMEOUT_S),
+    TaskSpec("updates", "Windows Update",
+             "tasks.windows_update:run_windows_update",
+             "Windows Update (PSWindowsUpdate)",
+             allow_terminate=False, default=True, slow=True,
+             resources=(COMPONENT_STORE,),
+             freshness=AtMostEvery(UPDATES_MIN_INTERVAL_HOURS * 3600),
+             timeout_s=UPDATES_TIMEOUT_S,
+             idle_timeout_s=UPDATES_IDLE_TIMEOUT_S),
+)}
+
+
+def default_keys() -> list[str]:
+    return [key for key, spec in TASKS.items() if spec.default]
+
+
+def build_tasks(keys: Iterable[str]) -> list[Task]:
+    """Runner tasks for `keys` (unknown keys raise KeyError), in TASKS order."""
+    wanted = set(keys)
+    unknown = wanted - TASKS.keys()
+    if unknown:
+        raise KeyError(f"unknown task(s): {', '.join(sorted(unknown))}")
+    return [spec.task() for key, spec in TASKS.items() if key in wanted]
+
+
+def task_modules() -> list[str]:
+    """Modules loaded by name at run time (PyInstaller hiddenimports)."""
+    return sorted({spec.module for spec in TASKS.values()})
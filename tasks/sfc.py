@@ -1,8 +1,21 @@
 from __future__ import annotations
-from process import run_command
+from typing import Optional
 
+from aio import run_command_async
 
-def run_sfc(ctx) -> None:
+# SFC's result line ("Windows Resource Protection ..."). The output is
+# localized: when neither is found the result is unknown, not a failure.
+CLEAN_MARKER = "did not find any integrity violations"
+PROBLEM_MARKERS = ("found corrupt files", "could not perform the requested")
+
+
+async def run_sfc(ctx) -> Optional[int]:
+    """
+    Returns 0 if SFC reported no integrity violations, 1 if it reported
+    corrupt files (repaired or not) or could not scan, and None when its
+    result line was not recognized: no exit code is recorded, so the
+    scan is neither a failure nor counted as clean for freshness.
+    """
     ctx.logger.info("\n🧠 SFC /scannow")
     ctx.logger.info("Note: Cancel will stop AFTER SFC completes (safe).")
 
@@ -13,7 +26,29 @@ def run_sfc(ctx) -> None:
         ctx.logger.info("▶ " + " ".join(cmd))
         return
 
+    found: Optional[int] = None
+
+    def find_marker(stream: str, line: str) -> None:
+        nonlocal found
+        if stream != "stdout":
+            return
+        line = line.lower()
+        if CLEAN_MARKER in line:
+            found = 0
+        elif any(m in line for m in PROBLEM_MARKERS):
+            found = 1
+
     # Do NOT terminate SFC mid-run
-    res = run_command(cmd, logger=ctx.logger,
-                      cancel_event=ctx.cancel_event, allow_terminate=False)
+    res = await run_command_async(cmd, logger=ctx.logger,
+                                  cancel_event=ctx.cancel_event,
+                                  allow_terminate=False,
+                                  progress=ctx.task_progress,
+                                  consumers=[find_marker], capture="none")
     ctx.logger.info(f"SFC exit code: {res.returncode}")
+    if res.returncode != 0:
+        return res.returncode
+    # sfc exits 0 whether or not it found (and repaired) corrupt files
+    if found is None:
+        ctx.logger.warn("⚠ SFC result not recognized (localized output?) "
+                        "— outcome unknown; it will run again next time.")
+    return found
@@ -1,46 +1,278 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import glob
 import os
-import shutil
+import re
 import tempfile
+from typing import Callable, Hashable, Iterable, Optional
 
+from config import TEMP_CLEANUP_ROOTS, TEMP_VOLUME_PARALLEL
+from logger import current_span
+from runner import current_task
+from tasks.lock_cache import LockedFileCache
+from tasks.tree_delete import (
+    DELETED, ERROR, LINK, LOCKED, MISSING, DeleteStats, EntrySize,
+    delete_tree, format_bytes, scan_tree,
+)
 
-def clear_temp(ctx):
-    temp_path = tempfile.gettempdir()
-    ctx.logger.info("\n🧹 TEMP CLEANUP")
-    ctx.logger.info(f"Target: {temp_path}")
+# "%VAR%" left over after expansion: the variable is not set here
+_UNEXPANDED = re.compile(r"%[^%\\/]+%")
+
+
+def resolve_roots(specs: Iterable[str], *, logger=None) -> list[str]:
+    """
+    Expands configured root patterns ("%TEMP%", environment variables,
+    wildcards) into existing directories, in configuration order. Duplicates
+    and folders inside another root are dropped (they are cleaned with it);
+    drive roots and the user's home folder are refused.
+    """
+    home = os.path.normcase(os.path.realpath(os.path.expanduser("~")))
+    found: list[str] = []
+    for spec in specs:
+        if spec.strip().upper() == "%TEMP%":
+            paths = [tempfile.gettempdir()]
+        else:
+            path = os.path.expandvars(os.path.expanduser(spec.strip()))
+            if not path or _UNEXPANDED.search(path):
+                continue
+            paths = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        for p in paths:
+            p = os.path.realpath(p)
+            if not os.path.isdir(p):
+                continue
+            key = os.path.normcase(p)
+            if os.path.dirname(key) == key or key == home:
+                if logger is not None:
+                    logger.warn(f"⚠ Refusing to clean {p} (too broad).")
+                continue
+            found.append(p)
+
+    keys = [os.path.normcase(p) for p in found]
+    roots: list[str] = []
+    seen: set[str] = set()
+    for p, key in zip(found, keys):
+        if key in seen or any(_inside(key, other) for other in keys):
+            continue
+        seen.add(key)
+        roots.append(p)
+    return roots
 
-    deleted = skipped = errors = 0
 
-    for entry in os.scandir(temp_path):
-        if ctx.cancel_event.is_set():
-            ctx.logger.warn("⏹ Cancel requested — stopping TEMP cleanup.")
-            break
+def _inside(key: str, other: str) -> bool:
+    return key != other and key.startswith(other.rstrip(os.sep) + os.sep)
 
+
+def volume_key(path: str) -> Hashable:
+    """The volume holding `path` (its st_dev: the volume serial on Windows)."""
+    return os.stat(path).st_dev
+
+
+def _per_volume(
+    ctx,
+    roots: list[str],
+    fn: Callable[[str], object],
+    volume_of: Callable[[str], Hashable],
+) -> dict[str, object]:
+    """
+    Calls fn(root) for every root: roots on different volumes in parallel
+    (up to TEMP_VOLUME_PARALLEL volumes), roots on one volume one after
+    another. Stops starting roots once cancel is requested. Returns
+    {root: fn(root)} for the roots that ran.
+    """
+    groups: dict[Hashable, list[str]] = {}
+    for root in roots:
         try:
-            if entry.is_file(follow_symlinks=False):
-                if ctx.dry_run:
-                    deleted += 1
-                else:
-                    os.remove(entry.path)
-                    deleted += 1
-            elif entry.is_dir(follow_symlinks=False):
-                if entry.is_symlink():
-                    skipped += 1
-                    ctx.logger.warn(f"⚠ Skipped symlink dir: {entry.path}")
-                    continue
-
-                if ctx.dry_run:
-                    deleted += 1
-                else:
-                    shutil.rmtree(entry.path)
-                    deleted += 1
-
-        except PermissionError:
-            skipped += 1
-            ctx.logger.warn(f"⚠ Skipped (in use): {entry.path}")
-        except Exception as e:
-            errors += 1
-            ctx.logger.error(f"❌ Error deleting {entry.path}", error=str(e))
+            key = volume_of(root)
+        except OSError:
+            key = root
+        groups.setdefault(key, []).append(root)
+
+    results: dict[str, object] = {}
+
+    def run_group(group: list[str]) -> None:
+        for root in group:
+            if ctx.cancel_event.is_set():
+                return
+            results[root] = fn(root)
+
+    if len(groups) <= 1:
+        for group in groups.values():
+            run_group(group)
+        return results
+
+    # Each volume thread logs inside the task span, like the task itself
+    with ThreadPoolExecutor(
+            max_workers=min(len(groups), max(1, TEMP_VOLUME_PARALLEL)),
+            thread_name_prefix="temp-volume") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, run_group, g)
+                   for g in groups.values()]
+        for f in futures:
+            f.result()
+    return results
+
+
+def clear_temp(
+    ctx,
+    roots: Optional[list[str]] = None,
+    *,
+    volume_of: Callable[[str], Hashable] = volume_key,
+):
+    """
+    Cleans every TEMP root (the already resolved `roots`, else
+    ctx.temp_roots, else TEMP_CLEANUP_ROOTS), volume by volume, with a
+    summary per root and a total. The configured system-wide defaults
+    are only used inside a task run (run_tasks); other callers must name
+    their roots.
+    """
+    specs = getattr(ctx, "temp_roots", None)
+    if roots is None and specs is None:
+        if current_task() is None:
+            raise ValueError("clear_temp outside a task run needs explicit "
+                             "roots (or ctx.temp_roots)")
+        specs = TEMP_CLEANUP_ROOTS
+    ctx.logger.info("\n🧹 TEMP CLEANUP")
+    if roots is None:
+        roots = resolve_roots(specs, logger=ctx.logger)
+    if not roots:
+        ctx.logger.info("No TEMP folders found to clean.")
+        return
+    for root in roots:
+        ctx.logger.info(f"Target: {root}")
+
+    if ctx.dry_run:
+        _dry_run(ctx, roots, volume_of)
+        return
+
+    cache = LockedFileCache.load()
+    if ctx.retry_locked and len(cache):
+        ctx.logger.info(
+            f"Retrying {len(cache)} previously locked file(s) (forced).")
+        cache.clear()
+
+    def on_outcome(o):
+        if o.status == DELETED:
+            if not o.is_dir:
+                cache.forget(o.path)
+        elif o.status == LOCKED:
+            if o.entry is not None:
+                cache.record_locked(o.entry)
+            ctx.logger.warn(f"⚠ Skipped (in use): {o.path}")
+        elif o.status == LINK:
+            ctx.logger.warn(f"⚠ Skipped symlink: {o.path}")
+        elif o.status == MISSING:
+            cache.forget(o.path)
+        elif o.status == ERROR:
+            ctx.logger.error(f"❌ Error deleting {o.path}", error=o.error)
+
+    task_span = current_span()
+
+    def clean(root: str) -> DeleteStats:
+        with ctx.logger.span("phase", "delete", root=root) as span:
+            try:
+                stats = delete_tree(root, cancel_event=ctx.cancel_event,
+                                    keep_root=True, on_outcome=on_outcome,
+                                    skip=cache.should_skip, sizes=True)
+            except OSError as e:
+                # One bad root must not cost the others their cleanup
+                ctx.logger.error(f"❌ Cannot clean {root}", error=str(e))
+                stats = DeleteStats(errors=1)
+            for sp in (span, task_span):
+                sp.add("files_deleted", stats.files_deleted)
+                sp.add("dirs_deleted", stats.dirs_deleted)
+                sp.add("bytes_freed", stats.bytes_deleted)
+                sp.add("files_locked", stats.locked)
+                sp.add("files_postponed", stats.postponed)
+                sp.add("errors", stats.errors)
+        ctx.logger.info(f"{root} → {_deleted_summary(stats)}")
+        return stats
+
+    try:
+        done = _per_volume(ctx, roots, clean, volume_of)
+    finally:
+        cache.save()
+
+    total = DeleteStats()
+    for stats in done.values():
+        total.files_deleted += stats.files_deleted
+        total.dirs_deleted += stats.dirs_deleted
+        total.bytes_deleted += stats.bytes_deleted
+        total.locked += stats.locked
+        total.links += stats.links
+        total.postponed += stats.postponed
+        total.errors += stats.errors
+        total.cancelled |= stats.cancelled
+
+    if total.cancelled or len(done) < len(roots):
+        ctx.logger.warn("⏹ Cancel requested — stopping TEMP cleanup.")
+    if total.postponed:
+        ctx.logger.info(
+            f"Postponed {total.postponed} file(s) that were locked on "
+            f"earlier runs (unchanged since).")
+
+    ctx.logger.info(f"Summary → {_deleted_summary(total)}")
+
+
+def _deleted_summary(stats: DeleteStats) -> str:
+    return (
+        f"Deleted: {stats.files_deleted} files, "
+        f"{stats.dirs_deleted} folders ({format_bytes(stats.bytes_deleted)}), "
+        f"Skipped: {stats.locked + stats.links + stats.postponed}, "
+        f"Errors: {stats.errors}"
+    )
+
+
+def _dry_run(ctx, roots, volume_of):
+    def scan(root: str) -> tuple[int, int, int, int, int]:
+        with ctx.logger.span("phase", "scan", root=root) as span:
+            try:
+                entries = scan_tree(root, cancel_event=ctx.cancel_event)
+            except OSError as e:
+                entries = [EntrySize(root, True, errors=1)]
+                ctx.logger.error(f"❌ Cannot scan {root}", error=str(e))
+            else:
+                if any(e.path == root for e in entries):
+                    ctx.logger.warn(f"⚠ Cannot list {root}")
+            span.add("files_scanned", sum(e.files for e in entries))
+            span.add("bytes_reclaimable", sum(e.bytes for e in entries))
+
+        files = sum(e.files for e in entries)
+        total = sum(e.bytes for e in entries)
+        links = sum(e.links for e in entries)
+        errors = sum(e.errors for e in entries)
+        entries.sort(key=lambda e: e.bytes, reverse=True)
+
+        ctx.logger.event(
+            "temp_dry_run",
+            root=root,
+            files=files,
+            bytes=total,
+            links=links,
+            errors=errors,
+            complete=not ctx.cancel_event.is_set(),
+            entries=[{
+                "path": e.path, "dir": e.is_dir, "files": e.files,
+                "dirs": e.dirs, "bytes": e.bytes, "links": e.links,
+                "errors": e.errors,
+            } for e in entries],
+        )
+
+        for e in entries[:5]:
+            if e.bytes:
+                ctx.logger.info(f"  {format_bytes(e.bytes):>10}  {e.path}")
+        ctx.logger.info(
+            f"{root} → Would free: {format_bytes(total)} in {files} files "
+            f"({len(entries)} entries), Skipped: {links}, Unreadable: {errors}")
+        return files, total, len(entries), links, errors
+
+    done = _per_volume(ctx, roots, scan, volume_of)
+    if ctx.cancel_event.is_set():
+        ctx.logger.warn("⏹ Cancel requested — stopping TEMP cleanup.")
 
+    files, total, entries, links, errors = (
+        sum(col) for col in zip((0, 0, 0, 0, 0), *done.values()))
     ctx.logger.info(
-        f"Summary → Deleted: {deleted}, Skipped: {skipped}, Errors: {errors}"
+        f"Summary (dry-run) → Would free: {format_bytes(total)} "
+        f"in {files} files ({entries} entries), "
+        f"Skipped: {links}, Unreadable: {errors}"
     )
@@ -0,0 +1,390 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import os
+import stat
+import threading
+from typing import Callable, Optional
+
+from config import DELETE_WORKERS
+
+# Files per deletion job; large flat directories are split across workers
+_CHUNK = 256
+
+_REPARSE_POINT = getattr(stat, "FILE_ATTRIBUTE_REPARSE_POINT", 0x400)
+_READONLY = getattr(stat, "FILE_ATTRIBUTE_READONLY", 0x1)
+
+# Outcome statuses
+DELETED = "deleted"
+LOCKED = "locked"        # in use / access denied; parent tree continues
+MISSING = "missing"      # vanished while we were working on it
+LINK = "link"            # symlink or junction; never followed, never removed
+NOT_EMPTY = "not-empty"  # directory kept because something inside was kept
+POSTPONED = "postponed"  # skipped on request (e.g. known to be locked)
+ERROR = "error"
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+@dataclass(frozen=True)
+class DeleteOutcome:
+    path: str
+    is_dir: bool
+    status: str
+    error: Optional[str] = None
+    size: int = 0  # bytes, for deleted files when sizes were requested
+    # Listing entry for files, so callers can reuse its cached stat()
+    entry: Optional[os.DirEntry] = field(
+        default=None, repr=False, compare=False)
+
+
+@dataclass
+class DeleteStats:
+    files_deleted: int = 0
+    bytes_deleted: int = 0
+    dirs_deleted: int = 0
+    locked: int = 0
+    links: int = 0
+    kept_dirs: int = 0
+    postponed: int = 0
+    errors: int = 0
+    cancelled: bool = False
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False)
+
+    def count(self, o: DeleteOutcome) -> None:
+        with self._lock:
+            if o.status == DELETED:
+                if o.is_dir:
+                    self.dirs_deleted += 1
+                else:
+                    self.files_deleted += 1
+                    self.bytes_deleted += o.size
+            elif o.status == LOCKED:
+                self.locked += 1
+            elif o.status == LINK:
+                self.links += 1
+            elif o.status == NOT_EMPTY:
+                self.kept_dirs += 1
+            elif o.status == POSTPONED:
+                self.postponed += 1
+            elif o.status == ERROR:
+                self.errors += 1
+
+
+def is_link(entry: os.DirEntry) -> bool:
+    """Symlinks and Windows junctions / other reparse points."""
+    if entry.is_symlink():
+        return True
+    if os.name != "nt":
+        return False
+    try:
+        attrs = getattr(entry.stat(follow_symlinks=False),
+                        "st_file_attributes", 0)
+    except OSError:
+        return False
+    return bool(attrs & _REPARSE_POINT)
+
+
+class _Dir:
+    __slots__ = ("path", "parent", "pending", "lock", "remove")
+
+    def __init__(self, path: str, parent: Optional["_Dir"], remove: bool) -> None:
+        self.path = path
+        self.parent = parent
+        self.pending = 1  # the scan job itself
+        self.lock = threading.Lock()
+        self.remove = remove
+
+
+class _TreeDeleter:
+    def __init__(self, pool, cancel_event, on_outcome, skip, sizes: bool,
+                 stats: DeleteStats) -> None:
+        self.pool = pool
+        self.sizes = sizes
+        self.cancel_event = cancel_event
+        self.on_outcome = on_outcome
+        self.skip = skip
+        self.stats = stats
+        self.done = threading.Event()
+
+    def report(self, path: str, is_dir: bool, status: str,
+               error: Optional[str] = None,
+               entry: Optional[os.DirEntry] = None, size: int = 0) -> None:
+        o = DeleteOutcome(path, is_dir, status, error, size, entry)
+        self.stats.count(o)
+        if self.on_outcome:
+            try:
+                self.on_outcome(o)
+            except Exception:
+                pass
+
+    # ---------------- jobs ----------------
+
+    def scan(self, node: _Dir) -> None:
+        files: list[os.DirEntry] = []
+        try:
+            if self.cancel_event.is_set():
+                return
+            with os.scandir(node.path) as it:
+                for entry in it:
+                    if self.cancel_event.is_set():
+                        break
+                    if is_link(entry):
+                        self.report(entry.path, False, LINK)
+                    elif entry.is_dir(follow_symlinks=False):
+                        self.spawn(_Dir(entry.path, node, True))
+                    else:
+                        files.append(entry)
+                        if len(files) >= _CHUNK:
+                            self.spawn_files(node, files)
+                            files = []
+            self.delete_files(files)
+        except FileNotFoundError:
+            pass
+        except PermissionError as e:
+            self.report(node.path, True, LOCKED, str(e))
+        except Exception as e:
+            self.report(node.path, True, ERROR, str(e))
+        finally:
+            self.release(node)
+
+    def spawn(self, child: _Dir) -> None:
+        with child.parent.lock:
+            child.parent.pending += 1
+        self.pool.submit(self.scan, child)
+
+    def spawn_files(self, node: _Dir, files: list[os.DirEntry]) -> None:
+        with node.lock:
+            node.pending += 1
+
+        def job() -> None:
+            try:
+                self.delete_files(files)
+            finally:
+                self.release(node)
+
+        self.pool.submit(job)
+
+    def delete_files(self, files: list[os.DirEntry]) -> None:
+        for entry in files:
+            if self.cancel_event.is_set():
+                return
+            if self.skip is not None and self.skip(entry):
+                self.report(entry.path, False, POSTPONED, entry=entry)
+                continue
+            size = 0
+            try:
+                if self.sizes:
+                    # Cached from the directory listing on Windows
+                    size = entry.stat(follow_symlinks=False).st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                self.report(entry.path, False, MISSING, entry=entry)
+                continue
+            except PermissionError as e:
+                if not self._retry_readonly(entry):
+                    self.report(entry.path, False, LOCKED, str(e), entry)
+                    continue
+            except Exception as e:
+                self.report(entry.path, False, ERROR, str(e), entry)
+                continue
+            self.report(entry.path, False, DELETED, entry=entry, size=size)
+
+    @staticmethod
+    def _retry_readonly(entry: os.DirEntry) -> bool:
+        # Read-only files raise PermissionError on Windows; in-use files too.
+        try:
+            attrs = getattr(entry.stat(follow_symlinks=False),
+                            "st_file_attributes", 0)
+            if not attrs & _READONLY:
+                return False
+            os.chmod(entry.path, stat.S_IWRITE)
+            os.remove(entry.path)
+            return True
+        except Exception:
+            return False
+
+    def release(self, node: _Dir) -> None:
+        """Drops one pending job; the last one removes the directory."""
+        while node is not None:
+            with node.lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+            if node.remove and not self.cancel_event.is_set():
+                self.remove_dir(node.path)
+            if node.parent is None:
+                self.done.set()
+            node = node.parent
+
+    def remove_dir(self, path: str) -> None:
+        try:
+            os.rmdir(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            # Non-empty because a locked file or a link inside was kept
+            try:
+                with os.scandir(path) as it:
+                    kept = next(it, None) is not None
+            except OSError:
+                kept = False
+            if kept:
+                self.report(path, True, NOT_EMPTY)
+            elif isinstance(e, PermissionError):
+                self.report(path, True, LOCKED, str(e))
+            else:
+                self.report(path, True, ERROR, str(e))
+            return
+        self.report(path, True, DELETED)
+
+
+def delete_tree(
+    path: str,
+    *,
+    cancel_event,
+    keep_root: bool = False,
+    workers: int = DELETE_WORKERS,
+    on_outcome: Optional[Callable[[DeleteOutcome], None]] = None,
+    skip: Optional[Callable[[os.DirEntry], bool]] = None,
+    sizes: bool = False,
+) -> DeleteStats:
+    """
+    Deletes `path` bottom-up on a thread pool: directories are scanned with
+    os.scandir in parallel, files are removed by the workers, and each
+    directory is removed once everything below it has been processed.
+    Locked files are reported and skipped individually; their parent
+    directories are kept, everything else is still deleted.
+    Symlinks and junctions are never followed or removed.
+    `on_outcome` is called from worker threads for every path touched;
+    files for which `skip(entry)` is true are left alone as POSTPONED.
+    With `sizes`, deleted files carry their size (stats.bytes_deleted).
+    """
+    stats = DeleteStats()
+    with ThreadPoolExecutor(max_workers=max(1, workers),
+                            thread_name_prefix="delete") as pool:
+        deleter = _TreeDeleter(pool, cancel_event, on_outcome, skip, sizes,
+                               stats)
+        pool.submit(deleter.scan, _Dir(path, None, not keep_root))
+        deleter.done.wait()
+    stats.cancelled = cancel_event.is_set()
+    return stats
+
+
+@dataclass
+class EntrySize:
+    path: str
+    is_dir: bool
+    files: int = 0
+    dirs: int = 0
+    bytes: int = 0
+    links: int = 0
+    errors: int = 0
+
+
+class _TreeScanner:
+    def __init__(self, pool, cancel_event) -> None:
+        self.pool = pool
+        self.cancel_event = cancel_event
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.done = threading.Event()
+
+    def submit(self, path: str, bucket: EntrySize) -> None:
+        with self.lock:
+            self.pending += 1
+        self.pool.submit(self.scan, path, bucket)
+
+    def scan(self, path: str, bucket: EntrySize) -> None:
+        files = dirs = size = links = errors = 0
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if self.cancel_event.is_set():
+                        break
+                    try:
+                        if is_link(entry):
+                            links += 1
+                        elif entry.is_dir(follow_symlinks=False):
+                            dirs += 1
+                            self.submit(entry.path, bucket)
+                        else:
+                            # Cached from the directory listing on Windows
+                            size += entry.stat(follow_symlinks=False).st_size
+                            files += 1
+                    except OSError:
+                        errors += 1
+        except FileNotFoundError:
+            pass
+        except OSError:
+            errors += 1
+        finally:
+            with self.lock:
+                bucket.files += files
+                bucket.dirs += dirs
+                bucket.bytes += size
+                bucket.links += links
+                bucket.errors += errors
+                self.pending -= 1
+                if not self.pending:
+                    self.done.set()
+
+
+def scan_tree(
+    path: str,
+    *,
+    cancel_event,
+    workers: int = DELETE_WORKERS,
+) -> list[EntrySize]:
+    """
+    Sizes every top-level entry of `path` without deleting anything:
+    file counts and bytes are summed recursively on a thread pool from
+    the DirEntry.stat() data of each listing. Links are counted, never
+    followed. Returns one EntrySize per top-level entry; a root that
+    cannot be listed comes back as a single entry for `path` with
+    errors=1, a missing one as an empty list.
+    """
+    results: list[EntrySize] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers),
+                            thread_name_prefix="scan") as pool:
+        scanner = _TreeScanner(pool, cancel_event)
+        with scanner.lock:
+            scanner.pending += 1  # held until every top-level dir is queued
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if cancel_event.is_set():
+                        break
+                    try:
+                        if is_link(entry):
+                            results.append(
+                                EntrySize(entry.path, False, links=1))
+                        elif entry.is_dir(follow_symlinks=False):
+                            bucket = EntrySize(entry.path, True)
+                            results.append(bucket)
+                            scanner.submit(entry.path, bucket)
+                        else:
+                            st = entry.stat(follow_symlinks=False)
+                            results.append(EntrySize(
+                                entry.path, False, files=1, bytes=st.st_size))
+                    except OSError:
+                        results.append(EntrySize(entry.path, False, errors=1))
+        except FileNotFoundError:
+            pass  # vanished: nothing to size
+        except OSError:
+            # The root itself cannot be listed (e.g. access denied)
+            results.append(EntrySize(path, True, errors=1))
+        finally:
+            with scanner.lock:
+                scanner.pending -= 1
+                if not scanner.pending:
+                    scanner.done.set()
+            scanner.done.wait()
+    return results
@@ -0,0 +1,70 @@
+"""
+Test setup: the tool's modules live flat in the repo root, and logs /
+state files go to a scratch LOCALAPPDATA instead of the user profile.
+"""
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+# Before config is imported: BASE_DIR derives from it
+os.environ["LOCALAPPDATA"] = tempfile.mkdtemp(prefix="mt_tests_")
+
+# Child for the cancel / watchdog tests (args: mode, seconds): prints
+# "started", sleeps, prints "finished". polite: exits on SIGTERM.
+# stubborn: ignores it and leaves a grandchild holding the output pipes.
+SLEEPER = r"""
+import signal, subprocess, sys, time
+if sys.argv[1] == "stubborn":
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+print("started", flush=True)
+time.sleep(float(sys.argv[2]))
+print("finished", flush=True)
+"""
+
+
+def sleeper_argv(mode: str, seconds: float) -> list[str]:
+    return [sys.executable, "-c", SLEEPER, mode, str(seconds)]
+
+
+class RecordingLogger:
+    """Logger stand-in: keeps (level, message) pairs, no files."""
+
+    def __init__(self) -> None:
+        self.records: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, level: str, message: str) -> None:
+        with self._lock:
+            self.records.append((level, message))
+
+    def info(self, message: str, **data) -> None:
+        self._add("INFO", message)
+
+    def warn(self, message: str, **data) -> None:
+        self._add("WARN", message)
+
+    def error(self, message: str, **data) -> None:
+        self._add("ERROR", message)
+
+    def event(self, name: str, /, **data) -> None:
+        self._add("EVENT", name)
+
+    def span(self, kind: str, name: str, **attrs):
+        from logger import NULL_SPAN
+        return NULL_SPAN
+
+    def messages(self, level: str) -> list[str]:
+        return [m for lv, m in self.records if lv == level]
+
+
+@pytest.fixture
+def log() -> RecordingLogger:
+    return RecordingLogger()
@@ -0,0 +1,113 @@
+"""Cancel-to-idle latency: from cancel until run_tasks has returned."""
+import threading
+import time
+
+from config import CANCEL_DRAIN_S, CANCEL_KILL_AFTER_S
+from conftest import sleeper_argv
+from process import CANCEL_POLL_S, run_command
+from runner import Context, Task, run_tasks
+from tasks.tree_delete import delete_tree
+
+# Scheduling, interpreter start-up and the runner's own bookkeeping
+SLACK_S = 1.0
+# Bounds the test asserts (seconds from cancel to worker idle)
+POLITE_BOUND_S = CANCEL_POLL_S + SLACK_S
+STUBBORN_BOUND_S = CANCEL_KILL_AFTER_S + CANCEL_DRAIN_S + SLACK_S
+DELETE_BOUND_S = CANCEL_POLL_S + SLACK_S
+HANG_BOUND_S = 30.0
+
+
+def _cancel_latency(log, fn, *, allow_terminate: bool,
+                    ready: threading.Event) -> float:
+    """Cancels once `ready` is set; seconds until run_tasks has returned."""
+    cancel = threading.Event()
+    ctx = Context(logger=log, cancel_event=cancel, dry_run=False)
+    done = threading.Event()
+
+    def work() -> None:
+        run_tasks(ctx, [Task("cancel-me", fn, allow_terminate=allow_terminate)],
+                  lambda *a: None)
+        done.set()
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    assert ready.wait(HANG_BOUND_S), "task never got going"
+    t0 = time.perf_counter()
+    cancel.set()
+    assert done.wait(HANG_BOUND_S), f"run_tasks hung for {HANG_BOUND_S}s"
+    latency = time.perf_counter() - t0
+    worker.join()
+    return latency
+
+
+def _sleeper(mode: str, seconds: float, box: dict, *,
+             allow_terminate: bool = True):
+    started = threading.Event()
+
+    def on_line(stream: str, line: str) -> None:
+        if line == "started":
+            started.set()
+
+    def fn(ctx) -> None:
+        box["res"] = run_command(
+            sleeper_argv(mode, seconds), logger=ctx.logger,
+            cancel_event=ctx.cancel_event, allow_terminate=allow_terminate,
+            consumers=[on_line])
+
+    return fn, started
+
+
+def test_polite_child_stops_within_poll_interval(log, record_property):
+    box: dict = {}
+    fn, started = _sleeper("polite", 60, box)
+    latency = _cancel_latency(log, fn, allow_terminate=True, ready=started)
+    record_property("cancel_s", round(latency, 3))
+    assert latency < POLITE_BOUND_S, latency
+    assert box["res"].returncode != 0
+
+
+def test_stubborn_tree_stops_within_kill_and_drain(log, record_property):
+    box: dict = {}
+    fn, started = _sleeper("stubborn", 60, box)
+    latency = _cancel_latency(log, fn, allow_terminate=True, ready=started)
+    record_property("cancel_s", round(latency, 3))
+    assert latency < STUBBORN_BOUND_S, latency
+
+
+def test_delete_tree_stops_promptly(log, tmp_path, record_property):
+    root = tmp_path / "tree"
+    for d in range(40):
+        sub = root / f"d{d}"
+        sub.mkdir(parents=True)
+        for i in range(250):
+            (sub / f"f{i}.tmp").write_bytes(b"x")
+
+    began = threading.Event()
+    box: dict = {}
+
+    def fn(ctx) -> None:
+        def on_outcome(o) -> None:
+            began.set()
+            # Keep the deletion going long enough to be cancelled mid-way
+            time.sleep(0.001)
+        box["stats"] = delete_tree(str(root), cancel_event=ctx.cancel_event,
+                                   keep_root=True, on_outcome=on_outcome)
+
+    latency = _cancel_latency(log, fn, allow_terminate=False, ready=began)
+    record_property("cancel_s", round(latency, 3))
+    assert latency < DELETE_BOUND_S, latency
+    assert box["stats"].cancelled
+    assert any(root.rglob("*.tmp")), "cancel came too late to be tested"
+
+
+def test_command_without_allow_terminate_is_not_killed(log):
+    box: dict = {}
+    fn, started = _sleeper("polite", 1.0, box, allow_terminate=False)
+    latency = _cancel_latency(log, fn, allow_terminate=False, ready=started)
+    res = box["res"]
+    # Ran to its own end: exit 0, its last line read, nothing detached
+    assert res.returncode == 0
+    assert not res.detached
+    assert "finished" in log.messages("INFO")
+    assert latency > 0.5
+    assert not any("terminating" in m for m in log.messages("WARN"))
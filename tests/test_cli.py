@@ -0,0 +1,33 @@
+"""Headless exit codes: a task's non-zero exit code fails the run."""
+import threading
+
+import cli
+from runner import Task
+
+
+def _execute(monkeypatch, rc):
+    task = Task("Exit code", lambda ctx: rc, allow_terminate=True)
+    monkeypatch.setattr(cli, "build_tasks", lambda keys: [task])
+    box: dict = {}
+
+    # Off the main thread: execute() would install its signal handlers
+    def work() -> None:
+        box["out"] = cli.execute(["temp"], dry_run=True)
+
+    worker = threading.Thread(target=work)
+    worker.start()
+    worker.join(30)
+    return box["out"]
+
+
+def test_nonzero_task_exit_code_fails_the_run(monkeypatch):
+    rc, [result] = _execute(monkeypatch, 3)
+    assert rc == cli.EXIT_TASK_FAILED
+    assert (result.status, result.exit_code) == ("failed", 3)
+
+
+def test_zero_exit_code_and_none_succeed(monkeypatch):
+    for task_rc in (0, None):
+        rc, [result] = _execute(monkeypatch, task_rc)
+        assert rc == cli.EXIT_OK
+        assert result.status == "ok"
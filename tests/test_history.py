@@ -0,0 +1,157 @@
+"""History ingestion of structured and legacy (text-only) logs."""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from conftest import ROOT
+from history import HistoryStore, is_legacy
+from logger import Logger
+
+STEM = "maintenance_20240105_100000"
+
+
+def _legacy_log(log_dir, records) -> None:
+    path = log_dir / f"{STEM}.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for ts, level, message in records:
+            f.write(json.dumps({"ts": f"2024-01-05T10:{ts}+00:00",
+                                "level": level, "message": message,
+                                "data": {}}) + "\n")
+    old = time.time() - 86400
+    os.utime(path, (old, old))
+
+
+RUN = [
+    ("00:00", "INFO", "MaintenanceTool v1.0 started"),
+    ("00:01", "INFO", "\n=== MAINTENANCE START ==="),
+    ("00:01", "INFO", "Dry-run: False"),
+    ("00:02", "INFO", "\n--- TEMP cleanup (1/3) ---"),
+    ("00:05", "WARN", "⚠ Skipped (in use): C:\\x.tmp"),
+    ("00:32", "INFO", "\n--- SFC scan (2/3) ---"),
+    ("05:32", "ERROR", "Task crashed: SFC scan"),
+    ("05:33", "INFO", "\n--- Recycle Bin (3/3) ---"),
+    ("05:43", "INFO", "\n=== MAINTENANCE COMPLETE ===\n"),
+]
+
+
+def test_legacy_log_runs_and_task_durations(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    _legacy_log(logs, RUN)
+    with HistoryStore(tmp_path / "history.db") as store:
+        assert store.sync(logs) == 1
+        [run] = store.runs()
+        assert is_legacy(run["run_id"])
+        assert (run["status"], run["dry_run"]) == ("failed", 0)
+        assert run["duration_s"] == 342
+        assert (run["warnings"], run["errors"]) == (1, 1)
+        assert store.legacy_runs() == 1
+
+        tasks = {t["name"]: t for t in store.task_stats()}
+        # Consecutive headers: TEMP 00:02 -> 00:32, SFC -> 05:33, RB -> end
+        assert tasks["TEMP cleanup"]["avg_s"] == 30
+        assert tasks["SFC scan"]["avg_s"] == 301
+        assert tasks["Recycle Bin"]["avg_s"] == 10
+        assert tasks["SFC scan"]["failed"] == 1
+        assert tasks["TEMP cleanup"]["warnings"] == 1
+        assert store.median_durations(["TEMP cleanup"]) == {"TEMP cleanup": 30}
+
+
+def test_legacy_run_without_end_is_incomplete(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    _legacy_log(logs, RUN[:5])
+    with HistoryStore(tmp_path / "history.db") as store:
+        store.sync(logs)
+        [run] = store.runs()
+        assert run["status"] == "incomplete"
+
+
+def test_legacy_logs_read_as_empty_are_read_again(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    _legacy_log(logs, RUN)
+    db = tmp_path / "history.db"
+    with HistoryStore(db) as store:
+        # What an older version left behind: the log done, no runs
+        store.db.execute("INSERT INTO sources VALUES (?, 1, 0, 1)", (STEM,))
+        store.db.execute("PRAGMA user_version = 0")
+        store.db.commit()
+    with HistoryStore(db) as store:
+        assert store.sync(logs) == 1
+    assert sqlite3.connect(db).execute("PRAGMA user_version").fetchone()[0] == 1
+
+
+def test_concurrent_agents_are_separate_runs(tmp_path):
+    # Four agent processes start in the same second and each logs one run
+    env = dict(os.environ, LOCALAPPDATA=str(tmp_path))
+    proc = subprocess.run(
+        [sys.executable, str(ROOT / "cli.py"), "orchestrate",
+         "--hosts", "a,b,c,d", "--tasks", "temp"],
+        env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    logs = tmp_path / "MaintenanceTool" / "logs"
+    with HistoryStore(tmp_path / "history.db") as store:
+        assert store.sync(logs) == 4
+        runs = store.runs()
+        assert len({r["run_id"] for r in runs}) == 4
+        assert all(r["status"] == "ok" for r in runs)
+
+
+def _complete(store, stem) -> bool:
+    row = store.db.execute("SELECT complete FROM sources WHERE stem = ?",
+                           (stem,)).fetchone()
+    return bool(row["complete"])
+
+
+def _structured_log(log_dir, stem, *, run_ends: bool) -> None:
+    records = [("span_start", {"id": "1", "kind": "run", "name": "run"})]
+    if run_ends:
+        records.append(("span_end", {"id": "1", "kind": "run", "name": "run",
+                                     "duration_s": 1.0}))
+    path = log_dir / f"{stem}.jsonl"
+    with open(path, "w", encoding="utf-8") as f:
+        for message, data in records:
+            f.write(json.dumps({"ts": "2024-01-05T10:00:00+00:00",
+                                "level": "EVENT", "message": message,
+                                "data": data}) + "\n")
+    old = time.time() - 86400
+    os.utime(path, (old, old))
+
+
+def test_idle_log_of_a_live_writer_is_not_complete(tmp_path):
+    # An open GUI: its run ended hours ago, the process still runs
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    stem = f"maintenance_20240105_100000_{os.getpid()}"
+    _structured_log(logs, stem, run_ends=True)
+    with HistoryStore(tmp_path / "history.db") as store:
+        assert store.sync(logs) == 1
+        assert not _complete(store, stem)
+
+
+def test_log_of_a_dead_writer_is_complete(tmp_path):
+    logs = tmp_path / "logs"
+    logs.mkdir()
+    gone = subprocess.Popen([sys.executable, "-c", "pass"])
+    gone.wait()
+    stem = f"maintenance_20240105_100000_{gone.pid}"
+    _structured_log(logs, stem, run_ends=False)
+    with HistoryStore(tmp_path / "history.db") as store:
+        store.sync(logs)
+        assert _complete(store, stem)
+        [run] = store.runs()
+        assert run["status"] == "incomplete"
+
+
+def test_closed_log_is_complete_while_its_writer_runs(tmp_path):
+    log = Logger(coalesce=False)
+    with log.span("run", "maintenance"):
+        log.info("working")
+    log.close()
+    with HistoryStore(tmp_path / "history.db") as store:
+        store.sync(log.paths.jsonl.parent)
+        assert _complete(store, log.run_id)
@@ -0,0 +1,74 @@
+"""Logger: thread-safe level counts; enqueue never waits on the loop thread."""
+import os
+import queue
+import threading
+import time
+
+import aio
+from config import LOG_ENQUEUE_TIMEOUT_S
+from log_retention import LOG_NAME_RE
+from logger import _TEXT, LogPaths, Logger, _LogWriter, part_path
+
+
+def _full_put_nowait(item) -> None:
+    raise queue.Full
+
+
+def _full_put(item, block: bool = True, timeout=None) -> None:
+    time.sleep(timeout or 0)
+    raise queue.Full
+
+
+def test_full_queue_drops_at_once_on_loop_thread(tmp_path, monkeypatch):
+    w = _LogWriter(LogPaths(tmp_path / "t.log", tmp_path / "t.jsonl"))
+    # The writer thread keeps reading the real queue; producers see it full
+    monkeypatch.setattr(w._q, "put_nowait", _full_put_nowait)
+    monkeypatch.setattr(w._q, "put", _full_put)
+
+    async def put_on_loop() -> float:
+        t0 = time.perf_counter()
+        w.put(_TEXT, "line")
+        return time.perf_counter() - t0
+
+    try:
+        on_loop = aio.run(put_on_loop)
+        assert w.stats.dropped == 1
+        assert on_loop < LOG_ENQUEUE_TIMEOUT_S / 2
+
+        # Other threads still wait for room before giving up
+        t0 = time.perf_counter()
+        w.put(_TEXT, "line")
+        assert time.perf_counter() - t0 >= LOG_ENQUEUE_TIMEOUT_S * 0.9
+        assert w.stats.dropped == 2
+    finally:
+        monkeypatch.undo()
+        w.close()
+
+
+def test_level_counts_from_many_threads():
+    log = Logger(coalesce=False)
+    per_thread, threads = 2000, 8
+
+    def work() -> None:
+        for i in range(per_thread):
+            log.warn(f"w {i}")
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    log.close()
+    assert log.counts["WARN"] == per_thread * threads
+
+
+def test_log_files_are_unique_per_process():
+    log = Logger(coalesce=False)
+    log.close()
+    assert log.run_id.endswith(f"_{os.getpid()}")
+    for path in (log.paths.text, log.paths.jsonl, part_path(log.paths.jsonl, 2)):
+        m = LOG_NAME_RE.match(path.name)
+        assert m and m.group("run") == log.run_id
+        assert m.group("pid") == str(os.getpid())
+    # Names written before the pid was added still belong to a run
+    assert LOG_NAME_RE.match("maintenance_20250101_030000.p2.jsonl.gz")
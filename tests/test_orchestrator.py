@@ -0,0 +1,71 @@
+"""orchestrate(): cancel while hosts are running and queued."""
+import queue
+import threading
+import time
+
+from orchestrator import CANCEL_WAIT_SLICE_S, PROTOCOL, orchestrate
+
+HANG_BOUND_S = 30.0
+
+
+class _SlowAgent:
+    """Channel of an agent that runs until it is cancelled."""
+
+    def __init__(self, opened: list) -> None:
+        self._inbox: queue.Queue = queue.Queue()
+        self._inbox.put({"type": "hello", "protocol": PROTOCOL})
+        opened.append(self)
+
+    def send(self, msg: dict) -> None:
+        if msg.get("type") == "cancel":
+            self._inbox.put({"type": "result", "exit_code": 130,
+                             "cancelled": True})
+
+    def recv(self, timeout: float):
+        try:
+            return self._inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        pass
+
+
+class _Transport:
+    def __init__(self) -> None:
+        self.opened: list = []
+
+    def open(self, host: str) -> _SlowAgent:
+        return _SlowAgent(self.opened)
+
+
+def test_cancel_stops_running_and_queued_hosts():
+    transport = _Transport()
+    cancel = threading.Event()
+    hosts = [f"h{i}" for i in range(6)]
+    done: list = []
+    box: dict = {}
+
+    def run() -> None:
+        box["report"] = orchestrate(
+            hosts, {"tasks": ["temp"], "dry_run": True}, transport=transport,
+            max_parallel=2, cancel_event=cancel, on_host_done=done.append)
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    deadline = time.monotonic() + HANG_BOUND_S
+    while len(transport.opened) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    t0 = time.perf_counter()
+    cancel.set()
+    worker.join(HANG_BOUND_S)
+    assert not worker.is_alive(), "orchestrate did not return after cancel"
+    assert time.perf_counter() - t0 < CANCEL_WAIT_SLICE_S + 1.0
+
+    report = box["report"]
+    assert [h.host for h in report.hosts] == hosts
+    assert all(h.status == "cancelled" for h in report.hosts)
+    # Two agents ran; the queued hosts never opened a channel
+    assert len(transport.opened) == 2
+    assert sum(h.error == "not started" for h in report.hosts) == 4
+    assert len(done) == len(hosts)
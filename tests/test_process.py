@@ -0,0 +1,96 @@
+"""run_command against a local Python child that floods both pipes."""
+import sys
+import threading
+import time
+
+from config import CANCEL_DRAIN_S
+from process import run_command
+
+# stderr is flooded while stdout stays idle, then both are written
+# interleaved. A pump that blocks on one pipe deadlocks once the other
+# pipe's buffer (a few KiB to 64 KiB) is full.
+_FLOOD = r"""
+import sys
+n = int(sys.argv[1])
+for i in range(n):
+    sys.stderr.write(f"err {i} {'x' * 60}\n")
+sys.stderr.flush()
+for i in range(n):
+    sys.stdout.write(f"out {i}\n")
+    sys.stderr.write(f"err {n + i} {'x' * 60}\n")
+"""
+
+LINES = 50_000
+HANG_BOUND_S = 60.0
+
+
+def test_flooded_pipes_do_not_hang(log, record_property):
+    seen: dict[str, list[str]] = {"stdout": [], "stderr": []}
+    box: dict = {}
+
+    def run() -> None:
+        box["res"] = run_command(
+            [sys.executable, "-c", _FLOOD, str(LINES)], logger=log,
+            cancel_event=threading.Event(), allow_terminate=True,
+            consumers=[lambda stream, line: seen[stream].append(line)])
+
+    t0 = time.perf_counter()
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    worker.join(HANG_BOUND_S)
+    elapsed = time.perf_counter() - t0
+    assert not worker.is_alive(), f"run_command hung for {HANG_BOUND_S}s"
+
+    res = box["res"]
+    assert res.returncode == 0
+    assert seen["stdout"] == [f"out {i}" for i in range(LINES)]
+    assert seen["stderr"] == [f"err {i} {'x' * 60}" for i in range(2 * LINES)]
+    assert (res.stdout_lines, res.stderr_lines) == (LINES, 2 * LINES)
+    # Everything is logged: stdout as INFO, stderr as WARN, in order
+    assert log.messages("WARN")[:3] == seen["stderr"][:3]
+
+    rate = 3 * LINES / elapsed
+    record_property("lines_per_s", round(rate))
+    print(f"\n{3 * LINES} lines in {elapsed:.2f}s ({rate:,.0f} lines/s)")
+
+
+def _lines(log, script: str) -> tuple[list[str], object]:
+    seen: list[str] = []
+    res = run_command(
+        [sys.executable, "-c", script], logger=log,
+        cancel_event=threading.Event(), allow_terminate=True,
+        consumers=[lambda stream, line: seen.append(line)])
+    return seen, res
+
+
+def test_text_after_progress_frames_keeps_last_frame(log):
+    script = ("import sys; w = sys.stdout.write; "
+              "w('Scanning 10%\\r'); w('Scanning 50%\\r'); w('Done.\\n')")
+    seen, _ = _lines(log, script)
+    assert seen == ["Scanning 50%", "Done."]
+
+
+def test_progress_bar_ended_by_line_break_is_one_line(log):
+    script = ("import sys; w = sys.stdout.write\n"
+              "for i in range(0, 101, 10): w(f'\\r[bar] {i}.0%')\n"
+              "w('\\r\\n'); w('The operation completed.\\n')")
+    seen, res = _lines(log, script)
+    assert seen == ["[bar] 100.0%", "The operation completed."]
+    assert res.stdout_lines == 2
+
+
+# Exits at once, leaving a grandchild that holds both output pipes
+_ORPHAN = r"""
+import subprocess, sys
+subprocess.Popen([sys.executable, "-c", "import time; time.sleep(8)"])
+print("parent done", flush=True)
+"""
+
+
+def test_grandchild_holding_pipes_does_not_block_return(log):
+    t0 = time.perf_counter()
+    seen, res = _lines(log, _ORPHAN)
+    elapsed = time.perf_counter() - t0
+    assert res.returncode == 0
+    assert seen == ["parent done"]
+    assert elapsed < CANCEL_DRAIN_S + 2.0, elapsed
@@ -0,0 +1,78 @@
+"""Pooled PowerShell hosts, driven through the Python stand-in host."""
+import threading
+import time
+
+import pytest
+
+from aio import CancelEvent
+from process import CANCEL_POLL_S
+from pshost import PowerShellHost, PowerShellPool, python_standin_argv
+
+# Cancel kills the host outright; the rest is scheduling
+CANCEL_BOUND_S = CANCEL_POLL_S + 1.0
+
+
+@pytest.fixture
+def host():
+    h = PowerShellHost(python_standin_argv)
+    yield h
+    h.close()
+
+
+def _run(host, script: str, log, cancel=None, **kw):
+    return host.run(script, logger=log,
+                    cancel_event=cancel or threading.Event(),
+                    allow_terminate=True, **kw)
+
+
+def test_request_output_and_exit_code(host, log):
+    res = _run(host, "import sys\nprint('hello')\nprint('careful', "
+                     "file=sys.stderr)", log)
+    assert res.returncode == 0
+    assert (res.stdout, res.stderr) == ("hello", "careful")
+    assert "hello" in log.messages("INFO")
+    assert "careful" in log.messages("WARN")
+
+    # Same process for the next command
+    pid = host._p.pid
+    assert _run(host, "import sys\nsys.exit(3)", log).returncode == 3
+    assert host._p.pid == pid
+
+
+def test_error_is_reported_and_host_survives(host, log):
+    res = _run(host, "raise RuntimeError('boom')", log)
+    assert res.returncode == 1
+    assert "RuntimeError: boom" in res.stderr
+    assert host.alive
+    assert _run(host, "print('still here')", log).stdout == "still here"
+
+
+# CancelEvent wakes the host's reader; a plain Event is polled
+@pytest.mark.parametrize("event", [CancelEvent, threading.Event])
+def test_cancel_stops_the_command_and_host_restarts(host, log, event):
+    cancel = event()
+
+    def on_line(stream: str, line: str) -> None:
+        if line == "started":
+            cancel.set()
+
+    t0 = time.perf_counter()
+    res = _run(host, "import time\nprint('started', flush=True)\n"
+                     "time.sleep(60)", log, cancel, consumers=[on_line])
+    assert time.perf_counter() - t0 < CANCEL_BOUND_S
+    assert res.returncode == 1
+    assert not host.alive
+    assert any("Cancel requested" in m for m in log.messages("WARN"))
+
+    # The next command gets a fresh host
+    assert _run(host, "print('again')", log).stdout == "again"
+
+
+def test_pool_runs_on_standin_hosts(log):
+    pool = PowerShellPool(size=2, argv_factory=python_standin_argv)
+    try:
+        res = pool.run("print(6 * 7)", logger=log,
+                       cancel_event=threading.Event(), allow_terminate=True)
+        assert (res.returncode, res.stdout) == (0, "42")
+    finally:
+        pool.close()
@@ -0,0 +1,64 @@
+"""TEMP cleanup: root resolution, per-volume deletion and the dry-run scan."""
+import os
+import threading
+
+import pytest
+
+from runner import Context
+from tasks.temp_cleanup import clear_temp, resolve_roots
+
+
+def _fill(root, n: int) -> None:
+    (root / "sub").mkdir(parents=True)
+    for i in range(n):
+        (root / f"f{i}.tmp").write_bytes(b"x" * 10)
+        (root / "sub" / f"g{i}.tmp").write_bytes(b"y" * 10)
+
+
+def _ctx(log, dry_run: bool, temp_roots=None) -> Context:
+    return Context(logger=log, cancel_event=threading.Event(),
+                   dry_run=dry_run, temp_roots=temp_roots)
+
+
+@pytest.fixture
+def two_roots(tmp_path, monkeypatch) -> list:
+    a, b = tmp_path / "temp_a", tmp_path / "cache_b"
+    _fill(a, 3)
+    _fill(b, 4)
+    monkeypatch.setenv("MT_TEST_TEMP", str(a))
+    # A variable, a wildcard, a duplicate and a folder inside a root
+    specs = ["$MT_TEST_TEMP", str(tmp_path / "cache_*"), str(a),
+             str(b / "sub"), str(tmp_path / "missing")]
+    return resolve_roots(specs)
+
+
+def test_resolve_roots_drops_duplicates_and_nested(tmp_path, two_roots):
+    assert two_roots == [os.path.realpath(tmp_path / "temp_a"),
+                         os.path.realpath(tmp_path / "cache_b")]
+
+
+def test_deletes_from_both_roots(log, two_roots):
+    # Each root on its own "volume": cleaned in parallel
+    clear_temp(_ctx(log, dry_run=False), two_roots, volume_of=lambda r: r)
+    for root in two_roots:
+        assert os.path.isdir(root), "roots themselves are kept"
+        assert os.listdir(root) == []
+    assert "Summary → Deleted: 14 files, 2 folders (140 B), Skipped: 0, " \
+           "Errors: 0" in log.messages("INFO")
+    assert not log.messages("ERROR")
+
+
+def test_dry_run_only_scans(log, two_roots):
+    clear_temp(_ctx(log, dry_run=True), two_roots, volume_of=lambda r: r)
+    assert sum(len(files) for root in two_roots
+               for _, _, files in os.walk(root)) == 14
+    assert log.messages("EVENT").count("temp_dry_run") == 2
+    summary = [m for m in log.messages("INFO") if m.startswith("Summary")]
+    assert summary == ["Summary (dry-run) → Would free: 140 B in 14 files "
+                       "(9 entries), Skipped: 0, Unreadable: 0"]
+
+
+def test_default_roots_need_a_task_run(log):
+    # Outside run_tasks the system-wide TEMP_CLEANUP_ROOTS are not used
+    with pytest.raises(ValueError):
+        clear_temp(_ctx(log, dry_run=True))
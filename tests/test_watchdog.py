@@ -0,0 +1,49 @@
+"""Task watchdogs (TaskLimits): hung commands stopped, unsafe ones detached."""
+import threading
+import time
+
+from conftest import sleeper_argv
+from process import run_command
+from runner import Context, Task, run_tasks
+
+LIMIT_S = 0.5
+# Stop / detach, interpreter start-up and the runner's own bookkeeping
+SLACK_S = 3.0
+
+
+def _run(log, allow_terminate: bool, seconds: float, **limits):
+    box: dict = {}
+
+    def fn(ctx) -> int:
+        box["res"] = run_command(
+            sleeper_argv("polite", seconds), logger=ctx.logger,
+            cancel_event=ctx.cancel_event, allow_terminate=allow_terminate)
+        return box["res"].returncode
+
+    ctx = Context(logger=log, cancel_event=threading.Event(), dry_run=True)
+    t0 = time.perf_counter()
+    [r] = run_tasks(ctx, [Task("hang", fn, allow_terminate=allow_terminate,
+                                **limits)], lambda *a: None)
+    return r, box["res"], time.perf_counter() - t0
+
+
+def test_hung_child_is_stopped(log):
+    # Silent after "started" for far longer than the idle limit
+    r, res, elapsed = _run(log, True, 60, idle_timeout_s=LIMIT_S)
+    assert r.status == "timeout"
+    assert r.reason == "watchdog: idle"
+    assert (res.timed_out, res.detached) == ("idle", False)
+    assert res.returncode != 0
+    assert "finished" not in log.messages("INFO")
+    assert any("stopping it" in m for m in log.messages("ERROR"))
+    assert elapsed < LIMIT_S + SLACK_S, elapsed
+
+
+def test_long_child_not_safe_to_stop_is_detached(log):
+    r, res, elapsed = _run(log, False, 10, timeout_s=LIMIT_S)
+    assert r.status == "timeout"
+    assert r.reason == "watchdog: timeout"
+    assert (res.timed_out, res.detached) == ("timeout", True)
+    assert any("detaching it" in m for m in log.messages("ERROR"))
+    # The runner moved on without waiting for the child to finish
+    assert elapsed < LIMIT_S + SLACK_S, elapsed
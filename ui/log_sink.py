@@ -0,0 +1,70 @@
+from __future__ import annotations
+from collections import deque
+import threading
+
+from config import UI_LOG_FLUSH_MS, UI_LOG_MAX_LINES
+
+
+class BufferedLogSink:
+    """
+    Logger UI sink that can be called from any thread.
+    Lines are buffered and drained on the Tk thread every `interval_ms`
+    with a single insert; the textbox keeps at most `max_lines` lines.
+    """
+
+    def __init__(
+        self,
+        root,
+        textbox,
+        *,
+        interval_ms: int = UI_LOG_FLUSH_MS,
+        max_lines: int = UI_LOG_MAX_LINES,
+    ) -> None:
+        self._root = root
+        self._textbox = textbox
+        self._interval_ms = interval_ms
+        self._max_lines = max_lines
+        # Anything beyond max_lines would be trimmed on insert anyway
+        self._pending: deque[str] = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._job = None
+
+    def __call__(self, msg: str) -> None:
+        with self._lock:
+            self._pending.append(msg)
+
+    def start(self) -> None:
+        if self._job is None:
+            self._job = self._root.after(self._interval_ms, self._drain)
+
+    def stop(self) -> None:
+        if self._job is not None:
+            self._root.after_cancel(self._job)
+            self._job = None
+
+    def _drain(self) -> None:
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+
+        if lines:
+            try:
+                self._insert(lines)
+            except Exception:
+                pass
+
+        self._job = self._root.after(self._interval_ms, self._drain)
+
+    def _insert(self, lines: list[str]) -> None:
+        box = self._textbox
+        box.configure(state="normal")
+        box.insert("end", "\n".join(lines) + "\n")
+
+        # "end-1c" sits on the empty line after the trailing newline
+        count = int(box.index("end-1c").split(".")[0]) - 1
+        excess = count - self._max_lines
+        if excess > 0:
+            box.delete("1.0", f"{excess + 1}.0")
+
+        box.see("end")
+        box.configure(state="disabled")
@@ -1,20 +1,17 @@
 from __future__ import annotations
 
-import threading
+import asyncio
+from concurrent.futures import Future
 import re
+from typing import Optional
 import customtkinter as ctk
 
-from logger import Logger
-from runner import Context, Task, run_tasks
-from scheduler import install_daily, remove as remove_schedule
+import aio
 
-from tasks.temp_cleanup import clear_temp
-from tasks.recycle_bin import empty_recycle_bin
-from tasks.disk_cleanup import run_disk_cleanup
-from tasks.storage_sense import run_storage_sense
-from tasks.sfc import run_sfc
-from tasks.dism import run_dism
-from tasks.windows_update import run_windows_update
+from logger import Logger
+from runner import Context, Task, format_eta, run_tasks_async
+from tasks.registry import TASKS, build_tasks
+from ui.log_sink import BufferedLogSink
 
 HHMM_RE = re.compile(r"^([01]?\d|2[0-3]):[0-5]\d$")
 
@@ -26,32 +23,30 @@ class MainWindow(ctk.CTk):
         self.title("System Maintenance")
         self.geometry("920x720")
 
-        self.cancel_event = threading.Event()
-        self.worker: threading.Thread | None = None
+        self.cancel_event = aio.CancelEvent()
+        self.job: Future | None = None  # current run on the aio loop
 
         self.logger = Logger()
-        self.logger.attach_ui_sink(
-            lambda msg: self.after(0, lambda: self._log_to_ui(msg))
-        )
 
         # --------------------------------------------------
         # STATE
         # --------------------------------------------------
 
         self.dry_run = ctk.BooleanVar(value=True)
+        self.force = ctk.BooleanVar(value=False)
 
-        self.do_temp = ctk.BooleanVar(value=True)
-        self.do_recycle = ctk.BooleanVar(value=True)
-        self.do_cleanmgr = ctk.BooleanVar(value=True)
-        self.do_storagesense = ctk.BooleanVar(value=True)
-        self.do_sfc = ctk.BooleanVar(value=False)
-        self.do_dism = ctk.BooleanVar(value=False)
-        self.do_updates = ctk.BooleanVar(value=True)
+        # Task key -> checkbox variable, in registry order
+        self.selection = {key: ctk.BooleanVar(value=spec.default)
+                          for key, spec in TASKS.items()}
 
         self.schedule_time = ctk.StringVar(value="03:00")
 
         self._build_ui()
 
+        self.log_sink = BufferedLogSink(self, self.logbox)
+        self.logger.attach_ui_sink(self.log_sink)
+        self.log_sink.start()
+
     # --------------------------------------------------
     # UI
     # --------------------------------------------------
@@ -88,58 +83,12 @@ class MainWindow(ctk.CTk):
             left, text="Tasks", font=ctk.CTkFont(size=16, weight="bold")
         ).pack(anchor="w", padx=12, pady=(12, 8))
 
-        self.cb_temp = ctk.CTkCheckBox(
-            left,
-            text="Clear %TEMP% (safe, skips locked files)",
-            variable=self.do_temp,
-        )
-
-        self.cb_recycle = ctk.CTkCheckBox(
-            left,
-            text="Recycle Bin (current user)",
-            variable=self.do_recycle,
-        )
-
-        self.cb_cleanmgr = ctk.CTkCheckBox(
-            left,
-            text="Disk Cleanup (cleanmgr /sagerun:100)",
-            variable=self.do_cleanmgr,
-        )
-
-        self.cb_storagesense = ctk.CTkCheckBox(
-            left,
-            text="Storage Sense (Windows-managed)",
-            variable=self.do_storagesense,
-        )
-
-        self.cb_sfc = ctk.CTkCheckBox(
-            left,
-            text="SFC /scannow (slow)",
-            variable=self.do_sfc,
-        )
-
-        self.cb_dism = ctk.CTkCheckBox(
-            left,
-            text="DISM RestoreHealth (slow)",
-            variable=self.do_dism,
-        )
-
-        self.cb_updates = ctk.CTkCheckBox(
-            left,
-            text="Windows Update (PSWindowsUpdate)",
-            variable=self.do_updates,
-        )
-
-        for cb in (
-            self.cb_temp,
-            self.cb_recycle,
-            self.cb_cleanmgr,
-            self.cb_storagesense,
-            self.cb_sfc,
-            self.cb_dism,
-            self.cb_updates,
-        ):
+        self.task_boxes: dict[str, ctk.CTkCheckBox] = {}
+        for key, spec in TASKS.items():
+            cb = ctk.CTkCheckBox(left, text=spec.label,
+                                 variable=self.selection[key])
             cb.pack(anchor="w", padx=12, pady=6)
+            self.task_boxes[key] = cb
 
         self.cb_dry = ctk.CTkCheckBox(
             left,
@@ -148,6 +97,13 @@ class MainWindow(ctk.CTk):
         )
         self.cb_dry.pack(anchor="w", padx=12, pady=(12, 6))
 
+        self.cb_force = ctk.CTkCheckBox(
+            left,
+            text="Force full run (ignore 'recently succeeded')",
+            variable=self.force,
+        )
+        self.cb_force.pack(anchor="w", padx=12, pady=6)
+
         # ---------------- Run ----------------
 
         ctk.CTkLabel(
@@ -219,23 +175,12 @@ class MainWindow(ctk.CTk):
     # Helpers
     # --------------------------------------------------
 
-    def _log_to_ui(self, msg: str):
-        self.logbox.configure(state="normal")
-        self.logbox.insert("end", msg + "\n")
-        self.logbox.see("end")
-        self.logbox.configure(state="disabled")
-
     def _set_controls_enabled(self, enabled: bool):
         state = "normal" if enabled else "disabled"
         for w in (
-            self.cb_temp,
-            self.cb_recycle,
-            self.cb_cleanmgr,
-            self.cb_storagesense,
-            self.cb_sfc,
-            self.cb_dism,
-            self.cb_updates,
+            *self.task_boxes.values(),
             self.cb_dry,
+            self.cb_force,
             self.run_button,
             self.btn_sched_install,
             self.btn_sched_remove,
@@ -244,7 +189,10 @@ class MainWindow(ctk.CTk):
             w.configure(state=state)
         self.cancel_button.configure(state="disabled" if enabled else "normal")
 
-    def _progress_cb(self, value: float, status_text: str):
+    def _progress_cb(self, value: float, status_text: str,
+                     eta: Optional[float] = None):
+        if eta and value < 1.0:
+            status_text += f" · {value:.0%} · ETA {format_eta(eta)}"
         self.after(0, lambda: self.progress.set(value))
         self.after(0, lambda: self.status.configure(text=status_text))
 
@@ -252,53 +200,19 @@ class MainWindow(ctk.CTk):
     # Task wiring
     # --------------------------------------------------
 
+    def selected_task_keys(self) -> list[str]:
+        """Checked task keys (tasks.registry), as the headless CLI takes them."""
+        return [key for key, var in self.selection.items() if var.get()]
+
     def build_tasks(self) -> list[Task]:
-        tasks: list[Task] = []
-
-        if self.do_temp.get():
-            tasks.append(
-                Task("TEMP cleanup", clear_temp, allow_terminate=False))
-
-        if self.do_recycle.get():
-            tasks.append(
-                Task("Recycle Bin", empty_recycle_bin, allow_terminate=False)
-            )
-
-        if self.do_cleanmgr.get():
-            tasks.append(
-                Task("Disk Cleanup", run_disk_cleanup, allow_terminate=True))
-
-        if self.do_storagesense.get():
-            tasks.append(
-                Task("Storage Sense", run_storage_sense, allow_terminate=True)
-            )
-
-        if self.do_sfc.get():
-            tasks.append(Task("SFC scan", run_sfc,
-                         allow_terminate=False, slow=True))
-
-        if self.do_dism.get():
-            tasks.append(Task("DISM repair", run_dism,
-                         allow_terminate=False, slow=True))
-
-        if self.do_updates.get():
-            tasks.append(
-                Task(
-                    "Windows Update",
-                    run_windows_update,
-                    allow_terminate=False,
-                    slow=True,
-                )
-            )
-
-        return tasks
+        return build_tasks(self.selected_task_keys())
 
     # --------------------------------------------------
     # Execution
     # --------------------------------------------------
 
     def run_async(self):
-        if self.worker and self.worker.is_alive():
+        if self.job and not self.job.done():
             return
 
         self.cancel_event.clear()
@@ -310,19 +224,30 @@ class MainWindow(ctk.CTk):
             logger=self.logger,
             cancel_event=self.cancel_event,
             dry_run=self.dry_run.get(),
+            force=self.force.get(),
         )
 
         tasks = self.build_tasks()
 
-        def worker():
+        def finish() -> None:
+            from history import sync_quietly
+
+            self.logger.flush(timeout=5)
+            sync_quietly()
+
+        async def job():
+            # The run shares the background event loop; Tk keeps its own
+            # main loop and is only called back through `after`
             try:
-                run_tasks(ctx, tasks, self._progress_cb)
+                await run_tasks_async(ctx, tasks, self._progress_cb)
+                await asyncio.get_running_loop().run_in_executor(None, finish)
+            except Exception as e:
+                self.logger.error(f"Run failed: {e}")
             finally:
                 self.after(0, lambda: self._set_controls_enabled(True))
                 self.after(0, lambda: self.status.configure(text="Ready"))
 
-        self.worker = threading.Thread(target=worker, daemon=True)
-        self.worker.start()
+        self.job = aio.submit(job)
 
     def cancel(self):
         self.cancel_event.set()
@@ -336,6 +261,8 @@ class MainWindow(ctk.CTk):
     # --------------------------------------------------
 
     def install_schedule(self):
+        from scheduler import install_daily
+
         hhmm = self.schedule_time.get().strip()
         if not HHMM_RE.match(hhmm):
             self.logger.error("Invalid time. Use HH:MM (e.g. 03:00).")
@@ -345,12 +272,14 @@ class MainWindow(ctk.CTk):
             cancel_event=self.cancel_event,
             dry_run=self.dry_run.get(),
         )
-        install_daily(ctx, hhmm)
+        install_daily(ctx, hhmm, self.selected_task_keys())
 
     def remove_schedule(self):
+        import scheduler
+
         ctx = Context(
             logger=self.logger,
             cancel_event=self.cancel_event,
             dry_run=self.dry_run.get(),
         )
-        remove_schedule(ctx)
+        scheduler.remove(ctx)